@@ -3,25 +3,36 @@ import os
 import subprocess
 from datetime import datetime
 import time
-from picamera2 import Picamera2
-from scripts.log.logging import setup_logger, log_message, setup_logging_directory, log_colored_capture
+from scripts.log.logging import setup_logger, log_message, setup_logging_directory, log_colored_capture, logging_options, setup_console_summary
 from scripts.image.calculate_iso_and_shutter import calculate_iso_and_shutter
-from scripts.image.add_image_overlay import overlay_image_with_text
+from scripts.image.add_image_overlay import overlay_image_with_text, overlay_fields, load_light_level
+from scripts.image.overlay_sidecar import append_overlay_record
 from scripts.config.config_loader import load_config, load_values_from_file
+from scripts.config.cameras import camera_args, camera_configs, camera_index
 from scripts.image.configure_camera import configure_camera  # Import the configure_camera function
-from scripts.image.set_hdr_status import get_current_hdr_state  # Import function to get HDR state
+from scripts.image.set_hdr_status import get_hdr_controller  # Import the in-process HDR controller
 from scripts.database.database_store import insert_evaluation  # Correct function name to match your database_store.py
-METADATA_FILE = os.path.join(os.path.dirname(__file__), 'data/capture_metadata.json')
+from scripts.image.settle_detector import SettleDetector, capture_settled_request, SETTLE_TIMEOUT
+from scripts.image.exposure_controller import get_exposure_controller
+from scripts.image.frame_names import build_frame_path
+from scripts.image.duplicate_detector import get_duplicate_detector, fingerprint, DUPLICATE_TAG
+from scripts.storage.write_path import get_write_path, readable_path, CAPTURE_METADATA_PATH, EVALUATION_METADATA_PATH, LAST_MEASUREMENT_PATH
+from scripts.storage.atomic_write import atomic_symlink
+from scripts.storage.capture_ring import get_capture_ring
+METADATA_FILE = CAPTURE_METADATA_PATH
 
 
-def load_lux_value():
+def load_lux_value(config=None):
     """
     Loads the Lux value from the evaluation_measure.json file.
 
+    Parameters:
+        config (dict, optional): The configuration dictionary, to find the live copy in the staging folder.
+
     Returns:
         float: The Lux value if present, otherwise None.
     """
-    metadata_path = os.path.join(os.path.dirname(__file__), 'data/evaluation_measure.json')
+    metadata_path = readable_path(config, EVALUATION_METADATA_PATH)
     if os.path.exists(metadata_path):
         try:
             with open(metadata_path, 'r') as f:
@@ -34,52 +45,132 @@ def load_lux_value():
         print(f"evaluation_measure.json not found at {metadata_path}")
         return None
 
-def save_metadata(metadata):
+def save_metadata(metadata, config=None):
     """
     Saves the captured metadata to a JSON file.
 
+    The file is written through the write path, so it only reaches the SD card in the periodic state flush.
+
     Parameters:
         metadata (dict): The metadata dictionary to save.
+        config (dict, optional): The configuration dictionary.
     """
     try:
-        with open(METADATA_FILE, 'w') as f:
-            json.dump(metadata, f, indent=4)
+        get_write_path(config or {}).write_state(METADATA_FILE, metadata)
         # print(f"Metadata saved to {METADATA_FILE}")
     except Exception as e:
         print(f"Error saving metadata: {e}")
 
-def capture_image(config, iso, shutter_speed, daylight, logger=None):
+def settle_timeout(config, daylight, shutter_speed):
+    """
+    Returns how long capture may wait for AE/AWB to converge.
+
+    At night a single frame lasts as long as the exposure, so the timeout has to cover at least two of them.
+
+    Parameters:
+        config (dict): The configuration dictionary.
+        daylight (bool): Whether daylight (auto exposure) settings are used.
+        shutter_speed (int or str): The shutter speed in microseconds, or "auto".
+
+    Returns:
+        float: The timeout in seconds.
+    """
+    timeout = config['camera_settings'].get('settle_timeout', SETTLE_TIMEOUT)
+    if not daylight and shutter_speed != "auto":
+        timeout = max(timeout, 2 * int(shutter_speed) / 1000000)
+    return timeout
+
+def capture_image(config, iso, shutter_speed, daylight, logger=None, metered=True, tag=None, light_level=None, timings=None):
+    """
+    Captures and stores a still with the given exposure settings.
+
+    Parameters:
+        config (dict): The configuration dictionary.
+        iso (int or str): Analogue gain, or "auto".
+        shutter_speed (int or str): Exposure time in microseconds, or "auto".
+        daylight (bool): Whether daylight (auto exposure) settings are used.
+        logger (logging.Logger, optional): Logger for status messages.
+        metered (bool): Whether a metering capture created a database row for this cycle to update.
+        tag (str, optional): Tag added to the file name, e.g. 'event' for scene-change captures.
+        light_level (float, optional): Light level the exposure was chosen for, for the capture ring.
+        timings (dict, optional): Earlier stage durations of the cycle (cycle_start, metering_time), for the capture ring.
+
+    Returns:
+        dict: The still's metadata, or None if the capture failed.
+    """
+    # Imported here rather than at the top: they pull in libcamera, numpy and PIL, which only a capture needs
+    from picamera2 import Picamera2
+    from scripts.image.night_stack import stack_plan, capture_stack
+    from scripts.image.raw_capture import raw_active, save_raw, get_raw_developer
+
+    picam2 = None
+    metadata = None
+    file_name = None
+    settle = None
+    capture_start = time.time()
     try:
-        picam2 = Picamera2()
+        picam2 = Picamera2(camera_index(config))
         
         picam2.options["quality"] = config['camera_settings']['image_quality']
         picam2.options["compress_level"] = config['camera_settings']['compress_level']
 
-        camera_config = configure_camera(picam2, config, daylight, iso, shutter_speed, logger)
+        # Raw captures only store the sensor data; a background worker develops the frame
+        raw = raw_active(config, daylight, tag)
+
+        # At night a single long exposure can be replaced by a stack of shorter ones at a higher gain
+        stack = None if raw else stack_plan(config, daylight, iso, shutter_speed)
+        exposure_iso, exposure_shutter = (stack['gain'], stack['exposure']) if stack else (iso, shutter_speed)
+        camera_config = configure_camera(picam2, config, daylight, exposure_iso, exposure_shutter, logger, raw=raw)
         picam2.configure(camera_config)  # type: ignore
         
-        evlux = load_lux_value()
+        evlux = load_lux_value(config)
+        writes = get_write_path(config)
+        dedupe = get_duplicate_detector(config) if config.get('duplicates', {}).get('enabled', False) else None
 
         # Start the camera and capture the image
-        time.sleep(2)  # Allow camera to adjust
+        get_hdr_controller(config).wait_until_settled()  # Only waits if HDR was just toggled
         picam2.start()
 
         now = datetime.now()
-        dir_name = os.path.join(config['image_output']['root_folder'], now.strftime(config['image_output']['folder_structure']))
-        os.makedirs(dir_name, exist_ok=True)
-        file_name = os.path.join(dir_name, f"{config['image_output']['filename_prefix']}{now.strftime('%Y_%m_%d_%H_%M_%S')}.{config['image_output']['image_extension']}")
+        file_name = build_frame_path(config, now, tag)
+        os.makedirs(os.path.dirname(file_name), exist_ok=True)
 
-        # Capture request and metadata
-        request = picam2.capture_request()
+        # Capture request and metadata once AE/AWB has converged (or the exposure is manual and applied)
+        detector = SettleDetector(require_ae_lock=daylight, expected_exposure=None if daylight else int(exposure_shutter))
+        request, settle = capture_settled_request(picam2, detector, timeout=settle_timeout(config, daylight, exposure_shutter), logger=logger)
         if request:
-            image = request.make_image("main")
             metadata = request.get_metadata()
+
+            # Compare a tiny fingerprint of the lores stream with the last stored frame
+            duplicate = False
+            frame_print = None
+            if dedupe is not None and tag is None:
+                lores_size = picam2.camera_configuration()['lores']['size']
+                frame_print = fingerprint(request.make_array("lores"), lores_size, dedupe.grid_size)
+                duplicate = dedupe.is_duplicate(frame_print, file_name, daylight)
+                if duplicate and dedupe.action == 'flag':
+                    file_name = build_frame_path(config, now, DUPLICATE_TAG)
+
+            # A duplicate stored as a reference is never converted or encoded, a raw capture only copied
+            raw_array = None
+            image = None
+            if not (duplicate and dedupe.action == 'reference'):
+                if raw:
+                    raw_array = request.make_array("raw")
+                else:
+                    image = request.make_image("main")
             request.release()
+
+            # The settled frame is the first exposure of the stack; the others follow back-to-back
+            if stack and image is not None:
+                image, frame_stack = capture_stack(picam2, image, stack)
+                log_message(logger, f"Stacked {frame_stack.frames} of {stack['frames']} exposures of {stack['exposure']} us at gain {stack['gain']} ({stack['mode']}, {frame_stack.rejected} samples rejected)",
+                            stack_frames=frame_stack.frames, stack_exposure=stack['exposure'], stack_gain=stack['gain'], stack_mode=stack['mode'], stack_rejected=frame_stack.rejected)
         else:
             raise ValueError("Failed to capture request, request is None")
 
         # Save the metadata
-        save_metadata(metadata)
+        save_metadata(metadata, config)
         
         metadataForPrint = {
             "Lux": round(metadata['Lux'], 1),
@@ -93,17 +184,38 @@ def capture_image(config, iso, shutter_speed, daylight, logger=None):
             "AfState": metadata['AfState'],
         }
         
-        # Save the image file
-        image.save(file_name)
+        # Stage the image file (published once the overlay is applied), or store a reference to
+        # the previous frame if nothing changed
+        staged_name = None
+        if raw_array is not None:
+            if dedupe is not None and frame_print is not None and not duplicate:
+                dedupe.stored(frame_print, file_name)
+        elif image is None:
+            os.symlink(dedupe.reference_path, file_name)
+            dedupe.skipped()
+            log_message(logger, f"Near-duplicate frame (difference {dedupe.difference:.2f}), stored as reference to {dedupe.reference_path}")
+        else:
+            staged_name = writes.stage(file_name)
+            writes.save_staged(image, staged_name)
+            if dedupe is not None and frame_print is not None:
+                if duplicate:
+                    dedupe.skipped()
+                    log_message(logger, f"Near-duplicate frame (difference {dedupe.difference:.2f}), flagged as {file_name}")
+                else:
+                    dedupe.stored(frame_print, file_name)
         picam2.stop()
 
-        # Get the HDR state
-        hdr_state = get_current_hdr_state()
+        # Get the HDR state (cached, no device access)
+        hdr_state = get_hdr_controller(config).get_state()
 
-        log_colored_capture(file_name, iso, shutter_speed, picam2.options['quality'], picam2.options['compress_level'], daylight, hdr_state, camera_config, metadataForPrint)
+        log_colored_capture(file_name, iso, shutter_speed, picam2.options['quality'], picam2.options['compress_level'], daylight, hdr_state, camera_config, metadataForPrint, logger)
         if config['database']['store_data'] == True:
-            insert_evaluation(lux=metadataForPrint['Lux'], exposure_time=metadataForPrint['ExposureTime'], update_latest=True)
-        # Apply overlay and text to the captured image
+            insert_evaluation(lux=metadataForPrint['Lux'], exposure_time=metadataForPrint['ExposureTime'], update_latest=metered,
+                              sensor_temperature=metadataForPrint['SensorTemperature'])
+        # Apply overlay and text to the captured image (a reference already points at an overlaid frame),
+        # or, in deferred mode, keep the frame clean and only record what the overlay shows
+        overlay_record = None
+        raw_overlay = None
         try:
             overlay_data = {
                 "ISO": iso,
@@ -114,68 +226,156 @@ def capture_image(config, iso, shutter_speed, daylight, logger=None):
                 "HDR": hdr_state,  # Include HDR state
                 "Config": camera_config['controls']
             }
-            overlay_image_with_text(file_name, output_image_path=file_name, quality=picam2.options['quality'], overlay_data=overlay_data, metadata=metadataForPrint, evlux=evlux)
+            if config.get('overlay', {}).get('mode', 'burn') == 'deferred':
+                overlay_record = overlay_fields(overlay_data, metadataForPrint, evlux, load_light_level(readable_path(config, LAST_MEASUREMENT_PATH)), now)
+                if image is not None:
+                    overlay_record["size"] = list(image.size)
+                elif raw_array is not None:
+                    overlay_record["size"] = list(config['camera_settings']['main_size'])
+            elif raw_array is not None:
+                # Burned in by the development worker
+                raw_overlay = overlay_fields(overlay_data, metadataForPrint, evlux, load_light_level(readable_path(config, LAST_MEASUREMENT_PATH)), now)
+            elif staged_name is not None:
+                overlay_image_with_text(staged_name, output_image_path=staged_name, quality=picam2.options['quality'], overlay_data=overlay_data, metadata=metadataForPrint, evlux=evlux,
+                                        last_measurement_path=readable_path(config, LAST_MEASUREMENT_PATH), timestamp=now)
+                writes.record('overlay', staged_name, os.path.getsize(staged_name))
         except Exception as e:
             print(f"Error applying overlay: {e}")
             if logger:
                 log_message(logger, f"Error applying overlay: {e}")
 
-        # Create or update symlink to the latest image
+        # Publish the finished frame in one step, so readers never see a partial file
+        if staged_name is not None:
+            writes.publish(staged_name, file_name)
+        if raw_array is not None:
+            job_path = save_raw(config, raw_array, picam2.camera_configuration()['raw'], file_name, metadata, daylight, raw_overlay)
+            get_raw_developer(config, logger).submit(job_path)
+            log_message(logger, f"Raw frame stored, developing {file_name} in the background")
+        if overlay_record is not None:
+            try:
+                writes.record('overlay', file_name, append_overlay_record(file_name, overlay_record))
+            except Exception as e:
+                print(f"Error writing overlay sidecar: {e}")
+                log_message(logger, f"Error writing overlay sidecar: {e}")
+
+        # Create or update symlink to the latest image (a raw frame's once it is developed)
         symlink_path = config['image_output']['status_file']
-        try:
-            if os.path.islink(symlink_path) or os.path.exists(symlink_path):
-                os.remove(symlink_path)
-            os.symlink(file_name, symlink_path)
+        if raw_array is None:
+            try:
+                atomic_symlink(file_name, symlink_path)
 
-            if logger:
-                log_message(logger, f"Symlink updated: {symlink_path} -> {file_name}")
-        except Exception as e:
-            print(f"Error updating symlink: {e}")
-            if logger:
-                log_message(logger, f"Error updating symlink: {e}")
+                if logger:
+                    log_message(logger, f"Symlink updated: {symlink_path} -> {file_name}")
+            except Exception as e:
+                print(f"Error updating symlink: {e}")
+                if logger:
+                    log_message(logger, f"Error updating symlink: {e}")
 
     except Exception as e:
         print(f"Error during image capture: {e}")
         if logger:
             log_message(logger, f"Error during image capture: {e}")
+    finally:
+        # Release the camera so the next cycle (or the preview) can open it again
+        if picam2 is not None:
+            picam2.close()
 
-if __name__ == "__main__":
-    try:
-        # Load the configuration
-        config_path = os.path.join(os.path.dirname(__file__), 'config.yaml')
-        config = load_config(config_path)
+    get_write_path(config).end_frame(logger)
 
-        # Setup logging if enabled
-        logger = None
-        if config.get('logging', {}).get('capture_image', False):
-            logs_dir = setup_logging_directory()
-            log_file = os.path.join(logs_dir, 'capture_image.log')
-            logger = setup_logger('capture_image', log_file)
+    # Publish the capture to the shared-memory ring for dashboards and other tools
+    ring = get_capture_ring(config)
+    if ring is not None and metadata:
+        timings = timings or {}
+        now = time.time()
+        ring.append(timestamp=now, light_level=light_level, iso=iso, shutter_speed=shutter_speed,
+                    lux=metadata.get('Lux'), exposure_time=metadata.get('ExposureTime'),
+                    analogue_gain=metadata.get('AnalogueGain'), digital_gain=metadata.get('DigitalGain'),
+                    sensor_temperature=metadata.get('SensorTemperature'), metering_time=timings.get('metering_time', 0.0),
+                    settle_time=settle.elapsed if settle else None, capture_time=now - capture_start,
+                    total_time=now - timings.get('cycle_start', capture_start), daylight=daylight, file_name=file_name)
+    return metadata
+
+def run_capture_cycle(config, logger=None, tag=None):
+    """
+    Runs one full capture cycle: evaluates the light, picks ISO and shutter speed and captures the image.
 
+    Called once per interval by run_timelapse.py in the same process, so state such as the cached
+    HDR state survives from one frame to the next.
+
+    Parameters:
+        config (dict): The configuration dictionary.
+        logger (logging.Logger, optional): Logger for status messages.
+        tag (str, optional): Tag added to the file name, e.g. 'event' for scene-change captures.
+    """
+    timings = {"cycle_start": time.time(), "metering_time": 0.0}
+    try:
         # Check if debug mode is enabled in config.yaml
         debug_mode = config.get('debug', {}).get('enabled', False)
         debug_light_level = config.get('debug', {}).get('light_level', None)
 
+        controller = None
+        if config.get('exposure_control', {}).get('enabled', False):
+            controller = get_exposure_controller(config)
+
+        metered = False
         if debug_mode and debug_light_level is not None:
             light_level = debug_light_level
             iso, shutter_speed, _ = calculate_iso_and_shutter(light_level, config) # type: ignore
             log_message(logger, f"Debug mode enabled. Overriding light level to {light_level}")
         else:
-            # Run the light evaluation script
-            subprocess.run(['python3', 'scripts/image/capture_and_evaluate_light.py'], check=True)
-            # Load the evaluated ISO and shutter speed values
-            light_level, iso, shutter_speed = load_values_from_file()
+            prediction = controller.predict() if controller else None
+            if prediction is not None and prediction.confident:
+                # Reuse the previous frame's metadata and skip the metering capture
+                light_level = prediction.light_level
+                log_message(logger, f"Predicted light level {light_level:.1f} from previous frame, skipping metering capture.")
+            else:
+                if prediction is not None:
+                    log_message(logger, f"Running metering capture: {prediction.reason}")
+                # Run the light evaluation script
+                metering_start = time.time()
+                subprocess.run(['python3', 'scripts/image/capture_and_evaluate_light.py'] + camera_args(config), check=True)
+                timings["metering_time"] = time.time() - metering_start
+                metered = True
+                # Load the evaluated ISO and shutter speed values
+                light_level, iso, shutter_speed = load_values_from_file(readable_path(config, LAST_MEASUREMENT_PATH))
+                if controller:
+                    controller.record_metering(light_level, load_lux_value(config))
 
-        log_message(logger, f"Light level: {light_level}, ISO: {iso}, Shutter speed: {shutter_speed}")
+            if controller:
+                reset = prediction is not None and prediction.reason == "light changing fast"
+                light_level = controller.target_level(light_level, reset=reset)
+            if controller or not metered:
+                iso, shutter_speed, _ = calculate_iso_and_shutter(light_level, config)
+
+        log_message(logger, f"Light level: {light_level}, ISO: {iso}, Shutter speed: {shutter_speed}", light_level=light_level, iso=iso, shutter_speed=shutter_speed, metered=metered)
 
         # Determine if it's daylight
         daylight = iso == "auto" and shutter_speed == "auto"
 
         # Capture the image with the retrieved settings
-        capture_image(config, iso, shutter_speed, daylight, logger)
+        metadata = capture_image(config, iso, shutter_speed, daylight, logger, metered=metered, tag=tag, light_level=light_level, timings=timings)
+        if controller:
+            controller.record_capture(metadata)
 
     except Exception as e:
         print(f"Fatal error in main execution: {e}")
         if logger:
             log_message(logger, f"Fatal error in main execution: {e}")
+
+if __name__ == "__main__":
+    # Load the configuration
+    config_path = os.path.join(os.path.dirname(__file__), 'config.yaml')
+    config = load_config(config_path)
+
+    # Setup logging if enabled
+    logger = None
+    if config.get('logging', {}).get('capture_image', False):
+        logs_dir = setup_logging_directory()
+        log_file = os.path.join(logs_dir, 'capture_image.log')
+        logger = setup_logger('capture_image', log_file, **logging_options(config))
+    setup_console_summary(config.get('logging', {}).get('console_summary', False))
+
+    # One cycle per camera; run_timelapse.py staggers them when it drives several cameras
+    for camera in camera_configs(config):
+        run_capture_cycle(camera, logger)
  
\ No newline at end of file
@@ -1,37 +1,129 @@
+import argparse
+import csv
+import itertools
+import json
 import sqlite3
 import os
+import sys
+
+from scripts.database.database_store import iter_evaluations, iter_rollups, rebuild_rollups, ROLLUP_LEVELS
 
 # Path to your SQLite database
 DATABASE_PATH = os.path.join(os.path.dirname(__file__), 'database/lux_data.db')
 
-def echo_database():
+def _cell(value):
+    if value is None:
+        return "N/A"
+    if isinstance(value, float):
+        return f"{value:.1f}" if abs(value) < 1000 else f"{value:.0f}"
+    return str(value)
+
+def write_rows(rows, output_format='table', out=sys.stdout):
+    """
+    Writes query results as they come from the cursor, so memory use does not grow with history.
+
+    Parameters:
+        rows (iterator): Column names first, then the rows.
+        output_format (str): 'table', 'csv' or 'json'.
+        out (file): Where to write.
+
+    Returns:
+        int: Number of rows written.
     """
-    Prints the content of the database in a formatted table.
+    columns = next(rows)
+    count = 0
+    if output_format == 'csv':
+        writer = csv.writer(out)
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    elif output_format == 'json':
+        out.write("[")
+        for row in rows:
+            out.write(("," if count else "") + "\n  " + json.dumps(dict(zip(columns, row))))
+            count += 1
+        out.write("\n]\n")
+    else:
+        widths = [max(len(column) + 2, 12) for column in columns]
+        widths[columns.index('timestamp') if 'timestamp' in columns else 0] = 21
+        out.write("".join(f"{column:<{width}}" for column, width in zip(columns, widths)) + "\n")
+        out.write("-" * sum(widths) + "\n")
+        for row in rows:
+            out.write("".join(f"{_cell(value):<{width}}" for value, width in zip(row, widths)) + "\n")
+            count += 1
+    return count
+
+def echo_database(start=None, end=None, rollup=None, output_format='table', limit=None):
     """
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
+    Prints the evaluations (or a rollup of them) within a time range.
 
-    # Fetch all rows from the database
-    cursor.execute("SELECT * FROM image_evaluation")
-    rows = cursor.fetchall()
+    Parameters:
+        start (str, optional): First timestamp, e.g. '2024-06-01' or '2024-06-01 12:00'.
+        end (str, optional): Last timestamp; a date includes the whole day.
+        rollup (str, optional): 'minute', 'hour' or 'day' to print min/mean/max per period instead of rows.
+        output_format (str): 'table', 'csv' or 'json'.
+        limit (int, optional): Stop after this many rows.
+    """
+    if not os.path.exists(DATABASE_PATH):
+        print(f"No database found at {DATABASE_PATH}")
+        return
 
-    # Print table headers
-    print(f"{'ID':<5}{'Lux':<10}{'Evaluated Lux':<15}{'Exposure Time':<15}{'Evaluated Exposure Time':<25}{'Timestamp':<20}")
-    print("-" * 85)
+    if rollup:
+        rows = iter_rollups(rollup, start, end, database_path=DATABASE_PATH)
+    else:
+        rows = iter_evaluations(start, end, database_path=DATABASE_PATH)
+    if limit is not None:
+        rows = itertools.islice(rows, limit + 1)  # Plus the header
+    try:
+        write_rows(rows, output_format)
+    except sqlite3.OperationalError as e:
+        print(f"Query failed: {e} (run with --rebuild-rollups once after upgrading)")
 
-    # Print each row, replacing None with a placeholder
-    for row in rows:
-        lux = row[1] if row[1] is not None else "N/A"
-        evaluated_lux = row[2] if row[2] is not None else "N/A"
-        exposure_time = row[3] if row[3] is not None else "N/A"
-        evaluated_exposure_time = row[4] if row[4] is not None else "N/A"
-        timestamp = row[5] if row[5] is not None else "N/A"
 
-        print(f"{row[0]:<5}{lux:<10}{evaluated_lux:<15}{exposure_time:<15}{evaluated_exposure_time:<25}{timestamp:<20}")
+def echo_live_captures(count=10, follow=False):
+    """
+    Prints the most recent captures from the shared-memory capture ring, without touching the database.
+
+    Parameters:
+        count (int): Number of records to print.
+        follow (bool): Keep printing captures as they happen.
+    """
+    from scripts.storage.capture_ring import CaptureRingReader, format_record, RING_PATH
 
-    conn.close()
+    try:
+        reader = CaptureRingReader(RING_PATH)
+    except (OSError, ValueError) as e:
+        print(f"Capture ring not available: {e}")
+        return
+    for record in reader.latest(count):
+        print(format_record(record))
+    if follow:
+        try:
+            for record in reader.follow():
+                print(format_record(record))
+        except KeyboardInterrupt:
+            pass
+    reader.close()
 
 
 if __name__ == "__main__":
-    echo_database()
+    parser = argparse.ArgumentParser(description='Show the stored light evaluations.')
+    parser.add_argument('--from', dest='start', help="First timestamp, e.g. 2024-06-01 or '2024-06-01 12:00'.")
+    parser.add_argument('--to', dest='end', help='Last timestamp; a date includes the whole day.')
+    parser.add_argument('--rollup', choices=list(ROLLUP_LEVELS), help='Show min/mean/max per minute, hour or day.')
+    parser.add_argument('--format', dest='output_format', choices=['table', 'csv', 'json'], default='table', help='Output format.')
+    parser.add_argument('--limit', type=int, help='Maximum number of rows.')
+    parser.add_argument('--rebuild-rollups', action='store_true', help='Recompute the rollup tables from all stored evaluations.')
+    parser.add_argument('--live', action='store_true', help='Show the latest captures from the shared-memory ring instead.')
+    parser.add_argument('--follow', action='store_true', help='With --live, keep printing new captures.')
+    parser.add_argument('-n', '--count', type=int, default=10, help='With --live, number of captures to show.')
+    args = parser.parse_args()
 
+    if args.live:
+        echo_live_captures(args.count, args.follow)
+    elif args.rebuild_rollups:
+        rebuild_rollups(DATABASE_PATH)
+        print("Rollups rebuilt.")
+    else:
+        echo_database(args.start, args.end, args.rollup, args.output_format, args.limit)
@@ -1,8 +1,12 @@
 import os
-import subprocess
+import threading
 import time
+from datetime import datetime
 import yaml
-from scripts.log.logging import setup_logger, log_message, setup_logging_directory
+from scripts.log.logging import setup_logger, log_message, setup_logging_directory, logging_options, setup_console_summary
+from scripts.storage.retention import start_retention_worker
+from scripts.config.cameras import camera_configs
+from capture_image import run_capture_cycle
 
 def load_config(config_path):
     """
@@ -17,34 +21,246 @@ def load_config(config_path):
     with open(config_path, 'r') as file:
         return yaml.safe_load(file)
 
+def start_preview_server(config, logger=None):
+    """
+    Starts the MJPEG preview server if it is enabled in config.yaml.
+
+    Parameters:
+        config (dict): The configuration dictionary.
+        logger (logging.Logger, optional): Logger for status messages.
+
+    Returns:
+        PreviewServer: The running server, or None if the preview is disabled.
+    """
+    preview_settings = config.get('preview', {})
+    if not preview_settings.get('enabled', False):
+        return None
+
+    from scripts.preview.mjpeg_server import PreviewServer
+    still_renderer = None
+    if config.get('overlay', {}).get('mode', 'burn') == 'deferred':
+        # Frames are stored clean; /still.jpg renders the latest one with its overlay
+        from scripts.image.overlay_still import latest_frame, render_still
+        still_renderer = lambda width: render_still(config, latest_frame(config), width)
+    preview_server = PreviewServer(
+        port=preview_settings.get('port', 8000),
+        quality=preview_settings.get('quality', 70),
+        name=config['camera_settings'].get('name', "Camera"),
+        still_renderer=still_renderer,
+    )
+    preview_server.start()
+    log_message(logger, f"Preview server listening on port {preview_settings.get('port', 8000)}")
+    return preview_server
+
+def wait_for_next_capture(config, deadline, preview_server=None, scene_detector=None, capture_duration=0, logger=None):
+    """
+    Waits until the next capture is due, using the lores stream in the meantime if anything needs it.
+
+    The camera is opened between stills only while a preview client is connected or event mode is
+    watching for scene changes, and it is always released `stop_margin` seconds before the deadline
+    so the next scheduled still is never delayed. A detected scene change triggers an extra capture
+    tagged 'event', but only if it can finish before the scheduled one.
+
+    Parameters:
+        config (dict): The configuration dictionary.
+        deadline (float): time.time() value of the next scheduled capture.
+        preview_server (PreviewServer, optional): The running preview server.
+        scene_detector (SceneChangeDetector, optional): Detector for event mode.
+        capture_duration (float): How long the last capture cycle took, used to decide if an event capture fits.
+        logger (logging.Logger, optional): Logger for status messages.
+    """
+    if preview_server is not None or scene_detector is not None:
+        from scripts.image.lores_stream import stream_lores_frames
+        from scripts.image.frame_names import EVENT_TAG
+
+        release_at = deadline - config.get('preview', {}).get('stop_margin', 3)
+
+        def has_clients():
+            return preview_server is not None and preview_server.has_clients()
+
+        def on_frame(array, size, stride):
+            if has_clients():
+                preview_server.submit(array, size, stride)
+            if scene_detector is not None:
+                scene_detector.update(array, size, stride)
+
+        def keep_running():
+            if scene_detector is not None:
+                return not scene_detector.triggered
+            return has_clients()
+
+        while time.time() < release_at:
+            if scene_detector is None and not preview_server.wait_for_client(release_at - time.time()):
+                break
+
+            if scene_detector is not None:
+                scene_detector.reset()
+            max_fps = config.get('preview', {}).get('max_fps', 5) if has_clients() else config.get('event_mode', {}).get('fps', 2)
+            frames = stream_lores_frames(config, release_at, on_frame, keep_running, max_fps=max_fps, logger=logger)
+            log_message(logger, f"Lores stream delivered {frames} frames.")
+            if frames == 0 and keep_running():
+                # Nothing stopped the stream, so the camera could not be opened; wait for the scheduled still instead of retrying right away
+                break
+
+            if scene_detector is not None and scene_detector.triggered:
+                if release_at - time.time() > capture_duration:
+                    log_message(logger, f"Scene change detected (metric {scene_detector.metric:.1f}), capturing event frame.")
+                    run_capture_cycle(config, logger, tag=EVENT_TAG)
+                    scene_detector.record_capture()
+                else:
+                    log_message(logger, f"Scene change detected (metric {scene_detector.metric:.1f}), too close to the next still to capture.")
+                    scene_detector.reset()
+
+    time.sleep(max(0, deadline - time.time()))
+
+def prepare_for_phase(config, next_phase, logger=None):
+    """
+    Prepares the camera ahead of a sunrise/sunset phase change instead of on the first frame after it.
+
+    A fresh metering capture is requested so the day/night exposure mode flips in time, and the HDR
+    state the next phase needs is applied now (its cooldown keeps it from being undone right away).
+
+    Parameters:
+        config (dict): The configuration dictionary.
+        next_phase (str): The phase that is about to start ('night', 'transition' or 'day').
+        logger (logging.Logger, optional): Logger for status messages.
+    """
+    from scripts.image.exposure_controller import get_exposure_controller
+    from scripts.image.set_hdr_status import get_hdr_controller
+    from scripts.schedule.solar import DAY
+
+    log_message(logger, f"Preparing camera for upcoming phase: {next_phase}")
+    if config.get('exposure_control', {}).get('enabled', False):
+        get_exposure_controller(config).force_metering()
+    if config['camera_settings'].get('hdr', False):
+        try:
+            get_hdr_controller(config).set_state(next_phase == DAY, logger)
+        except Exception as e:
+            log_message(logger, f"Error pre-switching HDR: {e}")
+
+def run_cameras(cameras, logger=None):
+    """
+    Runs the timelapse for several cameras from one process.
+
+    The cameras take turns: a StaggeredSchedule spreads their captures over the interval and every
+    capture runs on its own, so they never compete for the CPU, the encoder or the disk at the same
+    moment. Each camera keeps its own interval, solar schedule and camera state; the retention
+    workers share one idle flag, so housekeeping waits for whichever camera is capturing.
+
+    Parameters:
+        cameras (list): Per-camera configuration dictionaries, see camera_configs().
+        logger (logging.Logger, optional): Logger for status messages.
+    """
+    from scripts.schedule.scheduler import StaggeredSchedule
+
+    if any(camera.get('preview', {}).get('enabled', False) or camera.get('event_mode', {}).get('enabled', False) for camera in cameras):
+        log_message(logger, "Preview and event mode need the camera between stills and are only run with a single camera.")
+
+    capture_idle = threading.Event()
+    capture_idle.set()
+    schedulers = []
+    for camera in cameras:
+        start_retention_worker(camera, capture_idle, logger)
+        scheduler = None
+        if camera.get('schedule', {}).get('enabled', False):
+            from scripts.schedule.scheduler import SolarScheduler
+            scheduler = SolarScheduler(camera)
+        schedulers.append(scheduler)
+    prepared_changes = [None] * len(cameras)
+    intervals = [camera['camera_settings']['interval'] for camera in cameras]
+    staggered = StaggeredSchedule(len(cameras), min(intervals), time.time())
+
+    while True:
+        position, due = staggered.next_camera()
+        time.sleep(max(0, due - time.time()))
+        camera = cameras[position]
+        start_time = time.time()
+        log_message(logger, "Starting a new capture cycle.", camera=camera['camera_id'])
+
+        capture_idle.clear()
+        try:
+            run_capture_cycle(camera, logger)
+        except Exception as e:
+            log_message(logger, f"Error during image capture: {e}", camera=camera['camera_id'])
+        finally:
+            capture_idle.set()
+
+        scheduler = schedulers[position]
+        if scheduler is not None:
+            intervals[position] = scheduler.interval_at(datetime.fromtimestamp(start_time).astimezone())
+            change, next_phase = scheduler.upcoming_phase(datetime.now().astimezone())
+            if change is not None and change != prepared_changes[position]:
+                prepare_for_phase(camera, next_phase, logger)
+                prepared_changes[position] = change
+
+        capture_duration = time.time() - start_time
+        next_capture = staggered.captured(position, intervals[position], time.time())
+        log_message(logger, f"Capture took {capture_duration:.2f} seconds. Next capture in {max(0, next_capture - time.time()):.2f} seconds.",
+                    camera=camera['camera_id'])
+
 if __name__ == "__main__":
     # Load the configuration
     config_path = os.path.join(os.path.dirname(__file__), 'config.yaml')
-    config = load_config(config_path)
+    cameras = camera_configs(load_config(config_path))
+    config = cameras[0]
 
     # Setup logging if enabled
     logger = None
     if config.get('logging', {}).get('capture_image', False):
         logs_dir = setup_logging_directory()
         log_file = os.path.join(logs_dir, 'timelapse.log')
-        logger = setup_logger('timelapse', log_file)
+        logger = setup_logger('timelapse', log_file, **logging_options(config))
+    setup_console_summary(config.get('logging', {}).get('console_summary', False))
+
+    if len(cameras) > 1:
+        run_cameras(cameras, logger)
 
     interval = config['camera_settings']['interval']
-    
+    preview_server = start_preview_server(config, logger)
+
+    # Background retention; it pauses whenever a capture is in progress
+    capture_idle = threading.Event()
+    capture_idle.set()
+    start_retention_worker(config, capture_idle, logger)
+
+    # Extra captures on fast scene changes, if configured
+    scene_detector = None
+    if config.get('event_mode', {}).get('enabled', False):
+        from scripts.image.scene_change import SceneChangeDetector
+        scene_detector = SceneChangeDetector(config)
+
+    # Day/night-aware intervals from the sun's position, if configured
+    scheduler = None
+    prepared_change = None
+    if config.get('schedule', {}).get('enabled', False):
+        from scripts.schedule.scheduler import SolarScheduler
+        scheduler = SolarScheduler(config)
+
     while True:
         # Start the timer to measure the time taken for capturing the image
         start_time = time.time()
         log_message(logger, f"Starting a new capture cycle.")
         
+        capture_idle.clear()
         try:
-            script_path = os.path.join(os.path.dirname(__file__), 'capture_image.py')
-            subprocess.run(['python3', script_path], check=True)
-        except subprocess.CalledProcessError as e:
+            # Capture in this process so cached camera state (e.g. HDR) is kept between frames
+            run_capture_cycle(config, logger)
+        except Exception as e:
             log_message(logger, f"Error during image capture: {e}")
+        finally:
+            capture_idle.set()
         
+        if scheduler is not None:
+            cycle_start = datetime.fromtimestamp(start_time).astimezone()
+            interval = scheduler.interval_at(cycle_start)
+            change, next_phase = scheduler.upcoming_phase(datetime.now().astimezone())
+            if change is not None and change != prepared_change:
+                prepare_for_phase(config, next_phase, logger)
+                prepared_change = change
+
         # Calculate the time taken to capture the image
         capture_duration = time.time() - start_time
         remaining_sleep = max(0, interval - capture_duration)  # Ensure no negative sleep times
 
         log_message(logger, f"Capture took {capture_duration:.2f} seconds. Sleeping for {remaining_sleep:.2f} seconds before next capture.")
-        time.sleep(remaining_sleep)
+        wait_for_next_capture(config, start_time + capture_duration + remaining_sleep, preview_server, scene_detector, capture_duration, logger)
@@ -0,0 +1,304 @@
+# scripts/benchmark/memory_budget.py
+
+import argparse
+import datetime
+import gc
+import importlib
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import yaml
+from PIL import Image
+
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), '../../config.yaml')
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..'))
+FRAME_SIZE = (3840, 2160)  # Used when there is no config.yaml to take camera_settings.main_size from
+RAW_SIZE = (4608, 2592)  # Full sensor readout of the Camera Module 3
+STACK_FRAMES = 8
+MB = 1024 * 1024
+
+# Peak RSS growth (MB) each stage may cause on top of its inputs, for a 4K frame: measured on the
+# current pipeline plus about a quarter of headroom. A stage that needs more has regressed.
+BUDGETS = {
+    "capture": 45,
+    "overlay": 85,
+    "metering": 50,
+    "proxy": 35,
+    "night_stack": 450,  # Running mean, variance and count of every sample (sigma_clip)
+    "raw_develop": 140,
+}
+
+# Seconds a stage may take for a 4K frame, for stages that run inside the capture cycle while the
+# camera is held: measured on a desktop plus headroom. The night stack combines STACK_FRAMES
+# sigma_clip exposures; a Pi takes several times longer, which capture_stack() caps at run time.
+TIME_BUDGETS = {
+    "night_stack": 5,
+}
+
+
+def load_config(config_path=CONFIG_PATH):
+    with open(config_path, 'r') as file:
+        return yaml.safe_load(file)
+
+
+def synthetic_frame(size, seed=0):
+    """
+    Returns a frame-sized uint8 RGB array: gradients plus noise, so JPEG encoding does real work.
+    """
+    width, height = size
+    rng = np.random.default_rng(seed)
+    frame = rng.integers(0, 48, (height, width, 3), dtype=np.uint8)
+    frame += np.linspace(0, 200, width, dtype=np.float32).astype(np.uint8)[None, :, None]
+    return frame
+
+
+def synthetic_jpeg(size, folder):
+    path = os.path.join(folder, 'frame.jpg')
+    Image.fromarray(synthetic_frame(size)).save(path, quality=90)
+    return path
+
+
+def overlay_inputs():
+    overlay_data = {"ISO": 4.0, "Shutter": 2000000, "Quality": 95, "Compression": 1, "Daylight": False, "HDR": False, "Config": {}}
+    metadata = {"Lux": 0.3, "ExposureTime": 2000000, "AnalogueGain": 4.0, "DigitalGain": 1.0, "FrameDuration": 2000000,
+                "LensPosition": 1.0, "SensorTemperature": 40, "AeLocked": False, "AfState": 0}
+    return overlay_data, metadata
+
+
+# Each stage has a setup, which prepares the inputs and is not measured, and the measured run.
+
+def setup_capture(size, folder):
+    return {"array": synthetic_frame(size), "path": os.path.join(folder, 'capture.jpg')}
+
+
+def run_capture(inputs):
+    # What capture_image does with a request: make the image, encode and store it
+    from scripts.storage.atomic_write import atomic_save_image
+    image = Image.fromarray(inputs['array'])
+    atomic_save_image(image, inputs['path'], quality=95)
+
+
+def setup_overlay(size, folder):
+    return {"path": synthetic_jpeg(size, folder)}
+
+
+def run_overlay(inputs):
+    from scripts.image.add_image_overlay import overlay_image_with_text
+    overlay_data, metadata = overlay_inputs()
+    overlay_image_with_text(inputs['path'], text="Camera", overlay_data=overlay_data, metadata=metadata, evlux=0.3,
+                            light_level=2.5, timestamp=datetime.datetime(2026, 1, 1, 3, 0))
+
+
+def setup_metering(size, folder):
+    return {"path": synthetic_jpeg(size, folder)}
+
+
+def run_metering(inputs):
+    from scripts.image.light_meter import calculate_light_level
+    calculate_light_level(inputs['path'])
+
+
+def setup_proxy(size, folder):
+    return {"path": synthetic_jpeg(size, folder), "target": os.path.join(folder, 'proxy.jpg')}
+
+
+def run_proxy(inputs):
+    from scripts.image.proxy_store import make_proxy
+    make_proxy(inputs['path'], inputs['target'], 1280, 80)
+
+
+def setup_night_stack(size, folder):
+    return {"array": synthetic_frame(size)}
+
+
+def run_night_stack(inputs):
+    from scripts.image.night_stack import FrameStack
+    stack = FrameStack('sigma_clip')
+    for i in range(STACK_FRAMES):
+        # A new array per exposure, as the camera delivers them
+        stack.add(np.roll(inputs['array'], i, axis=1))
+    Image.fromarray(stack.result())
+
+
+def setup_raw_develop(size, folder):
+    width, height = RAW_SIZE
+    raw = np.random.default_rng(0).integers(256, 1023, (height, width), dtype=np.uint16)
+    raw_path = os.path.join(folder, 'frame.npy')
+    np.save(raw_path, raw)
+    return {"job": {"raw": raw_path, "bits": 10, "bayer": 'RGGB', "black_level": 64, "colour_gains": [2.0, 1.6],
+                    "colour_matrix": [1, 0, 0, 0, 1, 0, 0, 0, 1], "digital_gain": 1.0, "size": list(size)}}
+
+
+def run_raw_develop(inputs):
+    from scripts.image.raw_capture import develop
+    develop(inputs['job'])
+
+
+# Stage: (setup, run, module the run uses)
+STAGES = {
+    "capture": (setup_capture, run_capture, 'scripts.storage.atomic_write'),
+    "overlay": (setup_overlay, run_overlay, 'scripts.image.add_image_overlay'),
+    "metering": (setup_metering, run_metering, 'scripts.image.light_meter'),
+    "proxy": (setup_proxy, run_proxy, 'scripts.image.proxy_store'),
+    "night_stack": (setup_night_stack, run_night_stack, 'scripts.image.night_stack'),
+    "raw_develop": (setup_raw_develop, run_raw_develop, 'scripts.image.raw_capture'),
+}
+
+
+def _status_kb(field):
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _reset_peak_rss():
+    """
+    Resets the kernel's peak RSS (VmHWM) to the current RSS; returns whether that is supported.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def measure_stage(name, size):
+    """
+    Runs one stage in this process and measures it; meant to run in a fresh process per stage.
+
+    Returns:
+        dict: stage, peak_rss_mb (growth of the peak RSS over the RSS before the stage),
+        traced_peak_mb and traced_retained_mb (Python and NumPy allocations), seconds.
+    """
+    setup, run, module = STAGES[name]
+    with tempfile.TemporaryDirectory() as folder:
+        inputs = setup(size, folder)
+        # Imports are part of the process start, not of the stage
+        importlib.import_module(module)
+        gc.collect()
+
+        exact = _reset_peak_rss()
+        baseline = _status_kb('VmRSS') if exact else resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        tracemalloc.start()
+        start = time.perf_counter()
+        run(inputs)
+        seconds = time.perf_counter() - start
+        traced_retained, traced_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peak = _status_kb('VmHWM') if exact else resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return {
+        "stage": name,
+        "peak_rss_mb": round(max(peak - baseline, 0) / 1024, 1),
+        "traced_peak_mb": round(traced_peak / MB, 1),
+        "traced_retained_mb": round(traced_retained / MB, 1),
+        "seconds": round(seconds, 2),
+        "exact": exact,
+    }
+
+
+def run_suite(stages, size, budgets, time_budgets=None):
+    """
+    Measures every stage in its own Python process, so one stage's heap does not hide another's peak.
+
+    Returns:
+        list: Per stage the measurement (see measure_stage()) plus budget_mb, time_budget_s (None
+        for stages without one) and ok; a stage that crashed has an error instead.
+    """
+    results = []
+    for name in stages:
+        command = [sys.executable, '-m', 'scripts.benchmark.memory_budget', '--stage', name, '--size', f"{size[0]}x{size[1]}"]
+        process = subprocess.run(command, cwd=ROOT, capture_output=True, text=True)
+        if process.returncode != 0:
+            results.append({"stage": name, "ok": False, "error": (process.stderr.strip().splitlines() or ['no output'])[-1]})
+            continue
+        result = json.loads(process.stdout.strip().splitlines()[-1])
+        result["budget_mb"] = budgets[name]
+        result["time_budget_s"] = (time_budgets or {}).get(name)
+        result["ok"] = result["peak_rss_mb"] <= budgets[name] and (result["time_budget_s"] is None or result["seconds"] <= result["time_budget_s"])
+        results.append(result)
+    return results
+
+
+def scaled_budgets(size, overrides=None, budgets=BUDGETS, digits=None):
+    """
+    Returns the budgets for a frame size: the 4K budgets scaled by the pixel count (raw development is
+    dominated by the sensor size, not the frame size).
+    """
+    scale = size[0] * size[1] / (3840 * 2160)
+    budgets = {name: (value if name == 'raw_develop' else round(value * max(scale, 0.25), digits)) for name, value in budgets.items()}
+    budgets.update(overrides or {})
+    return budgets
+
+
+def parse_overrides(parser, values, option):
+    overrides = {}
+    for value in values:
+        name, _, amount = value.partition('=')
+        if name not in STAGES:
+            parser.error(f"unknown stage in {option}: {name}")
+        overrides[name] = float(amount)
+    return overrides
+
+
+def parse_size(value):
+    width, height = value.lower().split('x')
+    return int(width), int(height)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Measure the peak memory of the image pipeline stages on synthetic frames and check them against their budgets.')
+    parser.add_argument('stages', nargs='*', help=f"Stages to run (default: all of {', '.join(STAGES)}).")
+    parser.add_argument('--size', type=parse_size, help='Frame size, WxH (default: camera_settings.main_size, or 3840x2160).')
+    parser.add_argument('--budget', action='append', default=[], metavar='STAGE=MB', help='Override the budget of a stage.')
+    parser.add_argument('--time-budget', action='append', default=[], metavar='STAGE=SECONDS', help='Override the time budget of a stage.')
+    parser.add_argument('--json', dest='json_path', help='Also write the results to this file.')
+    parser.add_argument('--stage', help=argparse.SUPPRESS)  # Internal: measure one stage in this process
+    args = parser.parse_args()
+
+    size = args.size
+    if size is None:
+        try:
+            size = tuple(load_config()['camera_settings']['main_size'])
+        except (OSError, KeyError, TypeError):
+            size = FRAME_SIZE
+
+    if args.stage:
+        print(json.dumps(measure_stage(args.stage, size)))
+        raise SystemExit(0)
+
+    unknown = [name for name in args.stages if name not in STAGES]
+    if unknown:
+        parser.error(f"unknown stage(s): {', '.join(unknown)}")
+    overrides = parse_overrides(parser, args.budget, '--budget')
+    time_overrides = parse_overrides(parser, args.time_budget, '--time-budget')
+
+    results = run_suite(args.stages or list(STAGES), size, scaled_budgets(size, overrides),
+                        scaled_budgets(size, time_overrides, TIME_BUDGETS, digits=1))
+    print(f"Frame size {size[0]}x{size[1]}")
+    for result in results:
+        if 'error' in result:
+            print(f"  {result['stage']:<12} FAILED: {result['error']}")
+            continue
+        status = "ok" if result['ok'] else "OVER BUDGET"
+        time_budget = f" (budget {result['time_budget_s']} s)" if result['time_budget_s'] is not None else ""
+        print(f"  {result['stage']:<12} peak RSS +{result['peak_rss_mb']:>6.1f} MB (budget {result['budget_mb']} MB), "
+              f"traced peak {result['traced_peak_mb']:>6.1f} MB, retained {result['traced_retained_mb']:>5.1f} MB, "
+              f"{result['seconds']:.2f} s{time_budget}  {status}")
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(results, f, indent=4)
+    raise SystemExit(0 if all(result['ok'] for result in results) else 1)
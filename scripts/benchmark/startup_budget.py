@@ -0,0 +1,155 @@
+# scripts/benchmark/startup_budget.py
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..'))
+REPEAT = 5
+
+# Entry point: (module, import-time budget in ms, modules that must not be imported at start-up).
+# The budgets leave room for a Raspberry Pi 4, which is several times slower than a desktop; the
+# deferred modules are the hard check, as they do not depend on the machine.
+ENTRY_POINTS = {
+    "capture_image": ("capture_image", 250, ("picamera2", "libcamera", "numpy", "PIL", "colored")),
+    "create-timelapse": ("scripts.video.create-timelapse", 250, ("numpy", "PIL", "colored")),
+    "db": ("db", 150, ("yaml", "numpy", "PIL")),
+    "light_meter": ("scripts.image.light_meter", 50, ("numpy", "PIL")),
+    "add_image_overlay": ("scripts.image.add_image_overlay", 50, ("numpy", "PIL", "yaml")),
+}
+
+# Runs in the measured interpreter: only builtins before the import, so nothing the entry point
+# imports is already loaded
+CHILD = """
+import sys
+before = __import__('locale').setlocale(__import__('locale').LC_TIME)
+__import__(sys.argv[1])
+import json, locale
+print(json.dumps({"loaded": [name for name in sys.argv[2:] if name in sys.modules],
+                  "locale_changed": locale.setlocale(locale.LC_TIME) != before}))
+"""
+
+
+def parse_importtime(stderr):
+    """
+    Parses `python -X importtime` output.
+
+    Returns:
+        list: (depth, module, self microseconds, cumulative microseconds), in the order Python
+        printed them: every module follows the modules it imported.
+    """
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        name = fields[2][1:]
+        entries.append(((len(name) - len(name.lstrip())) // 2, name.strip(), int(fields[0]), int(fields[1])))
+    return entries
+
+
+def import_chain(entries, index):
+    """
+    Returns who imported entries[index], up to the top level, e.g. ['numpy', 'scripts.image.night_stack', 'capture_image'].
+    """
+    chain = [entries[index][1]]
+    depth = entries[index][0]
+    for entry in entries[index + 1:]:
+        if entry[0] < depth:
+            chain.append(entry[1])
+            depth = entry[0]
+    return chain
+
+
+def measure(module, deferred, repeat=REPEAT):
+    """
+    Imports an entry point in fresh interpreters and checks what its import costs and does.
+
+    Returns:
+        dict: milliseconds (median cumulative import time), heaviest (its slowest direct imports),
+        deferred (import chains of modules that should not have been imported), locale_changed
+        and output (anything printed during the import).
+    """
+    times = []
+    for _ in range(repeat):
+        process = subprocess.run([sys.executable, '-X', 'importtime', '-c', CHILD, module, *deferred],
+                                 cwd=ROOT, capture_output=True, text=True)
+        if process.returncode != 0:
+            raise RuntimeError((process.stderr.strip().splitlines() or ['no output'])[-1])
+        entries = parse_importtime(process.stderr)
+        top = next(i for i, entry in enumerate(entries) if entry[0] == 0 and entry[1] == module)
+        times.append(entries[top][3])
+
+    *printed, report = process.stdout.strip().splitlines() or ['{}']
+    report = json.loads(report)
+    start = max((i for i, entry in enumerate(entries[:top]) if entry[0] == 0), default=-1) + 1
+    direct = [entry for entry in entries[start:top] if entry[0] == 1]
+    chains = [" <- ".join(import_chain(entries, i)) for i, entry in enumerate(entries[:top + 1])
+              if entry[1] in report['loaded'] and i >= start]
+    return {
+        "milliseconds": round(statistics.median(times) / 1000, 1),
+        "heaviest": [(name, round(cumulative / 1000, 1)) for _, name, _, cumulative in sorted(direct, key=lambda entry: -entry[3])[:3]],
+        "deferred": chains or report['loaded'],
+        "locale_changed": report['locale_changed'],
+        "output": printed,
+    }
+
+
+def check_entry_points(names, budgets, repeat=REPEAT):
+    """
+    Measures entry points against their start-up budgets.
+
+    Returns:
+        list: Per entry point the measurement (see measure()) plus name, budget_ms and problems.
+    """
+    results = []
+    for name in names:
+        module, _, deferred = ENTRY_POINTS[name]
+        try:
+            result = measure(module, deferred, repeat)
+        except Exception as e:
+            results.append({"name": name, "problems": [f"import failed: {e}"]})
+            continue
+        problems = []
+        if result['milliseconds'] > budgets[name]:
+            problems.append(f"import takes {result['milliseconds']} ms, budget {budgets[name]} ms")
+        problems += [f"imports {chain} at start-up" for chain in result['deferred']]
+        if result['locale_changed']:
+            problems.append("changes the locale when imported")
+        if result['output']:
+            problems.append("prints when imported")
+        result.update({"name": name, "budget_ms": budgets[name], "problems": problems})
+        results.append(result)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Check the import time and import side effects of the command line entry points.')
+    parser.add_argument('entry_points', nargs='*', help=f"Entry points to check (default: all of {', '.join(ENTRY_POINTS)}).")
+    parser.add_argument('--budget', action='append', default=[], metavar='NAME=MS', help='Override the budget of an entry point.')
+    parser.add_argument('--repeat', type=int, default=REPEAT, help='Imports per entry point; the median counts.')
+    args = parser.parse_args()
+
+    budgets = {name: budget for name, (_, budget, _) in ENTRY_POINTS.items()}
+    for value in args.budget:
+        name, _, ms = value.partition('=')
+        if name not in ENTRY_POINTS:
+            parser.error(f"unknown entry point in --budget: {name}")
+        budgets[name] = float(ms)
+    unknown = [name for name in args.entry_points if name not in ENTRY_POINTS]
+    if unknown:
+        parser.error(f"unknown entry point(s): {', '.join(unknown)}")
+
+    results = check_entry_points(args.entry_points or list(ENTRY_POINTS), budgets, args.repeat)
+    for result in results:
+        if 'milliseconds' in result:
+            heaviest = ", ".join(f"{name} {ms} ms" for name, ms in result['heaviest'])
+            print(f"{result['name']:<18} {result['milliseconds']:>6.1f} ms (budget {result['budget_ms']} ms)  slowest: {heaviest}")
+        for problem in result['problems']:
+            print(f"{'':<18} FAIL: {problem}")
+    raise SystemExit(1 if any(result['problems'] for result in results) else 0)
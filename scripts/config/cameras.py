@@ -0,0 +1,106 @@
+# scripts/config/cameras.py
+
+import copy
+import os
+
+# Paths each camera needs its own copy of. Unless a camera sets them, they are derived from the
+# shared value: a subfolder named after the camera id, or the id appended to the file name.
+CAMERA_FOLDERS = (('image_output', 'root_folder'), ('video_output', 'root_folder'), ('proxies', 'root_folder'),
+                  ('raw_capture', 'root_folder'), ('overlay', 'batch_output'), ('overlay', 'still_cache'))
+CAMERA_FILES = (('image_output', 'status_file'),)
+CAMERA_KEYS = ('index', 'id', 'name')  # Keys of a `cameras` entry that are not config sections
+
+
+def merge(base, overrides):
+    """
+    Returns a copy of `base` with `overrides` merged in; nested dictionaries are merged, anything else is replaced.
+    """
+    merged = copy.deepcopy(base)
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge(merged[key], value)
+        else:
+            merged[key] = copy.deepcopy(value)
+    return merged
+
+
+def camera_configs(config):
+    """
+    Returns one configuration per camera.
+
+    Without a `cameras` list this is [config]: the default camera, with everything as configured.
+    Otherwise every entry (index: the libcamera camera number, optional id and name, and any config
+    sections to override, e.g. camera_settings or image_output) is merged over the shared settings.
+    Each camera gets camera_settings.camera_index, a `camera_id` that keeps its state files apart,
+    and its own image, video, proxy and raw folders and status file unless the entry sets them.
+
+    Parameters:
+        config (dict): The configuration dictionary.
+
+    Returns:
+        list: The per-camera configuration dictionaries.
+    """
+    cameras = config.get('cameras')
+    if not cameras:
+        return [config]
+
+    shared = {key: value for key, value in config.items() if key != 'cameras'}
+    configs = []
+    for position, camera in enumerate(cameras):
+        index = camera.get('index', position)
+        camera_id = str(camera.get('id', f"cam{index}"))
+        overrides = {key: value for key, value in camera.items() if key not in CAMERA_KEYS}
+        merged = merge(shared, overrides)
+        settings = merged.setdefault('camera_settings', {})
+        settings['camera_index'] = index
+        if 'name' in camera:
+            settings['name'] = camera['name']
+        merged['camera_id'] = camera_id
+
+        for section, key in CAMERA_FOLDERS:
+            if key in merged.get(section, {}) and key not in overrides.get(section, {}):
+                merged[section][key] = os.path.join(merged[section][key], camera_id, '')
+        for section, key in CAMERA_FILES:
+            if key in merged.get(section, {}) and key not in overrides.get(section, {}):
+                stem, extension = os.path.splitext(merged[section][key])
+                merged[section][key] = f"{stem}_{camera_id}{extension}"
+        configs.append(merged)
+
+    ids = [merged['camera_id'] for merged in configs]
+    if len(set(ids)) != len(ids):
+        raise ValueError(f"Camera ids must be unique: {', '.join(ids)}")
+    return configs
+
+
+def camera_index(config):
+    """
+    Returns the libcamera camera number to open (0, the default camera, without a `cameras` list).
+    """
+    return (config or {}).get('camera_settings', {}).get('camera_index', 0)
+
+
+def camera_config(config, index):
+    """
+    Returns the configuration of the camera with the given index.
+
+    Parameters:
+        config (dict): The configuration dictionary as loaded from config.yaml.
+        index (int): The camera number, or None for the first camera.
+
+    Returns:
+        dict: The camera's configuration.
+    """
+    configs = camera_configs(config)
+    if index is None:
+        return configs[0]
+    for merged in configs:
+        if camera_index(merged) == index:
+            return merged
+    raise ValueError(f"No camera with index {index} in config.yaml")
+
+
+def camera_args(config):
+    """
+    Returns the command line arguments that select a camera in the metering scripts (none for a single camera).
+    """
+    return ['--camera', str(camera_index(config))] if config.get('camera_id') else []
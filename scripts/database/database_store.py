@@ -1,6 +1,5 @@
 import sqlite3
 import os
-import yaml
 from datetime import datetime
 
 # Database file location
@@ -8,6 +7,11 @@ DATABASE_DIR = os.path.join(os.path.dirname(__file__), '../../database')
 DATABASE_PATH = os.path.join(DATABASE_DIR, 'lux_data.db')
 CONFIG_PATH = os.path.join(os.path.dirname(__file__), '../../config.yaml')
 
+# Rollup tables: level -> length of the timestamp prefix that forms the bucket
+ROLLUP_LEVELS = {"minute": 16, "hour": 13, "day": 10}
+# Rolled-up metrics -> their column in image_evaluation
+ROLLUP_METRICS = {"lux": "lux", "exposure": "exposure_time", "temperature": "sensor_temperature"}
+
 def load_config():
     """
     Loads the configuration from the config.yaml file.
@@ -17,6 +21,8 @@ def load_config():
     """
     if not os.path.exists(CONFIG_PATH):
         raise FileNotFoundError(f"Configuration file not found at {CONFIG_PATH}")
+    import yaml
+
     with open(CONFIG_PATH, 'r') as config_file:
         return yaml.safe_load(config_file)
 
@@ -43,9 +49,19 @@ def initialize_database():
     if not os.path.exists(DATABASE_DIR):
         os.makedirs(DATABASE_DIR)
 
-    # Initialize the SQLite database and create the table
+    # Initialize the SQLite database and create the tables
     conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
+    create_schema(conn.cursor())
+    conn.commit()
+    conn.close()
+
+def create_schema(cursor):
+    """
+    Creates the image_evaluation table, its timestamp index and the rollup tables if they don't exist.
+
+    Parameters:
+        cursor (sqlite3.Cursor): Cursor of an open connection.
+    """
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS image_evaluation (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -53,13 +69,150 @@ def initialize_database():
             evaluated_lux REAL,
             exposure_time REAL,
             evaluated_exposure_time REAL,
-            timestamp TEXT
+            timestamp TEXT,
+            sensor_temperature REAL
         )
     ''')
+    # Databases created before sensor temperatures were stored
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(image_evaluation)")]
+    if 'sensor_temperature' not in columns:
+        cursor.execute("ALTER TABLE image_evaluation ADD COLUMN sensor_temperature REAL")
+    cursor.execute("CREATE INDEX IF NOT EXISTS image_evaluation_timestamp ON image_evaluation (timestamp)")
+
+    for level in ROLLUP_LEVELS:
+        metrics = ", ".join(f"{metric}_count INTEGER NOT NULL DEFAULT 0, {metric}_min REAL, {metric}_sum REAL NOT NULL DEFAULT 0, {metric}_max REAL"
+                            for metric in ROLLUP_METRICS)
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS rollup_{level} (bucket TEXT PRIMARY KEY, {metrics})")
+
+def _update_rollups(cursor, timestamp, values):
+    """
+    Folds newly recorded values into the minute, hour and day rollups of their timestamp.
+
+    Parameters:
+        cursor (sqlite3.Cursor): Cursor of the open transaction.
+        timestamp (str): The row's timestamp ('%Y-%m-%d %H:%M:%S').
+        values (dict): Metric name -> value; None values are skipped.
+    """
+    values = {metric: value for metric, value in values.items() if value is not None}
+    if not values:
+        return
+    for level, length in ROLLUP_LEVELS.items():
+        columns = ["bucket"]
+        params = [timestamp[:length]]
+        updates = []
+        for metric, value in values.items():
+            columns += [f"{metric}_count", f"{metric}_min", f"{metric}_sum", f"{metric}_max"]
+            params += [1, value, value, value]
+            updates += [
+                f"{metric}_count = {metric}_count + 1",
+                f"{metric}_min = MIN(COALESCE({metric}_min, excluded.{metric}_min), excluded.{metric}_min)",
+                f"{metric}_sum = {metric}_sum + excluded.{metric}_sum",
+                f"{metric}_max = MAX(COALESCE({metric}_max, excluded.{metric}_max), excluded.{metric}_max)",
+            ]
+        cursor.execute(f"INSERT INTO rollup_{level} ({', '.join(columns)}) VALUES ({', '.join('?' * len(params))}) "
+                       f"ON CONFLICT(bucket) DO UPDATE SET {', '.join(updates)}", params)
+
+def rebuild_rollups(database_path=DATABASE_PATH):
+    """
+    Recomputes all rollup tables from image_evaluation, e.g. for history recorded before rollups existed.
+
+    Parameters:
+        database_path (str): Path of the SQLite database.
+    """
+    conn = sqlite3.connect(database_path)
+    cursor = conn.cursor()
+    create_schema(cursor)
+    for level, length in ROLLUP_LEVELS.items():
+        cursor.execute(f"DELETE FROM rollup_{level}")
+        aggregates = ", ".join(f"COUNT({column}), MIN({column}), COALESCE(SUM({column}), 0), MAX({column})"
+                               for column in ROLLUP_METRICS.values())
+        columns = ", ".join(f"{metric}_count, {metric}_min, {metric}_sum, {metric}_max" for metric in ROLLUP_METRICS)
+        cursor.execute(f"INSERT INTO rollup_{level} (bucket, {columns}) "
+                       f"SELECT substr(timestamp, 1, {length}) AS bucket, {aggregates} FROM image_evaluation "
+                       f"WHERE timestamp IS NOT NULL GROUP BY bucket")
     conn.commit()
     conn.close()
 
-def insert_evaluation(lux=None, evaluated_lux=None, exposure_time=None, evaluated_exposure_time=None, update_latest=False):
+def _time_range_clause(column, start, end, params):
+    clauses = []
+    if start:
+        clauses.append(f"{column} >= ?")
+        params.append(start)
+    if end:
+        clauses.append(f"{column} <= ?")
+        params.append(end)
+    return f" WHERE {' AND '.join(clauses)}" if clauses else ""
+
+def has_evaluations(database_path=DATABASE_PATH):
+    """
+    Returns whether the database exists and has the image_evaluation table, without creating either.
+    """
+    if not os.path.exists(database_path):
+        return False
+    try:
+        conn = sqlite3.connect(f"file:{database_path}?mode=ro", uri=True)
+        try:
+            return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'image_evaluation'").fetchone() is not None
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return False
+
+def iter_evaluations(start=None, end=None, database_path=DATABASE_PATH):
+    """
+    Streams image_evaluation rows in time order without loading the table into memory.
+
+    Parameters:
+        start (str, optional): First timestamp to include, e.g. '2024-06-01' or '2024-06-01 12:00'.
+        end (str, optional): Last timestamp to include (a prefix includes the whole period).
+        database_path (str): Path of the SQLite database.
+
+    Yields:
+        tuple: The column names first, then one tuple per row.
+    """
+    params = []
+    where = _time_range_clause("timestamp", start, _inclusive_end(end), params)
+    conn = sqlite3.connect(database_path)
+    try:
+        cursor = conn.execute("SELECT id, timestamp, lux, evaluated_lux, exposure_time, evaluated_exposure_time, sensor_temperature "
+                              f"FROM image_evaluation{where} ORDER BY timestamp, id", params)
+        yield tuple(description[0] for description in cursor.description)
+        yield from cursor
+    finally:
+        conn.close()
+
+def iter_rollups(level, start=None, end=None, database_path=DATABASE_PATH):
+    """
+    Streams a rollup table as min/mean/max per bucket.
+
+    Parameters:
+        level (str): 'minute', 'hour' or 'day'.
+        start (str, optional): First bucket to include.
+        end (str, optional): Last bucket to include.
+        database_path (str): Path of the SQLite database.
+
+    Yields:
+        tuple: The column names first, then one tuple per bucket.
+    """
+    if level not in ROLLUP_LEVELS:
+        raise ValueError(f"Unknown rollup level: {level}")
+    params = []
+    where = _time_range_clause("bucket", start[:ROLLUP_LEVELS[level]] if start else None, _inclusive_end(end), params)
+    columns = ", ".join(f"{metric}_min, {metric}_sum / NULLIF({metric}_count, 0) AS {metric}_mean, {metric}_max"
+                        for metric in ROLLUP_METRICS)
+    conn = sqlite3.connect(database_path)
+    try:
+        cursor = conn.execute(f"SELECT bucket, lux_count AS captures, {columns} FROM rollup_{level}{where} ORDER BY bucket", params)
+        yield tuple(description[0] for description in cursor.description)
+        yield from cursor
+    finally:
+        conn.close()
+
+def _inclusive_end(end):
+    # Timestamps compare as text, so '2024-06-30' must also match everything later that day
+    return f"{end}\uffff" if end else None
+
+def insert_evaluation(lux=None, evaluated_lux=None, exposure_time=None, evaluated_exposure_time=None, update_latest=False, sensor_temperature=None):
     """
     Inserts or updates image evaluation data into the SQLite database, rounding lux values to 1 decimal place.
 
@@ -69,6 +222,9 @@ def insert_evaluation(lux=None, evaluated_lux=None, exposure_time=None, evaluate
         exposure_time (float, optional): The exposure time.
         evaluated_exposure_time (float, optional): The evaluated exposure time.
         update_latest (bool, optional): If True, update the latest row. Otherwise, insert a new row.
+        sensor_temperature (float, optional): The sensor temperature.
+
+    The minute, hour and day rollups are updated in the same transaction.
     """
     if not should_store_data():
         print("Database storing is disabled in config.yaml.")
@@ -107,18 +263,25 @@ def insert_evaluation(lux=None, evaluated_lux=None, exposure_time=None, evaluate
         if evaluated_exposure_time is not None:
             updates.append("evaluated_exposure_time = ?")
             params.append(evaluated_exposure_time)
+        if sensor_temperature is not None:
+            updates.append("sensor_temperature = ?")
+            params.append(sensor_temperature)
 
         # Only update if there are fields to update
         if updates:
-            query += ", ".join(updates) + " WHERE id = (SELECT MAX(id) FROM image_evaluation)"
-            cursor.execute(query, params)
+            row = cursor.execute("SELECT id, timestamp FROM image_evaluation ORDER BY id DESC LIMIT 1").fetchone()
+            if row is not None:
+                query += ", ".join(updates) + " WHERE id = ?"
+                cursor.execute(query, params + [row[0]])
+                _update_rollups(cursor, row[1] or timestamp, {"lux": lux, "exposure": exposure_time, "temperature": sensor_temperature})
             print(f"Latest evaluation data updated in the database at {timestamp}")
     else:
         # Insert a new row with the values
         cursor.execute('''
-            INSERT INTO image_evaluation (lux, evaluated_lux, exposure_time, evaluated_exposure_time, timestamp)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (lux, evaluated_lux, exposure_time, evaluated_exposure_time, timestamp))
+            INSERT INTO image_evaluation (lux, evaluated_lux, exposure_time, evaluated_exposure_time, timestamp, sensor_temperature)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (lux, evaluated_lux, exposure_time, evaluated_exposure_time, timestamp, sensor_temperature))
+        _update_rollups(cursor, timestamp, {"lux": lux, "exposure": exposure_time, "temperature": sensor_temperature})
         print(f"Evaluation data stored in the database with timestamp {timestamp}")
 
     conn.commit()
@@ -1,14 +1,12 @@
 # scripts/image/add_image_overlay.py
 
+import functools
 import json
-from PIL import Image, ImageDraw, ImageFont
 import os
-import yaml
 from datetime import datetime
-import locale
 
-# Set the locale to Norwegian
-locale.setlocale(locale.LC_TIME, "nb_NO.UTF-8")
+# PIL and yaml are imported where they are used: capture in deferred overlay mode only needs
+# overlay_fields() and load_light_level()
 
 # Default configuration
 OVERLAY_IMAGE_PATH = os.path.join(os.path.dirname(__file__), '../../overlay/overlay.png')
@@ -16,6 +14,12 @@ FONT_PATH = "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf"
 FONT_SIZE = 50
 TEXT_COLOR = (255, 255, 255)  # White text, no alpha channel for JPEG
 TIME_FONT_SIZE = 70  # Font size for the time
+DATE_FONT_SIZE = 40
+DETAIL_FONT_SIZE = 30  # Font size for the capture details
+# Norwegian day and month names, so the date does not depend on the nb_NO locale being installed
+# (or on changing the process locale)
+DAY_NAMES = ("mandag", "tirsdag", "onsdag", "torsdag", "fredag", "lørdag", "søndag")
+MONTH_NAMES = ("januar", "februar", "mars", "april", "mai", "juni", "juli", "august", "september", "oktober", "november", "desember")
 CONFIG_PATH = os.path.join(os.path.dirname(__file__), '../../config.yaml')
 QUALITY = 70
 LAST_MEASUREMENT_PATH = os.path.join(os.path.dirname(__file__), '../../temp/last_measurement.json')
@@ -47,11 +51,146 @@ def load_camera_name(config_path=CONFIG_PATH):
     Returns:
         str: The camera name.
     """
+    import yaml
+
     with open(config_path, 'r') as file:
         config = yaml.safe_load(file)
     return config.get('camera_settings', {}).get('name', "Camera Name")
 
-def overlay_image_with_text(input_image_path, output_image_path=None, text=None, quality=QUALITY, overlay_data=None, metadata=None, evlux=None):
+def overlay_fields(overlay_data=None, metadata=None, evlux=None, light_level=None, timestamp=None):
+    """
+    Collects the values shown in the overlay, as stored in the overlay sidecar.
+
+    Parameters:
+        overlay_data (dict, optional): Capture settings (ISO, Shutter, Daylight, HDR).
+        metadata (dict, optional): Rounded camera metadata (Lux, gains, exposure time, ...).
+        evlux (float, optional): Lux value of the last metering.
+        light_level (float, optional): Light level of the last metering.
+        timestamp (datetime, optional): Time shown in the overlay; defaults to now.
+
+    Returns:
+        dict: Flat, JSON-serializable overlay fields.
+    """
+    fields = {"timestamp": (timestamp or datetime.now()).isoformat(timespec='seconds')}
+    if overlay_data:
+        fields.update({
+            "iso": overlay_data.get('ISO', 'N/A'),
+            "shutter": overlay_data.get('Shutter', 'N/A'),
+            "light_level": light_level,
+            "daylight": overlay_data.get('Daylight', 'N/A'),
+            "hdr": bool(overlay_data.get('HDR')),
+        })
+        if metadata is not None:
+            fields.update({
+                "evlux": evlux,
+                "lux": metadata['Lux'],
+                "analogue_gain": metadata['AnalogueGain'],
+                "digital_gain": metadata['DigitalGain'],
+                "exposure_time": metadata['ExposureTime'],
+                "lens_position": metadata['LensPosition'],
+                "sensor_temperature": metadata['SensorTemperature'],
+            })
+    return fields
+
+def format_date(when):
+    """
+    Returns the full date in Norwegian, e.g. 'mandag, 05. januar 2026 03:04'.
+    """
+    return f"{DAY_NAMES[when.weekday()]}, {when:%d}. {MONTH_NAMES[when.month - 1]} {when:%Y %H:%M}"
+
+@functools.lru_cache(maxsize=None)
+def load_font(size):
+    from PIL import ImageFont
+
+    return ImageFont.truetype(FONT_PATH, size)
+
+def overlay_layout(fields, text, width):
+    """
+    Lays out the overlay text for an image of the given width.
+
+    Parameters:
+        fields (dict): Overlay fields, see overlay_fields().
+        text (str): Camera name.
+        width (int): Image width in pixels.
+
+    Returns:
+        list: (text, (x, y), font size) tuples, positions being the top-left corner of the text.
+    """
+    # Center the camera name, 10 pixels from the top edge
+    text_bbox = load_font(FONT_SIZE).getbbox(text)
+    text_position = ((width - text_bbox[2]) // 2, 10)
+    lines = [(text, text_position, FONT_SIZE)]
+
+    # The full date in Norwegian format just below the camera name
+    full_date = format_date(datetime.fromisoformat(fields['timestamp']))
+    date_bbox = load_font(DATE_FONT_SIZE).getbbox(full_date)
+    lines.append((full_date, ((width - date_bbox[2]) // 2, text_position[1] + text_bbox[3] + 10), DATE_FONT_SIZE))
+
+    if 'iso' in fields:
+        if 'lux' in fields:
+            overlay_text_right = ""
+            if fields.get('evlux') is not None:
+                overlay_text_right += f"Evlux: {fields['evlux']}, "
+            overlay_text_right += (
+                f"Lux: {fields['lux']}, "
+                f"AGain: {fields['analogue_gain']}, "
+                f"DGain: {fields['digital_gain']}"
+            )
+            overlay_text_right_line_2 = (
+                f"Exposuretime: {fields['exposure_time']}, "
+                f"LensPos: {fields['lens_position']}, "
+                f"SensorTemp: {fields['sensor_temperature']}"
+            )
+            lines.append((overlay_text_right, (2450, 25), DETAIL_FONT_SIZE))
+            lines.append((overlay_text_right_line_2, (2450, 80), DETAIL_FONT_SIZE))
+
+        overlay_text = (
+            f"ISO: {fields['iso']}, "
+            f"Shutter: {fields['shutter']}, "
+            f"Light: {fields['light_level']}, "
+            f"Day: {fields['daylight']}, "
+            f"HDR: {'On' if fields['hdr'] else 'Off'}"  # Include HDR state
+        )
+        lines.append((overlay_text, (20, 85), DETAIL_FONT_SIZE))
+    return lines
+
+def draw_overlay(base_image, fields, text, overlay_image=None, in_place=False):
+    """
+    Draws the overlay graphic and text onto an image.
+
+    Parameters:
+        base_image (PIL.Image.Image): The clean frame.
+        fields (dict): Overlay fields, see overlay_fields().
+        text (str): Camera name.
+        overlay_image (PIL.Image.Image, optional): The RGBA overlay graphic; loaded from OVERLAY_IMAGE_PATH if None.
+        in_place (bool): Draw onto base_image itself if it is RGB, when the caller no longer needs the clean frame.
+
+    Returns:
+        PIL.Image.Image: The overlaid image in RGB mode.
+    """
+    from PIL import Image, ImageDraw
+
+    if overlay_image is None:
+        overlay_image = Image.open(OVERLAY_IMAGE_PATH).convert("RGBA")
+
+    # Only the band under the overlay graphic is composited, so there is one full-frame copy (the
+    # RGB result) instead of full-frame RGBA layers
+    if base_image.mode != "RGB":
+        combined = base_image.convert("RGB")
+    else:
+        combined = base_image if in_place else base_image.copy()
+    box = (0, 0, min(overlay_image.width, combined.width), min(overlay_image.height, combined.height))
+    band = combined.crop(box).convert("RGBA")
+    band.alpha_composite(overlay_image.crop(box))
+    combined.paste(band.convert("RGB"), box)
+
+    # Add camera name, date and capture details on top of the overlay
+    draw = ImageDraw.Draw(combined)
+    for line, position, size in overlay_layout(fields, text, combined.width):
+        draw.text(position, line, font=load_font(size), fill=TEXT_COLOR)
+    return combined
+
+def overlay_image_with_text(input_image_path, output_image_path=None, text=None, quality=QUALITY, overlay_data=None, metadata=None, evlux=None, last_measurement_path=LAST_MEASUREMENT_PATH, timestamp=None, light_level=None):
     """
     Overlays an image with an overlay image, adds the camera name, and the full date in Norwegian.
 
@@ -61,77 +200,22 @@ def overlay_image_with_text(input_image_path, output_image_path=None, text=None,
         text (str): Camera name to add to the image.
         quality (int): Quality of the output image (applicable for JPEG format).
         overlay_data (dict): Additional data to be displayed on the image.
+        last_measurement_path (str): Where to read the light level from (the live copy when staging).
+        timestamp (datetime, optional): Time shown in the overlay; defaults to now.
+        light_level (float, optional): Light level to show instead of the one in last_measurement_path.
     """
+    from PIL import Image
+
     # Load camera name if text is not provided
     if text is None:
         text = load_camera_name()
 
-    # Load the base image
-    base_image = Image.open(input_image_path).convert("RGBA")
-
-    # Load the overlay image
-    overlay_image = Image.open(OVERLAY_IMAGE_PATH).convert("RGBA")
-
-    # Create a transparent layer the same size as the base image
-    transparent_layer = Image.new("RGBA", base_image.size, (0, 0, 0, 0))
-
-    # Paste the overlay onto the transparent layer
-    transparent_layer.paste(overlay_image, (0, 0))
+    if overlay_data and light_level is None:
+        light_level = load_light_level(last_measurement_path)
+    fields = overlay_fields(overlay_data, metadata, evlux, light_level, timestamp)
 
-    # Composite the base image with the transparent layer containing the overlay
-    combined = Image.alpha_composite(base_image, transparent_layer)
-
-    # Add camera name and date text on top of the overlay
-    draw = ImageDraw.Draw(combined)
-    camerafont = ImageFont.truetype(FONT_PATH, FONT_SIZE)
-    datefont = ImageFont.truetype(FONT_PATH, 40)
-
-    # Center the camera name
-    text_bbox = draw.textbbox((0, 0), text, font=camerafont)
-    text_position = ((base_image.width - text_bbox[2]) // 2, 10)  # 10 pixels from the top edge
-    draw.text(text_position, text, font=camerafont, fill=TEXT_COLOR)
-
-    # Add the full date in Norwegian format just below the camera name
-    full_date = datetime.now().strftime("%A, %d. %B %Y %H:%M")
-    date_bbox = draw.textbbox((0, 0), full_date, font=datefont)
-    date_position = ((base_image.width - date_bbox[2]) // 2, text_position[1] + text_bbox[3] + 10)  # 10 pixels below the camera name
-    draw.text(date_position, full_date, font=datefont, fill=TEXT_COLOR)
-
-    if overlay_data:
-        light_level = load_light_level()
-        overlay_font = ImageFont.truetype(FONT_PATH, 30)
-        overlay_text = (
-            f"ISO: {overlay_data.get('ISO', 'N/A')}, "
-            f"Shutter: {overlay_data.get('Shutter', 'N/A')}, "
-            f"Light: {light_level}, "
-            f"Day: {overlay_data.get('Daylight', 'N/A')}, "
-            f"HDR: {'On' if overlay_data.get('HDR') else 'Off'}"  # Include HDR state
-        )
-        if metadata is not None:
-            
-            overlay_text_right = ""
-            if evlux is not None:
-                overlay_text_right += (
-                    f"Evlux: {evlux}, "
-                )
-            overlay_text_right += (
-                f"Lux: {metadata['Lux']}, "
-                f"AGain: {metadata['AnalogueGain']}, "
-                f"DGain: {metadata['DigitalGain']}"
-            )
-            overlay_text_right_line_2 = (
-                f"Exposuretime: {metadata['ExposureTime']}, "
-                f"LensPos: {metadata['LensPosition']}, "
-                f"SensorTemp: {metadata['SensorTemperature']}"
-            )
-            draw.text((2450, 25), overlay_text_right, font=overlay_font, fill=TEXT_COLOR)
-            draw.text((2450, 80), overlay_text_right_line_2, font=overlay_font, fill=TEXT_COLOR)
-
-        # Draw the text
-        draw.text((20, 85), overlay_text, font=overlay_font, fill=TEXT_COLOR)
-        
-    # Convert the final image to RGB mode (JPEG doesn't support alpha channel)
-    final_image = combined.convert("RGB")
+    with Image.open(input_image_path) as base_image:
+        final_image = draw_overlay(base_image, fields, text, in_place=True)
 
     # Save the result as a JPEG with the specified quality
     if output_image_path is None:
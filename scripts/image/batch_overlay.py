@@ -0,0 +1,229 @@
+# scripts/image/batch_overlay.py
+
+import argparse
+import bisect
+import concurrent.futures
+import datetime
+import hashlib
+import json
+import os
+import sqlite3
+
+import yaml
+from PIL import Image
+
+from scripts.database.database_store import has_evaluations, iter_evaluations
+from scripts.image import add_image_overlay
+from scripts.image.frame_names import parse_frame_name
+from scripts.image.image_tree import list_day_folders, list_frames, parse_date_range
+from scripts.image.overlay_sidecar import load_overlay_records
+from scripts.image.overlay_still import overlay_frame
+from scripts.storage.atomic_write import atomic_save_image, atomic_write_bytes
+
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), '../../config.yaml')
+CHECKPOINT_PATH = os.path.join(os.path.dirname(__file__), '../../data/batch_overlay_checkpoint.json')
+OUTPUT_ROOT = '/var/www/html/overlaid/'  # Default for overlay.batch_output
+WORKERS = os.cpu_count() or 2
+DATABASE_MATCH = 120  # Seconds a database row may be away from a frame to supply its values
+
+_worker_assets = {}  # Per worker process: the overlay graphic and camera name, loaded once
+
+
+def load_config(config_path=CONFIG_PATH):
+    with open(config_path, 'r') as file:
+        return yaml.safe_load(file)
+
+
+def assets_hash(config):
+    """
+    Hashes what the overlay looks like: the overlay graphic, the layout code and the camera name.
+    """
+    digest = hashlib.sha256()
+    for path in (add_image_overlay.OVERLAY_IMAGE_PATH, add_image_overlay.__file__):
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    digest.update(config['camera_settings'].get('name', "Camera Name").encode('utf-8'))
+    return digest.hexdigest()
+
+
+def load_checkpoint(key):
+    try:
+        with open(CHECKPOINT_PATH, 'r') as f:
+            checkpoint = json.load(f)
+    except (OSError, ValueError):
+        checkpoint = {}
+    if checkpoint.get('key') != key:
+        checkpoint = {"key": key, "days": []}
+    return checkpoint
+
+
+def save_checkpoint(checkpoint):
+    os.makedirs(os.path.dirname(CHECKPOINT_PATH), exist_ok=True)
+    atomic_write_bytes(CHECKPOINT_PATH, json.dumps(checkpoint, indent=4).encode('utf-8'))
+
+
+def database_fields(day):
+    """
+    Returns a lookup of the stored evaluations of a day, for frames without an overlay sidecar record.
+
+    Without a database (database.store_data off) the lookup finds nothing, so those frames get
+    timestamp-only fields.
+    """
+    times, values = [], []
+    if has_evaluations():
+        try:
+            rows = iter_evaluations(day.isoformat(), day.isoformat())
+            columns = next(rows)
+            for row in rows:
+                row = dict(zip(columns, row))
+                try:
+                    times.append(datetime.datetime.strptime(row['timestamp'], '%Y-%m-%d %H:%M:%S'))
+                except (TypeError, ValueError):
+                    continue
+                values.append(row)
+        except sqlite3.Error as e:
+            print(f"Error reading evaluations for {day}: {e}")
+            times, values = [], []
+
+    def lookup(when):
+        index = bisect.bisect_left(times, when)
+        candidates = [i for i in (index - 1, index) if 0 <= i < len(times)]
+        if not candidates:
+            return None
+        nearest = min(candidates, key=lambda i: abs(times[i] - when))
+        if abs(times[nearest] - when).total_seconds() > DATABASE_MATCH:
+            return None
+        return values[nearest]
+    return lookup
+
+
+def frame_fields(name, records, database_lookup):
+    """
+    Returns the overlay fields of a frame: its sidecar record, or values from the database.
+    """
+    if name in records:
+        return records[name]
+    if database_lookup is None:
+        return None
+    when, _ = parse_frame_name(name)
+    if when is None:
+        return None
+    fields = {"timestamp": when.isoformat(timespec='seconds')}
+    row = database_lookup(when)
+    if row:
+        # Only what the database stores; ISO, shutter and gains are unknown
+        fields.update({"iso": 'N/A', "shutter": 'N/A', "light_level": None, "daylight": 'N/A', "hdr": False,
+                       "evlux": row['evaluated_lux'], "lux": row['lux'], "analogue_gain": 'N/A', "digital_gain": 'N/A',
+                       "exposure_time": row['exposure_time'], "lens_position": 'N/A', "sensor_temperature": row['sensor_temperature']})
+    return fields
+
+
+def _init_worker(camera_name):
+    _worker_assets['overlay'] = Image.open(add_image_overlay.OVERLAY_IMAGE_PATH).convert("RGBA")
+    _worker_assets['camera_name'] = camera_name
+
+
+def overlay_one(source, target, fields, quality):
+    """
+    Writes an overlaid copy of a clean frame (runs in a worker process).
+
+    Returns:
+        int: Bytes written.
+    """
+    with Image.open(source) as image:
+        overlaid = overlay_frame(image, fields, _worker_assets['camera_name'], _worker_assets['overlay'])
+        if overlaid.size != image.size:
+            overlaid = overlaid.resize(image.size, Image.LANCZOS)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    return atomic_save_image(overlaid, target, quality=quality, optimize=True)
+
+
+def run_batch_overlay(config, start_date, end_date, output_root=None, workers=WORKERS, quality=add_image_overlay.QUALITY,
+                      assume_clean=False, force=False, dry_run=False):
+    """
+    Renders overlaid copies of the clean frames of a date range into a separate tree.
+
+    Each frame gets the values recorded when it was captured (its overlay sidecar record; with
+    `assume_clean`, frames without one get what the database stored). The overlay graphic is loaded
+    once per worker process. Finished days are kept in a checkpoint together with a hash of the
+    overlay assets and layout, so an interrupted run resumes where it stopped and a changed
+    overlay starts over.
+
+    Parameters:
+        config (dict): The configuration dictionary.
+        start_date (date): First day.
+        end_date (date): Last day.
+        output_root (str, optional): Root of the overlaid tree; defaults to overlay.batch_output.
+        workers (int): Worker processes.
+        quality (int): JPEG quality of the overlaid frames.
+        assume_clean (bool): Also overlay frames without a sidecar record (only for frames known to be clean).
+        force (bool): Ignore the checkpoint.
+        dry_run (bool): Only report what would be done.
+
+    Returns:
+        dict: Counts of overlaid, skipped and failed frames.
+    """
+    output_root = output_root or config.get('overlay', {}).get('batch_output', OUTPUT_ROOT)
+    image_root = config['image_output']['root_folder']
+    key = hashlib.sha256(json.dumps([assets_hash(config), os.path.abspath(output_root), quality, assume_clean]).encode('utf-8')).hexdigest()
+    checkpoint = {"key": key, "days": []} if force else load_checkpoint(key)
+    counts = {"overlaid": 0, "skipped": 0, "failed": 0}
+
+    executor = None if dry_run else concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(config['camera_settings'].get('name', "Camera Name"),))
+    try:
+        for day, folder in list_day_folders(config, start_date, end_date):
+            if day.isoformat() in checkpoint['days']:
+                continue
+            records = load_overlay_records(folder)
+            database_lookup = database_fields(day) if assume_clean else None
+            jobs = []
+            for name in list_frames(folder, config['image_output'].get('image_extension', 'jpg')):
+                fields = frame_fields(name, records, database_lookup)
+                if fields is None:
+                    counts['skipped'] += 1
+                    continue
+                source = os.path.join(folder, name)
+                jobs.append((source, os.path.join(output_root, os.path.relpath(source, image_root)), fields, quality))
+
+            if dry_run:
+                print(f"{day}: would overlay {len(jobs)} frames")
+                counts['overlaid'] += len(jobs)
+                continue
+
+            futures = [executor.submit(overlay_one, *job) for job in jobs]
+            failed = 0
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    future.result()
+                    counts['overlaid'] += 1
+                except Exception as e:
+                    print(f"Error overlaying frame: {e}")
+                    failed += 1
+            counts['failed'] += failed
+            if not failed:
+                checkpoint['days'].append(day.isoformat())
+                save_checkpoint(checkpoint)
+            print(f"{day}: overlaid {len(jobs) - failed} frames" + (f", {failed} failed" if failed else ""))
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Render overlaid copies of the clean frames of a date range.')
+    parser.add_argument('--from', dest='start', required=True, help='First date, YYYY-MM-DD.')
+    parser.add_argument('--to', dest='end', help='Last date, YYYY-MM-DD (defaults to --from).')
+    parser.add_argument('--output', help='Root of the overlaid tree (default: overlay.batch_output).')
+    parser.add_argument('--workers', type=int, default=WORKERS, help='Worker processes.')
+    parser.add_argument('--quality', type=int, default=add_image_overlay.QUALITY, help='JPEG quality.')
+    parser.add_argument('--assume-clean', action='store_true', help='Also overlay frames without a sidecar record, with values from the database.')
+    parser.add_argument('--force', action='store_true', help='Ignore the checkpoint and start over.')
+    parser.add_argument('--dry-run', action='store_true', help='Only show what would be done.')
+    args = parser.parse_args()
+
+    start_date, end_date = parse_date_range(args.start, args.end)
+    config = load_config()
+    counts = run_batch_overlay(config, start_date, end_date, args.output, args.workers, args.quality, args.assume_clean, args.force, args.dry_run)
+    print(", ".join(f"{count} {status}" for status, count in counts.items()))
@@ -14,12 +14,13 @@ def load_config(config_path):
     with open(config_path, 'r') as file:
         return yaml.safe_load(file)
 
-def calculate_iso_and_shutter(light_level):
+def calculate_iso_and_shutter(light_level, config=None):
     """
     Calculate the ISO and shutter speed based on the light level.
 
     Parameters:
         light_level (float): The measured light level.
+        config (dict, optional): The configuration dictionary. Loaded from config.yaml if not given.
 
     Returns:
         tuple: (iso_value, shutter_value, daylight)
@@ -28,8 +29,9 @@ def calculate_iso_and_shutter(light_level):
             daylight (bool): True if the light level is considered daylight, otherwise False.
     """
     # Automatically load the config.yaml from ../../config.yaml
-    config_path = os.path.join(os.path.dirname(__file__), '../../config.yaml')
-    config = load_config(config_path)
+    if config is None:
+        config_path = os.path.join(os.path.dirname(__file__), '../../config.yaml')
+        config = load_config(config_path)
 
     daylight_threshold = config['light_settings']['daylight_threshold']
     night_threshold = config['light_settings']['night_threshold']
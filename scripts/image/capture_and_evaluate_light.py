@@ -1,3 +1,4 @@
+import argparse
 import subprocess
 import sys
 import os
@@ -8,14 +9,22 @@ from calculate_iso_and_shutter import calculate_iso_and_shutter
 # Add the root directory to sys.path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
 from scripts.database.database_store import insert_evaluation  # Correct function name to match your database_store.py
+from scripts.config.config_loader import load_config
+from scripts.config.cameras import camera_args, camera_config
+from scripts.storage.write_path import live_path, readable_path, write_json_state, EVALUATION_METADATA_PATH, LAST_MEASUREMENT_PATH, LIGHT_VALUATION_PATH
 
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), '../../config.yaml')
 
-def capture_light_valuation_image():
+
+def capture_light_valuation_image(config=None):
     """
     Executes the capture_light_valuation_image.py script to capture the light valuation image.
+
+    Parameters:
+        config (dict, optional): The camera's configuration dictionary, to select the camera.
     """
     script_path = os.path.join(os.path.dirname(__file__), 'capture_light_valuation_image.py')
-    subprocess.run(['python3', script_path], check=True)
+    subprocess.run(['python3', script_path] + camera_args(config or {}), check=True)
     print("Image capture completed.")
 
 
@@ -34,23 +43,23 @@ def evaluate_light_level(image_path):
     return light_level
 
 
-def save_values_to_file(light_level, iso, shutter_speed, file_path='temp/last_measurement.json'):
+def save_values_to_file(light_level, iso, shutter_speed, config=None):
     """
-    Saves the light level, ISO, and shutter speed to a JSON file.
+    Saves the light level, ISO, and shutter speed to temp/last_measurement.json (its live copy in
+    the staging folder, if configured).
     
     Parameters:
         light_level (float): The measured light level.
         iso (int or str): The calculated ISO value.
         shutter_speed (int or str): The calculated shutter speed in microseconds.
-        file_path (str): The file path to save the values.
+        config (dict, optional): The configuration dictionary.
     """
     data = {
         "light_level": light_level,
         "iso": iso,
         "shutter_speed": shutter_speed
     }
-    with open(file_path, 'w') as file:
-        json.dump(data, file)
+    file_path = write_json_state(config, LAST_MEASUREMENT_PATH, data, indent=None)
     print(f"Values saved to {file_path}")
 
 
@@ -74,17 +83,22 @@ def load_values_from_file(file_path='temp/last_measurement.json'):
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Meter the light and store the ISO and shutter speed to use.')
+    parser.add_argument('--camera', type=int, help='Camera index from the cameras list in config.yaml.')
+    args = parser.parse_args()
+    config = camera_config(load_config(CONFIG_PATH), args.camera)
+
     # Capture the light valuation image
-    capture_light_valuation_image()
+    capture_light_valuation_image(config)
     
     # Path to the captured image
-    image_path = os.path.join('temp', 'light_valuation.jpg')
+    image_path = live_path(config, LIGHT_VALUATION_PATH)
     
     # Evaluate the light level of the captured image
     light_level = evaluate_light_level(image_path)
     
     # Load the previously stored evaluation values (from the JSON file)
-    metadata_file_path = os.path.join('data', 'evaluation_measure.json')
+    metadata_file_path = readable_path(config, EVALUATION_METADATA_PATH)
     with open(metadata_file_path, 'r') as f:
         evaluated_values = json.load(f)
 
@@ -92,9 +106,9 @@ if __name__ == "__main__":
     evaluated_lux = evaluated_values.get("Lux", None)  # If not found, fallback to calculated light level
     evaluated_exposure_time = evaluated_values.get("ExposureTime", None)
 
-    iso, shutter_speed, _ = calculate_iso_and_shutter(light_level)
+    iso, shutter_speed, _ = calculate_iso_and_shutter(light_level, config)
     # Save the values to a JSON file
-    save_values_to_file(light_level, iso, shutter_speed)
+    save_values_to_file(light_level, iso, shutter_speed, config)
 
     # Store Lux, ExposureTime, and datetime in the database
     insert_evaluation(evaluated_lux=evaluated_lux, evaluated_exposure_time=evaluated_exposure_time)
@@ -1,10 +1,16 @@
+import argparse
 import os
-import time
+import sys
 import yaml
-import json
 from picamera2 import Picamera2
 import libcamera
 
+# Add the root directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from scripts.config.cameras import camera_config, camera_index
+from scripts.image.settle_detector import SettleDetector, capture_settled_request, SETTLE_TIMEOUT
+from scripts.storage.write_path import live_path, write_json_state, EVALUATION_METADATA_PATH, LIGHT_VALUATION_PATH
+
 def load_config(config_path):
     """
     Loads the configuration from a YAML file.
@@ -28,51 +34,47 @@ def create_directory_if_not_exists(directory):
     if not os.path.exists(directory):
         os.makedirs(directory)
 
-def save_metadata(metadata, output_path):
+def save_metadata(metadata, config):
     """
-    Saves the metadata to a JSON file.
+    Saves the metadata to data/evaluation_measure.json (its live copy in the staging folder, if configured).
 
     Parameters:
         metadata (dict): The metadata to save.
-        output_path (str): The file path to save the metadata.
+        config (dict): The configuration dictionary.
     """
-    with open(output_path, 'w') as json_file:
-        json.dump(metadata, json_file, indent=4)
+    output_path = write_json_state(config, EVALUATION_METADATA_PATH, metadata)
     print(f"Metadata saved to {output_path}")
 
-def capture_light_valuation_image():
+def capture_light_valuation_image(camera=None):
     """
     Captures an image for light valuation using the lores size settings from config.yaml.
     Saves the image to temp/light_valuation.jpg and stores metadata in data/evaluation_measure.json.
+
+    Parameters:
+        camera (int, optional): Camera index from the cameras list in config.yaml (default camera if None).
     """
     # Load configuration
     config_path = os.path.join(os.path.dirname(__file__), '../../config.yaml')
-    config = load_config(config_path)
-
-    # Create the output directory if it doesn't exist
-    temp_directory = 'temp'
-    create_directory_if_not_exists(temp_directory)
-    output_path = os.path.join(temp_directory, 'light_valuation.jpg')
+    config = camera_config(load_config(config_path), camera)
 
-    # Path to save the metadata
-    data_directory = os.path.join(os.path.dirname(__file__), '../../data')
-    create_directory_if_not_exists(data_directory)
-    metadata_output_path = os.path.join(data_directory, 'evaluation_measure.json')
+    # Scratch image location (temp/, or the staging folder so it never touches the SD card)
+    output_path = live_path(config, LIGHT_VALUATION_PATH)
+    create_directory_if_not_exists(os.path.dirname(output_path))
 
     # Initialize the camera with the lores size
-    picam2 = Picamera2()
-    camera_config = picam2.create_still_configuration(
+    picam2 = Picamera2(camera_index(config))
+    still_config = picam2.create_still_configuration(
         main={"size": tuple(config['camera_settings']['main_size'])},  # Set main to lores_size
         lores={"size": tuple(config['camera_settings']['lores_size'])},
         controls={"AfMode": libcamera.controls.AfModeEnum.Manual}  # Assuming manual focus
     )
-    picam2.configure(camera_config)
+    picam2.configure(still_config)
 
     # Start the camera and capture the image
     picam2.start()
     
-    # Capture image and metadata
-    request = picam2.capture_request()
+    # Capture image and metadata as soon as auto exposure has converged
+    request, _ = capture_settled_request(picam2, SettleDetector(), timeout=config['camera_settings'].get('settle_timeout', SETTLE_TIMEOUT), label="light valuation")
     if request is not None:
         request.save("main", output_path)
         metadata = request.get_metadata()  # Retrieve metadata
@@ -81,14 +83,17 @@ def capture_light_valuation_image():
         print("Failed to capture image.")
         metadata = {}
 
-    # Stop the camera
+    # Stop and release the camera
     picam2.stop()
-    time.sleep(2)
+    picam2.close()
 
     print(f"Light valuation image saved to {output_path}")
 
     # Save metadata to JSON file
-    save_metadata(metadata, metadata_output_path)
+    save_metadata(metadata, config)
 
 if __name__ == "__main__":
-    capture_light_valuation_image()
+    parser = argparse.ArgumentParser(description='Capture the light valuation image.')
+    parser.add_argument('--camera', type=int, help='Camera index from the cameras list in config.yaml.')
+    args = parser.parse_args()
+    capture_light_valuation_image(args.camera)
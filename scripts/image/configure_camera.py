@@ -1,9 +1,10 @@
 # scripts/image/configure_camera.py
 
-import libcamera
-from scripts.image.set_hdr_status import set_hdr_state  # Importing HDR functions
+from scripts.image.set_hdr_status import get_hdr_controller  # Importing HDR functions
+
+def configure_camera(picam2, config, daylight, iso=None, shutter_speed=None, logger=None, raw=False):
+    import libcamera  # Only needed once the camera is opened
 
-def configure_camera(picam2, config, daylight, iso=None, shutter_speed=None, logger=None):
     focus_mode = libcamera.controls.AfModeEnum.Manual if config['camera_settings']['focus_mode'] == 'manual' else libcamera.controls.AfModeEnum.Auto # type: ignore
     lens_position = config['camera_settings']['lens_position'] if config['camera_settings']['focus_mode'] == 'manual' else None
 
@@ -31,11 +32,18 @@ def configure_camera(picam2, config, daylight, iso=None, shutter_speed=None, log
     if daylight and exposure_value is not None:
         controls["ExposureValue"] = exposure_value  # Apply exposure compensation
         
-    set_hdr_state(daylight and config['camera_settings']['hdr'], logger)  # Set HDR based on daylight and config
+    get_hdr_controller(config).set_state(daylight and config['camera_settings']['hdr'], logger)  # Set HDR based on daylight and config
+
+    # Raw captures also get the full sensor readout, unpacked so it can be stored without conversion
+    raw_stream = None
+    if raw:
+        from scripts.image.raw_capture import unpacked_format
+        raw_stream = {"format": unpacked_format(str(picam2.sensor_format)), "size": picam2.sensor_resolution}
 
     return picam2.create_still_configuration(
         main={"size": tuple(config['camera_settings']['main_size'])},
         lores={"size": tuple(config['camera_settings']['lores_size'])},
+        raw=raw_stream,
         display=config['camera_settings']['display'],
         controls=controls
     )
@@ -1,37 +1,163 @@
+# scripts/image/crop_image.py
+
+import argparse
+import concurrent.futures
 import os
-from PIL import Image
+import shutil
+import subprocess
+
+import yaml
+from PIL import Image, JpegImagePlugin
+
+from scripts.image.image_tree import list_day_folders, list_frames, parse_date_range
+from scripts.storage.atomic_write import atomic_save_image, publish_file
+
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), '../../config.yaml')
+JPEGTRAN = shutil.which('jpegtran')
+WORKERS = os.cpu_count() or 2
+
 
-def crop_images_in_directory(directory):
+def load_config(config_path=CONFIG_PATH):
+    with open(config_path, 'r') as file:
+        return yaml.safe_load(file)
+
+
+def mcu_size(image):
     """
-    Crops the top 120 pixels from all images in the specified directory.
-    
+    Returns the (width, height) of a JPEG's minimum coded unit, the grid lossless crops are aligned to.
+    """
+    layers = getattr(image, 'layer', None) or [('', 1, 1, 0)]
+    return 8 * max(layer[1] for layer in layers), 8 * max(layer[2] for layer in layers)
+
+
+def crop_box(size, top=0, bottom=0, left=0, right=0, mcu=None):
+    """
+    Returns the (left, upper, right, lower) box that remains after cutting the given margins.
+
+    With `mcu`, the top and left margins are rounded to the nearest MCU boundary, so the crop can be
+    done losslessly (right and bottom edges never need alignment).
+    """
+    if mcu is not None:
+        left = round(left / mcu[0]) * mcu[0]
+        top = round(top / mcu[1]) * mcu[1]
+    box = (left, top, size[0] - right, size[1] - bottom)
+    if box[2] <= box[0] or box[3] <= box[1]:
+        raise ValueError(f"Crop margins leave nothing of a {size[0]}x{size[1]} image")
+    return box
+
+
+def crop_file(path, margins, source_size=None, snap=False, dry_run=False):
+    """
+    Crops one JPEG in place, losslessly with jpegtran when the crop is MCU-aligned.
+
+    Otherwise the image is re-encoded with its own quantization tables and chroma subsampling, so
+    the quality is not changed beyond the unavoidable generation loss. The result replaces the
+    original atomically. Frames that don't have `source_size` (e.g. already cropped) are skipped,
+    so an interrupted run can simply be repeated.
+
     Parameters:
-        directory (str): Path to the directory containing the images.
-    """
-    # List all image files in the directory
-    image_files = [f for f in os.listdir(directory) if f.endswith('.jpg')]
-
-    # Crop each image
-    for image_file in image_files:
-        image_path = os.path.join(directory, image_file)
-        image = Image.open(image_path)
-        
-        # Crop the top 120 pixels (adjust this value as needed)
-        cropped_image = image.crop((0, 120, image.width, image.height))
-        
-        # Save the cropped image, replacing the original
-        cropped_image.save(image_path)
-        print(f"Cropped and saved {image_file}")
+        path (str): The JPEG.
+        margins (dict): Pixels to cut: top, bottom, left, right.
+        source_size (tuple, optional): Only crop frames of this size.
+        snap (bool): Round the margins to the MCU grid so the crop is always lossless.
+        dry_run (bool): Only report what would be done.
+
+    Returns:
+        tuple: (path, method, bytes before, bytes after); method is 'lossless', 're-encoded' or 'skipped'.
+    """
+    before = os.path.getsize(path)
+    with Image.open(path) as image:
+        if image.format != 'JPEG' or (source_size and tuple(image.size) != tuple(source_size)):
+            return path, 'skipped', before, before
+        mcu = mcu_size(image)
+        box = crop_box(image.size, mcu=mcu if snap else None, **margins)
+        lossless = JPEGTRAN is not None and box[0] % mcu[0] == 0 and box[1] % mcu[1] == 0
+        if dry_run:
+            return path, 'lossless' if lossless else 're-encoded', before, before
+
+        tmp_path = f"{path}.tmp"
+        if lossless:
+            width, height = box[2] - box[0], box[3] - box[1]
+            subprocess.run([JPEGTRAN, '-copy', 'all', '-optimize', '-perfect', '-crop', f"{width}x{height}+{box[0]}+{box[1]}",
+                            '-outfile', tmp_path, path], check=True, capture_output=True)
+            publish_file(tmp_path, path)
+        else:
+            save_options = {
+                "qtables": image.quantization,
+                "subsampling": JpegImagePlugin.get_sampling(image),
+                "optimize": True,
+            }
+            for key in ('exif', 'icc_profile'):
+                if image.info.get(key):
+                    save_options[key] = image.info[key]
+            atomic_save_image(image.crop(box), path, **save_options)
+    return path, 'lossless' if lossless else 're-encoded', before, os.path.getsize(path)
+
+
+def crop_paths(paths, margins, source_size=None, snap=False, dry_run=False, workers=WORKERS):
+    """
+    Crops JPEGs in parallel worker processes.
+
+    Returns:
+        dict: Number of files per method.
+    """
+    counts = {}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(crop_file, path, margins, source_size, snap, dry_run) for path in paths]
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                path, method, before, after = future.result()
+            except Exception as e:
+                print(f"Error cropping: {e}")
+                method = 'failed'
+            counts[method] = counts.get(method, 0) + 1
+    return counts
+
+
+def frames_to_crop(config, start_date=None, end_date=None, folder=None):
+    """
+    Lists the frames of a folder, or of the image tree within a date range; references (symlinks) are left out.
+    """
+    extension = config['image_output'].get('image_extension', 'jpg')
+    folders = [folder] if folder else [day_folder for _, day_folder in list_day_folders(config, start_date, end_date)]
+    paths = []
+    for day_folder in folders:
+        paths += [os.path.join(day_folder, name) for name in list_frames(day_folder, extension) if not os.path.islink(os.path.join(day_folder, name))]
+    return paths
+
 
 if __name__ == "__main__":
-    # Directory containing the images
-    image_dir = "/var/www/html/lys-spjutvika/"
-    
-    # Confirmation prompt
-    response = input(f"Are you sure you want to crop the images in the directory '{image_dir}'? This action cannot be undone. (Yes/No): ")
-    
-    if response.lower() in ['yes', 'y']:
-        crop_images_in_directory(image_dir)
-        print("Cropping completed.")
-    else:
-        print("Operation cancelled.")
+    parser = argparse.ArgumentParser(description='Crop the frames of a date range (or a folder) in place.')
+    parser.add_argument('--from', dest='start', help='First date, YYYY-MM-DD.')
+    parser.add_argument('--to', dest='end', help='Last date, YYYY-MM-DD (defaults to --from).')
+    parser.add_argument('--folder', help='Crop the frames of this folder instead of a date range.')
+    parser.add_argument('--top', type=int, default=120, help='Pixels to cut at the top.')
+    parser.add_argument('--bottom', type=int, default=0, help='Pixels to cut at the bottom.')
+    parser.add_argument('--left', type=int, default=0, help='Pixels to cut at the left.')
+    parser.add_argument('--right', type=int, default=0, help='Pixels to cut at the right.')
+    parser.add_argument('--source-size', help='Only crop frames of this size, WxH (default: camera_settings.main_size).')
+    parser.add_argument('--snap', action='store_true', help='Round the top and left margins to the JPEG block grid, so every crop is lossless.')
+    parser.add_argument('--workers', type=int, default=WORKERS, help='Worker processes.')
+    parser.add_argument('--dry-run', action='store_true', help='Only show what would be done.')
+    parser.add_argument('--yes', action='store_true', help='Do not ask for confirmation.')
+    args = parser.parse_args()
+
+    if not args.start and not args.folder:
+        parser.error('give --from (and --to) or --folder')
+    config = load_config()
+    start_date, end_date = parse_date_range(args.start, args.end)
+    source_size = tuple(int(value) for value in args.source_size.split('x')) if args.source_size else config['camera_settings'].get('main_size')
+    margins = {"top": args.top, "bottom": args.bottom, "left": args.left, "right": args.right}
+    paths = frames_to_crop(config, start_date, end_date, args.folder)
+
+    if not args.dry_run and not args.yes:
+        response = input(f"Are you sure you want to crop {len(paths)} images? This action cannot be undone. (Yes/No): ")
+        if response.lower() not in ['yes', 'y']:
+            print("Operation cancelled.")
+            raise SystemExit(0)
+    if JPEGTRAN is None:
+        print("jpegtran not found; every crop will be re-encoded.")
+
+    counts = crop_paths(paths, margins, source_size, args.snap, args.dry_run, args.workers)
+    prefix = "Would crop" if args.dry_run else "Cropped"
+    print(f"{prefix} {len(paths)} images: " + ", ".join(f"{count} {method}" for method, count in counts.items()))
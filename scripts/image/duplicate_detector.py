@@ -0,0 +1,112 @@
+# scripts/image/duplicate_detector.py
+
+import os
+
+# numpy is imported where it is used: the video scripts only need DUPLICATE_TAG
+
+DUPLICATE_TAG = 'dup'  # Tag for near-duplicate frames that are stored but flagged
+
+# Defaults for the duplicates section of config.yaml
+THRESHOLD = 1.5  # Mean absolute difference (0-255) of the fingerprints below which a frame is a duplicate
+GRID_SIZE = (32, 18)  # Fingerprint size: the lores luma plane averaged down to this many blocks
+MAX_RUN = 30  # Store a real frame after this many duplicates in a row, so slow drift is still recorded
+ACTION = 'reference'  # 'reference' (symlink to the previous frame) or 'flag' (store with a _dup tag)
+
+
+def fingerprint(array, size, grid_size=GRID_SIZE):
+    """
+    Reduces a YUV420 lores frame to a tiny grid of average luma values.
+
+    Parameters:
+        array (numpy.ndarray): YUV420 lores buffer; only the luma rows are read.
+        size (tuple): (width, height) of the lores stream.
+        grid_size (tuple): (columns, rows) of the fingerprint.
+
+    Returns:
+        numpy.ndarray: float32 array of shape (rows, columns).
+    """
+    import numpy as np
+
+    width, height = size
+    columns, rows = grid_size
+    block_width, block_height = width // columns, height // rows
+    luma = array[:block_height * rows, :block_width * columns].astype(np.float32)
+    return luma.reshape(rows, block_height, columns, block_width).mean(axis=(1, 3))
+
+
+class DuplicateDetector:
+    """
+    Spots frames that are practically identical to the last stored frame.
+
+    Comparison is always against the last frame that was actually stored, not the previous duplicate,
+    so a slowly changing scene cannot drift away unnoticed; after `max_run` duplicates in a row a real
+    frame is stored regardless. References never cross into another day's folder.
+    """
+
+    def __init__(self, config):
+        settings = config.get('duplicates', {})
+        self.threshold = settings.get('threshold', THRESHOLD)
+        self.grid_size = tuple(settings.get('grid_size', GRID_SIZE))
+        self.max_run = settings.get('max_run', MAX_RUN)
+        self.action = settings.get('action', ACTION)
+        self.only_at_night = settings.get('only_at_night', True)
+
+        self.reference = None
+        self.reference_path = None
+        self.run = 0
+        self.difference = None
+
+    def is_duplicate(self, frame_print, file_name, daylight=False):
+        """
+        Checks a frame's fingerprint against the last stored frame.
+
+        Parameters:
+            frame_print (numpy.ndarray): Fingerprint of the new frame.
+            file_name (str): Path the new frame would be stored at.
+            daylight (bool): Whether daylight settings were used for the frame.
+
+        Returns:
+            bool: True if the frame can be treated as a duplicate.
+        """
+        self.difference = None
+        if self.reference is None or (self.only_at_night and daylight):
+            return False
+        if os.path.dirname(self.reference_path) != os.path.dirname(file_name) or not os.path.exists(self.reference_path):
+            return False
+        if self.run >= self.max_run:
+            return False
+
+        self.difference = float(abs(frame_print - self.reference).mean())
+        return self.difference < self.threshold
+
+    def stored(self, frame_print, file_name):
+        """
+        Registers a frame that was stored as a full image; it becomes the new reference.
+        """
+        self.reference = frame_print
+        self.reference_path = file_name
+        self.run = 0
+
+    def skipped(self):
+        """
+        Registers a frame that was treated as a duplicate.
+        """
+        self.run += 1
+
+
+_detectors = {}  # Camera id (None for a single camera) -> DuplicateDetector
+
+def get_duplicate_detector(config):
+    """
+    Returns the camera's duplicate detector, creating it on first use.
+
+    Parameters:
+        config (dict): The configuration dictionary.
+
+    Returns:
+        DuplicateDetector: The shared detector.
+    """
+    key = config.get('camera_id')
+    if key not in _detectors:
+        _detectors[key] = DuplicateDetector(config)
+    return _detectors[key]
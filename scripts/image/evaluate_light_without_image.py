@@ -1,11 +1,16 @@
+import argparse
 import os
-import json
-import time
+import sys
 from picamera2 import Picamera2
 
-# Paths for storing metadata
-DATA_DIR = os.path.join(os.path.dirname(__file__), '../../data')
-METADATA_FILE = os.path.join(DATA_DIR, 'evaluation_measure.json')
+# Add the root directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from scripts.image.settle_detector import SettleDetector, wait_for_settle
+from scripts.config.config_loader import load_config
+from scripts.config.cameras import camera_config, camera_index
+from scripts.storage.write_path import write_json_state, EVALUATION_METADATA_PATH
+
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), '../../config.yaml')
 
 def create_directory_if_not_exists(directory):
     """
@@ -17,29 +22,33 @@ def create_directory_if_not_exists(directory):
     if not os.path.exists(directory):
         os.makedirs(directory)
 
-def evaluate_light_level_without_image():
+def evaluate_light_level_without_image(config=None):
     """
     Evaluates the light level using the camera sensor without saving an image.
+
+    Parameters:
+        config (dict, optional): The camera's configuration dictionary (default camera if None).
     
     Returns:
         dict: The metadata dictionary including Lux value.
     """
     # Initialize the camera
-    picam2 = Picamera2()
+    picam2 = Picamera2(camera_index(config))
     
     # Configure the camera for minimal preview (no need for high resolution)
     preview_config = picam2.create_preview_configuration(main={"size": (640, 480)})
     picam2.configure("preview")
     
-    # Start the camera for a brief period to gather sensor data
+    # Start the camera and gather sensor data until auto exposure has converged
     picam2.start()
-    time.sleep(1)  # Allow camera to warm up and gather data
+    result = wait_for_settle(picam2, SettleDetector())
 
-    # Capture sensor metadata
-    metadata = picam2.capture_metadata()
+    # Use the metadata of the last (settled) frame
+    metadata = result.metadata
     
-    # Stop the camera
+    # Stop and release the camera
     picam2.stop()
+    picam2.close()
 
     # Extract the Lux value for display purposes
     lux = metadata.get('Lux', 'N/A') if metadata else 'N/A'
@@ -48,24 +57,25 @@ def evaluate_light_level_without_image():
     # Return the full metadata dictionary
     return metadata
 
-def save_metadata_to_file(metadata, file_path):
+def save_metadata_to_file(metadata, config):
     """
-    Saves the metadata to a JSON file.
+    Saves the metadata to data/evaluation_measure.json (its live copy in the staging folder, if configured).
 
     Parameters:
         metadata (dict): The metadata to save.
-        file_path (str): The file path to save the metadata.
+        config (dict): The configuration dictionary.
     """
-    with open(file_path, 'w') as json_file:
-        json.dump(metadata, json_file, indent=4)
+    file_path = write_json_state(config, EVALUATION_METADATA_PATH, metadata)
     print(f"Metadata saved to {file_path}")
 
 if __name__ == "__main__":
-    # Create the data directory if it doesn't exist
-    create_directory_if_not_exists(DATA_DIR)
+    parser = argparse.ArgumentParser(description='Evaluate the light level from the sensor metadata, without an image.')
+    parser.add_argument('--camera', type=int, help='Camera index from the cameras list in config.yaml.')
+    args = parser.parse_args()
+    config = camera_config(load_config(CONFIG_PATH), args.camera)
 
     # Evaluate light level without saving an image
-    metadata = evaluate_light_level_without_image()
+    metadata = evaluate_light_level_without_image(config)
 
     # Save the metadata to a JSON file
-    save_metadata_to_file(metadata, METADATA_FILE)
+    save_metadata_to_file(metadata, config)
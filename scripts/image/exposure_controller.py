@@ -0,0 +1,196 @@
+# scripts/image/exposure_controller.py
+
+import json
+import math
+import os
+import time
+from collections import deque, namedtuple
+
+from scripts.storage.write_path import readable_path, CAPTURE_METADATA_PATH, EVALUATION_METADATA_PATH, LAST_MEASUREMENT_PATH
+
+# Defaults for the exposure_control section of config.yaml
+HISTORY_SIZE = 20  # Number of metering samples and captures to remember
+MAX_METERING_AGE = 600  # Seconds after which a metering capture is forced regardless of confidence
+MAX_LUX_STEP = 0.5  # Stops of Lux change between two captures that still count as predictable
+MAX_EXTRAPOLATION = 0.5  # Stops between the current Lux and the nearest metered sample
+MAX_INTERPOLATION_SPAN = 2.0  # Widest gap, in stops, between two metered samples that may be interpolated
+SMOOTHING = 0.5  # Weight of the newest light level in the moving average (1 disables smoothing)
+HYSTERESIS = 5  # Light level band around daylight_threshold before switching day/night mode
+
+Sample = namedtuple('Sample', ['time', 'lux', 'light_level'])
+Prediction = namedtuple('Prediction', ['light_level', 'confident', 'reason'])
+
+
+def _stops(lux_a, lux_b):
+    """
+    Returns the distance between two Lux values in stops (powers of two).
+    """
+    return abs(math.log2(max(lux_a, 0.01) / max(lux_b, 0.01)))
+
+
+class ExposureController:
+    """
+    Predicts the light level from the previous frame's metadata so most cycles can skip the metering capture.
+
+    Every metering capture records a (Lux, light level) pair. Later cycles look up the Lux of the last
+    still in those pairs and interpolate the light level. The prediction is only trusted when the light
+    is changing slowly, the last metering is recent, and the Lux value is close to one that has actually
+    been metered; otherwise the caller runs a metering capture.
+
+    The chosen level is smoothed with a moving average and the daylight switch only flips once the
+    level leaves a hysteresis band around daylight_threshold, so exposure does not oscillate.
+    """
+
+    def __init__(self, config, clock=time.time):
+        settings = config.get('exposure_control', {})
+        self.config = config
+        self.light_settings = config['light_settings']
+        self.max_metering_age = settings.get('max_metering_age', MAX_METERING_AGE)
+        self.max_lux_step = settings.get('max_lux_step', MAX_LUX_STEP)
+        self.max_extrapolation = settings.get('max_extrapolation', MAX_EXTRAPOLATION)
+        self.max_interpolation_span = settings.get('max_interpolation_span', MAX_INTERPOLATION_SPAN)
+        self.smoothing = settings.get('smoothing', SMOOTHING)
+        self.hysteresis = settings.get('hysteresis', HYSTERESIS)
+        self.clock = clock
+
+        history_size = settings.get('history_size', HISTORY_SIZE)
+        self.meterings = deque(maxlen=history_size)
+        self.captures = deque(maxlen=history_size)
+        self.smoothed_level = None
+        self.daylight = None
+        self.metering_requested = False
+
+    def record_metering(self, light_level, lux, timestamp=None):
+        """
+        Stores the result of a dedicated metering capture.
+
+        Parameters:
+            light_level (float): Light level measured from the metering image.
+            lux (float): Lux reported in the metering frame's metadata.
+            timestamp (float, optional): When the metering happened, defaults to now.
+        """
+        if light_level is None or lux is None:
+            return
+        self.meterings.append(Sample(timestamp or self.clock(), lux, light_level))
+        self.metering_requested = False
+
+    def record_capture(self, metadata, timestamp=None):
+        """
+        Stores the Lux of a captured still so the next cycle can predict from it.
+
+        Parameters:
+            metadata (dict): The still's metadata (must contain Lux).
+            timestamp (float, optional): When the still was captured, defaults to now.
+        """
+        if metadata and metadata.get('Lux') is not None:
+            self.captures.append(Sample(timestamp or self.clock(), metadata['Lux'], None))
+
+    def predict(self):
+        """
+        Predicts the current light level from the most recent still.
+
+        Returns:
+            Prediction: The predicted level (None if unavailable), whether it can be trusted and why not.
+        """
+        if not self.captures or not self.meterings:
+            return Prediction(None, False, "no history")
+        if self.metering_requested:
+            return Prediction(None, False, "metering requested")
+
+        now = self.clock()
+        if now - self.meterings[-1].time > self.max_metering_age:
+            return Prediction(None, False, "metering too old")
+
+        lux = self.captures[-1].lux
+        if len(self.captures) > 1 and _stops(lux, self.captures[-2].lux) > self.max_lux_step:
+            return Prediction(None, False, "light changing fast")
+
+        # Interpolate in log-Lux between the metered samples on either side of the current Lux
+        samples = sorted(self.meterings, key=lambda sample: sample.lux)
+        below = [sample for sample in samples if sample.lux <= lux]
+        above = [sample for sample in samples if sample.lux > lux]
+        if below and above and _stops(below[-1].lux, above[0].lux) <= self.max_interpolation_span:
+            low, high = below[-1], above[0]
+            position = math.log2(max(lux, 0.01) / max(low.lux, 0.01)) / math.log2(max(high.lux, 0.01) / max(low.lux, 0.01))
+            return Prediction(low.light_level + position * (high.light_level - low.light_level), True, None)
+
+        # Otherwise only trust a metered sample taken at nearly the same Lux
+        nearest = min(samples, key=lambda sample: _stops(sample.lux, lux))
+        if _stops(nearest.lux, lux) > self.max_extrapolation:
+            return Prediction(None, False, "lux outside metered range")
+        return Prediction(nearest.light_level, True, None)
+
+    def target_level(self, light_level, reset=False):
+        """
+        Smooths a light level and applies hysteresis around the daylight threshold.
+
+        Parameters:
+            light_level (float): The measured or predicted light level.
+            reset (bool): Drop the moving average and follow the new level at once (used after fast light changes).
+
+        Returns:
+            float: The light level to hand to calculate_iso_and_shutter.
+        """
+        if self.smoothed_level is None or reset:
+            self.smoothed_level = light_level
+        else:
+            self.smoothed_level = self.smoothing * light_level + (1 - self.smoothing) * self.smoothed_level
+
+        daylight_threshold = self.light_settings['daylight_threshold']
+        if self.daylight is None:
+            self.daylight = self.smoothed_level >= daylight_threshold
+        elif self.daylight and self.smoothed_level < daylight_threshold - self.hysteresis:
+            self.daylight = False
+        elif not self.daylight and self.smoothed_level >= daylight_threshold + self.hysteresis:
+            self.daylight = True
+
+        # Keep the level on the side of the threshold that matches the current mode
+        if self.daylight:
+            return max(self.smoothed_level, daylight_threshold)
+        return min(self.smoothed_level, daylight_threshold - 0.1)
+
+    def force_metering(self):
+        """
+        Makes the next prediction untrusted, e.g. ahead of a known change in light.
+        """
+        self.metering_requested = True
+
+    def load_previous_state(self):
+        """
+        Seeds the history from the files written by the previous run, so a restart does not
+        throw away the last frame's metadata.
+        """
+        last_measurement_path = readable_path(self.config, LAST_MEASUREMENT_PATH)
+        evaluation_path = readable_path(self.config, EVALUATION_METADATA_PATH)
+        capture_path = readable_path(self.config, CAPTURE_METADATA_PATH)
+        try:
+            if os.path.exists(last_measurement_path) and os.path.exists(evaluation_path):
+                with open(last_measurement_path, 'r') as f:
+                    light_level = json.load(f).get('light_level')
+                with open(evaluation_path, 'r') as f:
+                    lux = json.load(f).get('Lux')
+                self.record_metering(light_level, lux, os.path.getmtime(last_measurement_path))
+            if os.path.exists(capture_path):
+                with open(capture_path, 'r') as f:
+                    self.record_capture(json.load(f), os.path.getmtime(capture_path))
+        except Exception as e:
+            print(f"Error loading previous exposure state: {e}")
+
+
+_controllers = {}  # Camera id (None for a single camera) -> ExposureController
+
+def get_exposure_controller(config):
+    """
+    Returns the camera's exposure controller, creating and seeding it on first use.
+
+    Parameters:
+        config (dict): The configuration dictionary.
+
+    Returns:
+        ExposureController: The shared controller.
+    """
+    key = config.get('camera_id')
+    if key not in _controllers:
+        _controllers[key] = ExposureController(config)
+        _controllers[key].load_previous_state()
+    return _controllers[key]
@@ -0,0 +1,48 @@
+# scripts/image/frame_names.py
+
+import os
+import re
+from datetime import datetime
+
+TIMESTAMP_FORMAT = '%Y_%m_%d_%H_%M_%S'
+EVENT_TAG = 'event'  # Extra frame captured because the scene changed
+
+FRAME_NAME_PATTERN = re.compile(r'(\d{4}_\d{2}_\d{2}_\d{2}_\d{2}_\d{2})(?:_([a-z]+))?\.\w+$')
+
+
+def build_frame_path(config, when, tag=None):
+    """
+    Builds the full path of a frame in the image tree, e.g. /var/www/html/images/2024/08/02/kringelen_2024_08_02_12_00_00.jpg.
+
+    Parameters:
+        config (dict): The configuration dictionary.
+        when (datetime): Capture time.
+        tag (str, optional): Tag appended to the name, e.g. 'event' for scene-change captures.
+
+    Returns:
+        str: The frame path.
+    """
+    image_output = config['image_output']
+    dir_name = os.path.join(image_output['root_folder'], when.strftime(image_output['folder_structure']))
+    suffix = f"_{tag}" if tag else ""
+    return os.path.join(dir_name, f"{image_output['filename_prefix']}{when.strftime(TIMESTAMP_FORMAT)}{suffix}.{image_output['image_extension']}")
+
+
+def parse_frame_name(file_name):
+    """
+    Extracts the capture time and tag from a frame's file name.
+
+    Parameters:
+        file_name (str): File name or path of the frame.
+
+    Returns:
+        tuple: (datetime, tag) where tag is None for regular frames, or (None, None) if the name doesn't match.
+    """
+    match = FRAME_NAME_PATTERN.search(os.path.basename(file_name))
+    if not match:
+        return None, None
+    return datetime.strptime(match.group(1), TIMESTAMP_FORMAT), match.group(2)
+
+
+def is_event_frame(file_name):
+    return parse_frame_name(file_name)[1] == EVENT_TAG
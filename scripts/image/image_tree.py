@@ -0,0 +1,107 @@
+# scripts/image/image_tree.py
+
+import datetime
+import os
+
+
+def day_folder(config, day):
+    """
+    Returns the image folder of a date, e.g. /var/www/html/images/2024/08/02/.
+
+    Parameters:
+        config (dict): The configuration dictionary.
+        day (date): The date.
+
+    Returns:
+        str: The folder path.
+    """
+    return os.path.join(config['image_output']['root_folder'], day.strftime(config['image_output']['folder_structure']))
+
+
+def list_day_folders(config, start_date=None, end_date=None, root_folder=None, folder_structure=None):
+    """
+    Lists the day folders that exist in the image tree, oldest first.
+
+    Folders are found by walking the tree to the depth of `folder_structure` and parsing each path
+    with it, so no day is ever probed that isn't on disk.
+
+    Parameters:
+        config (dict): The configuration dictionary.
+        start_date (date, optional): First date to include.
+        end_date (date, optional): Last date to include.
+        root_folder (str, optional): Tree to walk instead of image_output.root_folder.
+        folder_structure (str, optional): Folder format instead of image_output.folder_structure.
+
+    Returns:
+        list: (date, folder) tuples sorted by date.
+    """
+    root_folder = root_folder or config['image_output']['root_folder']
+    folder_structure = (folder_structure or config['image_output']['folder_structure']).strip('/')
+    depth = folder_structure.count('/') + 1
+
+    days = []
+    if not os.path.isdir(root_folder):
+        return days
+
+    for current, dirs, _ in os.walk(root_folder):
+        relative = os.path.relpath(current, root_folder)
+        level = 0 if relative == '.' else relative.count(os.sep) + 1
+        if level < depth:
+            dirs.sort()
+            continue
+        dirs[:] = []
+        try:
+            day = datetime.datetime.strptime(relative.replace(os.sep, '/'), folder_structure).date()
+        except ValueError:
+            continue
+        if (start_date and day < start_date) or (end_date and day > end_date):
+            continue
+        days.append((day, current))
+
+    return sorted(days)
+
+
+def list_frames(folder, extension='jpg'):
+    """
+    Lists the frame files of a day folder in name (= capture time) order.
+
+    Parameters:
+        folder (str): The day folder.
+        extension (str): Image file extension.
+
+    Returns:
+        list: File names.
+    """
+    return sorted(name for name in os.listdir(folder) if name.endswith(f".{extension}") and not name.startswith('.'))
+
+
+def video_path_for_day(config, day):
+    """
+    Returns where create-timelapse stores the video of a date.
+
+    Parameters:
+        config (dict): The configuration dictionary.
+        day (date): The date.
+
+    Returns:
+        str: The video path.
+    """
+    video_output = config['video_output']
+    video_folder = os.path.join(video_output['root_folder'], day.strftime(video_output['folder_structure']))
+    return os.path.join(video_folder, f"{video_output['filename_prefix']}{day.strftime('%Y_%m_%d')}.{video_output['video_format']}")
+
+
+def parse_date_range(start, end=None):
+    """
+    Parses YYYY-MM-DD command-line dates into a (start, end) pair of dates.
+
+    Parameters:
+        start (str): First date, or None for no lower bound.
+        end (str, optional): Last date, defaults to `start`.
+
+    Returns:
+        tuple: (start_date, end_date), either may be None.
+    """
+    start_date = datetime.datetime.strptime(start, '%Y-%m-%d').date() if start else None
+    end_date = datetime.datetime.strptime(end, '%Y-%m-%d').date() if end else start_date
+    return start_date, end_date
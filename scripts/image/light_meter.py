@@ -1,6 +1,3 @@
-from PIL import Image
-import numpy as np
-
 def calculate_light_level(image_path):
     """
     Calculates the average brightness of an image.
@@ -11,14 +8,14 @@ def calculate_light_level(image_path):
     Returns:
         float: A value representing the average brightness of the image.
     """
+    from PIL import Image, ImageStat
+
     # Open the image
     with Image.open(image_path) as img:
         # Convert the image to grayscale
         grayscale_img = img.convert("L")
-        # Convert the image data to a numpy array
-        image_array = np.array(grayscale_img)
-        # Calculate the mean brightness
-        light_level = np.mean(image_array)
+        # Calculate the mean brightness from the histogram (no full-frame array copy)
+        light_level = ImageStat.Stat(grayscale_img).mean[0]
     
     return light_level
 
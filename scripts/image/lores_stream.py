@@ -0,0 +1,67 @@
+# scripts/image/lores_stream.py
+
+import time
+from picamera2 import Picamera2
+from scripts.config.cameras import camera_index
+from scripts.log.logging import log_message
+
+
+def stream_lores_frames(config, deadline, on_frame, keep_running, max_fps=5, logger=None):
+    """
+    Opens the camera and hands lores frames to a callback until the deadline passes.
+
+    Used between stills: the camera is opened only for the idle part of the interval and is
+    always closed again before the deadline, so the next scheduled capture can open it.
+
+    Parameters:
+        config (dict): The configuration dictionary.
+        deadline (float): time.time() value at which the camera must be released.
+        on_frame (callable): Called as on_frame(array, size, stride) for every lores frame.
+        keep_running (callable): Returns False when streaming should stop early (e.g. no clients left).
+        max_fps (float): Upper bound on the frame rate.
+        logger (logging.Logger, optional): Logger for status messages.
+
+    Returns:
+        int: The number of frames delivered.
+    """
+    frame_period = 1.0 / max_fps
+    lores_size = tuple(config['camera_settings']['lores_size'])
+
+    picam2 = None
+    frames = 0
+    try:
+        # Opened inside the try: a busy camera or a libcamera error must not end the timelapse loop
+        picam2 = Picamera2(camera_index(config))
+        # Keep main at the lores size so the ISP isn't producing 4K buffers nobody looks at
+        stream_config = picam2.create_video_configuration(
+            main={"size": lores_size},
+            lores={"size": lores_size},
+            controls={"FrameDurationLimits": (int(frame_period * 1000000), int(frame_period * 1000000))},
+        )
+        picam2.configure(stream_config)
+        lores_config = picam2.camera_configuration()['lores']
+        size, stride = lores_config['size'], lores_config['stride']
+        picam2.start()
+
+        next_frame = time.time()
+        while time.time() < deadline and keep_running():
+            array = picam2.capture_array("lores")
+            on_frame(array, size, stride)
+            frames += 1
+
+            next_frame += frame_period
+            sleep_for = min(next_frame, deadline) - time.time()
+            if sleep_for > 0:
+                time.sleep(sleep_for)
+            else:
+                next_frame = time.time()
+    except Exception as e:
+        print(f"Error while streaming lores frames: {e}")
+        if logger:
+            log_message(logger, f"Error while streaming lores frames: {e}")
+    finally:
+        if picam2 is not None:
+            picam2.stop()
+            picam2.close()
+
+    return frames
@@ -0,0 +1,245 @@
+# scripts/image/night_stack.py
+
+import math
+import time
+
+import numpy as np
+from PIL import Image
+
+# Defaults for the night_stack section of config.yaml
+FRAMES = 8  # Exposures per stacked frame
+MODE = 'sigma_clip'  # 'mean', 'sigma_clip' or 'median'
+SIGMA = 3.0  # Rejection threshold of sigma_clip, in standard deviations
+MAX_GAIN = 16.0  # Highest analogue gain used to make up for the shorter exposures
+MEDIAN_MAX_FRAMES = 5  # Frames kept in memory by the median mode
+NOISE_FLOOR = 2.0  # Deviation (in 8-bit levels) never rejected, so a still scene keeps all samples
+CHUNK_ROWS = 64  # Rows combined at a time, so the float temporaries stay small
+SEED_FRAMES = 3  # Exposures sigma_clip keeps to start its statistics from their median
+
+MODES = ('mean', 'sigma_clip', 'median')
+
+
+def stack_plan(config, daylight, iso, shutter_speed):
+    """
+    Works out the exposures of a stacked night frame.
+
+    The long exposure (shutter_speed x iso) is split into shorter exposures with a higher gain so
+    each one is as bright as the long exposure; averaging them then lowers the noise instead of the
+    brightness. The exposures together take as long as the long exposure; when the gain limit does
+    not allow `frames` exposures, fewer are taken. Combining the exposures takes time as well (sigma_clip
+    most), so capture_stack() stops early when the stack would take longer than max_seconds
+    (night_stack.max_seconds, by default camera_settings.interval).
+
+    Parameters:
+        config (dict): The configuration dictionary.
+        daylight (bool): Whether daylight settings are used (never stacked).
+        iso (float): Analogue gain of the long exposure.
+        shutter_speed (int or str): Long exposure in microseconds, or "auto".
+
+    Returns:
+        dict: frames, exposure (microseconds), gain, mode, sigma and max_seconds, or None if the frame is not stacked.
+    """
+    settings = config.get('night_stack', {})
+    if daylight or not settings.get('enabled', False) or shutter_speed == "auto" or iso == "auto":
+        return None
+    mode = settings.get('mode', MODE)
+    if mode not in MODES:
+        raise ValueError(f"Unknown night_stack mode: {mode}")
+    frames = settings.get('frames', FRAMES)
+    if mode == 'median':
+        frames = min(frames, settings.get('median_max_frames', MEDIAN_MAX_FRAMES))
+    if frames < 2:
+        return None
+
+    # Every exposure needs frames x the gain of the long exposure; past the gain limit fewer, longer
+    # exposures are taken, so the stack never takes longer than the long exposure it replaces
+    gain = float(iso or 1.0)
+    frames = min(frames, math.floor(settings.get('max_gain', MAX_GAIN) / gain))
+    if frames < 2:
+        return None
+    return {"frames": frames, "exposure": int(int(shutter_speed) / frames), "gain": round(gain * frames, 2), "mode": mode,
+            "sigma": settings.get('sigma', SIGMA), "max_seconds": settings.get('max_seconds', config.get('camera_settings', {}).get('interval'))}
+
+
+def median_of_samples(samples):
+    """
+    Returns the per-pixel median of a few uint8 exposures (first axis) as float32.
+
+    Three samples, the sigma_clip seed, are sorted with minimum and maximum on the 8-bit values,
+    which is many times faster than np.median.
+    """
+    if len(samples) == 3:
+        first, second, third = samples
+        return np.maximum(np.minimum(first, second), np.minimum(np.maximum(first, second), third)).astype(np.float32)
+    return np.median(samples, axis=0).astype(np.float32)
+
+
+class FrameStack:
+    """
+    Combines exposures of the same scene into one frame, one exposure at a time.
+
+    'mean' keeps a float32 sum. 'sigma_clip' keeps a running mean and variance per pixel (Welford)
+    and leaves out samples further than `sigma` standard deviations from the mean of the samples
+    taken so far (planes, satellites, cosmic-ray hits), so memory does not grow with the number of
+    exposures beyond the first three, which are kept to seed the statistics. 'median' keeps the 8-bit
+    exposures themselves and is limited to a few of them. Float temporaries are made a few rows at a
+    time, so a 4K stack needs little more than its running state.
+    """
+
+    def __init__(self, mode=MODE, sigma=SIGMA, max_frames=MEDIAN_MAX_FRAMES):
+        self.mode = mode
+        self.sigma = sigma
+        self.max_frames = max_frames
+        self.frames = 0
+        self.rejected = 0
+        self.shape = None
+        self.seed = None
+        self.buffers = None
+
+    def _chunks(self):
+        return [slice(row, row + CHUNK_ROWS) for row in range(0, self.shape[0], CHUNK_ROWS)]
+
+    def add(self, frame):
+        """
+        Adds one exposure (uint8 array, height x width x channels).
+        """
+        self.shape = frame.shape
+        if self.mode == 'median':
+            if self.buffers is None:
+                self.buffers = np.empty((self.max_frames,) + frame.shape, dtype=np.uint8)
+            if self.frames >= self.max_frames:
+                raise ValueError(f"The median stack holds at most {self.max_frames} frames")
+            self.buffers[self.frames] = frame
+            self.frames += 1
+            return
+
+        if self.mode == 'mean':
+            if self.buffers is None:
+                self.buffers = frame.astype(np.float32)
+            else:
+                np.add(self.buffers, frame, out=self.buffers)
+            self.frames += 1
+            return
+
+        self.frames += 1
+        if self.buffers is None:
+            # The first exposures seed the statistics from their median, so an outlier among them
+            # is rejected as well
+            if self.seed is None:
+                self.seed = np.empty((SEED_FRAMES,) + frame.shape, dtype=np.uint8)
+            self.seed[self.frames - 1] = frame
+            if self.frames == SEED_FRAMES:
+                self._seed(self.seed)
+                self.seed = None
+            return
+        mean, m2, count = self.buffers
+        # A few samples say little about one pixel's spread, so the frame-wide noise is a lower bound
+        floor = self._mean_variance()
+        for rows in self._chunks():
+            sample = frame[rows].astype(np.float32)
+            chunk_mean, chunk_m2, chunk_count = mean[rows], m2[rows], count[rows]
+            delta = sample - chunk_mean
+            # Rejection threshold, computed in place: sigma * sqrt(max(variance, floor)), at least NOISE_FLOOR
+            spread = chunk_m2 / np.maximum(chunk_count - 1, 1)
+            np.maximum(spread, floor, out=spread)
+            np.sqrt(spread, out=spread)
+            spread *= self.sigma
+            np.maximum(spread, NOISE_FLOOR, out=spread)
+            accept = np.abs(delta) <= spread
+            self.rejected += int(accept.size - np.count_nonzero(accept))
+            chunk_count += accept
+            # A rejected sample has no delta, so it changes neither the mean nor the variance
+            delta *= accept
+            chunk_mean += delta / chunk_count
+            sample -= chunk_mean
+            sample *= delta
+            chunk_m2 += sample
+
+    def _mean_variance(self):
+        _, m2, count = self.buffers
+        total = sum(float((m2[rows] / np.maximum(count[rows] - 1, 1)).sum(dtype=np.float64)) for rows in self._chunks())
+        return np.float32(total / m2.size)
+
+    def _seed(self, samples):
+        # Robust frame-wide noise estimate (median absolute deviation); the deviations of 8-bit samples
+        # are multiples of 0.5, so their median is taken from a histogram instead of one big array
+        histogram = np.zeros(512, dtype=np.int64)
+        for rows in self._chunks():
+            chunk = samples[:, rows].astype(np.float32)
+            deviation = np.abs(chunk - median_of_samples(samples[:, rows]))
+            histogram += np.bincount((deviation * 2).astype(np.int64).ravel(), minlength=512)
+        cumulative = np.cumsum(histogram)
+        middle = np.searchsorted(cumulative, [(cumulative[-1] - 1) // 2 + 1, cumulative[-1] // 2 + 1])
+        noise = 1.4826 * float(middle.mean()) / 2
+        threshold = max(self.sigma * noise, NOISE_FLOOR)
+
+        mean = np.empty(self.shape, dtype=np.float32)
+        m2 = np.empty(self.shape, dtype=np.float32)
+        count = np.empty(self.shape, dtype=np.uint16)
+        for rows in self._chunks():
+            chunk = samples[:, rows].astype(np.float32)
+            accept = np.abs(chunk - median_of_samples(samples[:, rows])) <= threshold
+            self.rejected += int(accept.size - np.count_nonzero(accept))
+            count[rows] = accept.sum(axis=0)
+            mean[rows] = (chunk * accept).sum(axis=0) / count[rows]
+            m2[rows] = (((chunk - mean[rows]) ** 2) * accept).sum(axis=0)
+        self.buffers = (mean, m2, count)
+
+    def result(self):
+        """
+        Returns the combined frame as a uint8 array.
+        """
+        if self.frames == 0:
+            raise ValueError("No frames were added to the stack")
+        combined = np.empty(self.shape, dtype=np.uint8)
+        for rows in self._chunks():
+            if self.mode == 'median':
+                combined[rows] = np.median(self.buffers[:self.frames, rows], axis=0).round()
+                continue
+            if self.mode == 'mean':
+                chunk = self.buffers[rows] / self.frames
+            elif self.buffers is None:
+                # Fewer exposures than needed to seed the statistics
+                chunk = np.median(self.seed[:self.frames, rows], axis=0)
+            else:
+                chunk = self.buffers[0][rows]
+            combined[rows] = np.clip(chunk + 0.5, 0, 255)
+        return combined
+
+
+def capture_stack(picam2, first_image, plan, clock=time.monotonic):
+    """
+    Captures the remaining exposures of a stacked frame back-to-back from the running camera.
+
+    Each exposure is as bright as the long exposure, so a stack cut short is only noisier: no
+    further exposure is taken once it and the time the slowest exposure so far took to combine
+    would end the stack after plan['max_seconds'] (counted from the start of the first exposure).
+
+    Parameters:
+        picam2 (Picamera2): The started camera, configured with the plan's exposure and gain.
+        first_image (PIL.Image.Image): The first, already captured exposure.
+        plan (dict): The stack plan, see stack_plan().
+        clock (callable, optional): Monotonic time in seconds.
+
+    Returns:
+        tuple: (PIL.Image.Image, FrameStack) the combined frame and the stack it was made from;
+        stack.frames is the number of exposures actually combined.
+    """
+    exposure = plan['exposure'] / 1e6
+    start = clock() - exposure
+    stack = FrameStack(plan['mode'], plan['sigma'], max_frames=plan['frames'])
+    added = clock()
+    stack.add(np.asarray(first_image.convert('RGB')))
+    slowest = clock() - added
+    for _ in range(plan['frames'] - 1):
+        if plan.get('max_seconds') and clock() - start + exposure + slowest > plan['max_seconds']:
+            break
+        request = picam2.capture_request()
+        try:
+            image = request.make_image("main").convert('RGB')
+        finally:
+            request.release()
+        added = clock()
+        stack.add(np.asarray(image))
+        slowest = max(slowest, clock() - added)
+    return Image.fromarray(stack.result()), stack
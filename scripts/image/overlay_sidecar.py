@@ -0,0 +1,72 @@
+# scripts/image/overlay_sidecar.py
+
+import json
+import os
+
+SIDECAR_FILE = '.overlay.jsonl'  # Per-day folder: one line of overlay fields per clean frame
+
+
+def sidecar_path(folder):
+    return os.path.join(folder, SIDECAR_FILE)
+
+
+def append_overlay_record(frame_path, fields):
+    """
+    Appends a frame's overlay fields to the sidecar of its folder.
+
+    The line is written with a single append, so a crash leaves at most one incomplete last line,
+    which load_overlay_records() skips.
+
+    Parameters:
+        frame_path (str): The published frame.
+        fields (dict): Overlay fields, see add_image_overlay.overlay_fields().
+
+    Returns:
+        int: Bytes written.
+    """
+    line = (json.dumps({"file": os.path.basename(frame_path), **fields}, separators=(',', ':')) + '\n').encode('utf-8')
+    fd = os.open(sidecar_path(os.path.dirname(frame_path)), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line)
+    finally:
+        os.close(fd)
+    return len(line)
+
+
+def load_overlay_records(folder):
+    """
+    Loads the overlay fields of a day folder.
+
+    Parameters:
+        folder (str): The day folder.
+
+    Returns:
+        dict: Frame file name -> overlay fields (empty if the folder has no sidecar).
+    """
+    records = {}
+    try:
+        with open(sidecar_path(folder), 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                records[record.pop('file')] = record
+    except OSError:
+        pass
+    return records
+
+
+class OverlayRecords:
+    """
+    Looks up the overlay fields of frames from any folder, loading each sidecar once.
+    """
+
+    def __init__(self):
+        self.folders = {}
+
+    def get(self, frame_path):
+        folder = os.path.dirname(frame_path)
+        if folder not in self.folders:
+            self.folders[folder] = load_overlay_records(folder)
+        return self.folders[folder].get(os.path.basename(frame_path))
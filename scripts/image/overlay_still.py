@@ -0,0 +1,107 @@
+# scripts/image/overlay_still.py
+
+import argparse
+import io
+import os
+
+import yaml
+from PIL import Image
+
+from scripts.image.add_image_overlay import QUALITY, draw_overlay
+from scripts.image.overlay_sidecar import load_overlay_records, sidecar_path
+from scripts.storage.atomic_write import atomic_write_bytes
+
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), '../../config.yaml')
+CACHE_FOLDER = os.path.join(os.path.dirname(__file__), '../../temp/stills')  # Default for overlay.still_cache
+
+
+def load_config(config_path=CONFIG_PATH):
+    with open(config_path, 'r') as file:
+        return yaml.safe_load(file)
+
+
+def latest_frame(config):
+    """
+    Returns the frame the status file currently points at.
+    """
+    status_file = config['image_output']['status_file']
+    # Not realpath: a near-duplicate reference has overlay fields of its own
+    return os.readlink(status_file) if os.path.islink(status_file) else status_file
+
+
+def _mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return 0
+
+
+def overlay_frame(image, fields, camera_name, overlay_image=None):
+    """
+    Draws the overlay onto a clean frame at the resolution it was captured at.
+
+    Parameters:
+        image (PIL.Image.Image): The clean frame (possibly downscaled by retention since).
+        fields (dict): The frame's overlay fields.
+        camera_name (str): Camera name shown at the top.
+        overlay_image (PIL.Image.Image, optional): The RGBA overlay graphic, if already loaded.
+
+    Returns:
+        PIL.Image.Image: The overlaid frame in RGB mode.
+    """
+    # The layout is made for the capture resolution
+    size = tuple(fields.get('size', image.size))
+    base = image if image.size == size else image.resize(size, Image.LANCZOS)
+    return draw_overlay(base, fields, camera_name, overlay_image)
+
+
+def render_still(config, frame_path, width=None, quality=QUALITY):
+    """
+    Returns a frame with its overlay, for frames stored clean (overlay.mode 'deferred').
+
+    Stills are rendered on request and cached until the frame or its sidecar changes. Frames
+    without overlay fields (captured with the overlay burned in) are only scaled.
+
+    Parameters:
+        config (dict): The configuration dictionary.
+        frame_path (str): The frame.
+        width (int, optional): Scale the still down to this width.
+        quality (int): JPEG quality.
+
+    Returns:
+        bytes: The JPEG still.
+    """
+    cache_folder = config.get('overlay', {}).get('still_cache', CACHE_FOLDER)
+    cache_path = os.path.join(cache_folder, f"{os.path.splitext(os.path.basename(frame_path))[0]}_{width or 'full'}.jpg")
+    folder = os.path.dirname(frame_path)
+    if _mtime(cache_path) >= max(_mtime(frame_path), _mtime(sidecar_path(folder))) > 0:
+        with open(cache_path, 'rb') as f:
+            return f.read()
+
+    fields = load_overlay_records(folder).get(os.path.basename(frame_path))
+    with Image.open(frame_path) as img:
+        if fields is None:
+            still = img.convert('RGB')
+        else:
+            still = overlay_frame(img, fields, config['camera_settings'].get('name', "Camera Name"))
+    if width and still.width > width:
+        still = still.resize((width, round(still.height * width / still.width)), Image.LANCZOS)
+
+    buffer = io.BytesIO()
+    still.save(buffer, "JPEG", quality=quality, optimize=True)
+    data = buffer.getvalue()
+    os.makedirs(cache_folder, exist_ok=True)
+    atomic_write_bytes(cache_path, data)
+    return data
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Render a frame stored without overlay with its overlay.')
+    parser.add_argument('frame', nargs='?', help='The frame (default: the latest one).')
+    parser.add_argument('--width', type=int, help='Scale the still down to this width.')
+    parser.add_argument('--output', required=True, help='Where to write the JPEG.')
+    args = parser.parse_args()
+
+    config = load_config()
+    data = render_still(config, args.frame or latest_frame(config), args.width)
+    atomic_write_bytes(args.output, data)
@@ -0,0 +1,179 @@
+# scripts/image/proxy_store.py
+
+import argparse
+import datetime
+import json
+import os
+import shutil
+
+import yaml
+from PIL import Image
+
+from scripts.image.frame_names import parse_frame_name
+from scripts.image.image_tree import day_folder, list_day_folders, list_frames, parse_date_range
+from scripts.log.logging import log_message
+from scripts.storage.atomic_write import atomic_save_image, atomic_write_bytes
+
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), '../../config.yaml')
+MARKER_FILE = '.proxies.json'  # Per-day record that the day's proxies are complete, and with which settings
+
+# Defaults for the proxies section of config.yaml
+ROOT_FOLDER = '/var/www/html/proxies/'
+WIDTH = 1280  # Proxy width in pixels; the height follows the aspect ratio
+QUALITY = 80  # JPEG quality of proxies
+INTERVAL = 10  # Minutes between proxies: one regular frame is kept per interval
+
+
+def load_config(config_path=CONFIG_PATH):
+    with open(config_path, 'r') as file:
+        return yaml.safe_load(file)
+
+
+def proxy_settings(config):
+    settings = config.get('proxies', {})
+    return {
+        "root_folder": settings.get('root_folder', ROOT_FOLDER),
+        "width": settings.get('width', WIDTH),
+        "quality": settings.get('quality', QUALITY),
+        "interval": settings.get('interval', INTERVAL),
+    }
+
+
+def proxy_day_folder(config, day):
+    return os.path.join(proxy_settings(config)['root_folder'], day.strftime(config['image_output']['folder_structure']))
+
+
+def decimate(frames, interval_minutes):
+    """
+    Keeps the first frame of every `interval_minutes` slot of the day.
+
+    Parameters:
+        frames (list): (datetime, name) tuples in time order.
+        interval_minutes (int): Slot length.
+
+    Returns:
+        list: The kept (datetime, name) tuples.
+    """
+    kept = []
+    last_slot = None
+    for when, name in frames:
+        slot = (when.date(), (when.hour * 60 + when.minute) // interval_minutes)
+        if slot != last_slot:
+            kept.append((when, name))
+            last_slot = slot
+    return kept
+
+
+def make_proxy(source, target, width, quality):
+    """
+    Writes a scaled-down copy of a frame, letting the JPEG decoder skip most of the full-size decode.
+
+    Returns:
+        int: Bytes written.
+    """
+    with Image.open(source) as img:
+        height = round(img.height * width / img.width)
+        img.draft('RGB', (width, height))
+        proxy = img.convert('RGB')
+    if proxy.width > width:
+        proxy = proxy.resize((width, height), Image.LANCZOS)
+    return atomic_save_image(proxy, target, quality=quality, optimize=True)
+
+
+def _load_marker(folder):
+    try:
+        with open(os.path.join(folder, MARKER_FILE), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def update_day(config, day, today=None, logger=None):
+    """
+    Creates the missing proxies of one day.
+
+    Only regular frames are used (no event frames, no near-duplicate references). A past day is
+    marked complete once all its proxies exist, so it is never listed again; changing the proxy
+    settings rebuilds it.
+
+    Parameters:
+        config (dict): The configuration dictionary.
+        day (date): The day.
+        today (date, optional): The current date; today's folder is never marked complete.
+        logger (logging.Logger, optional): Logger for status messages.
+
+    Returns:
+        int: Number of proxies created.
+    """
+    settings = proxy_settings(config)
+    wanted = {key: settings[key] for key in ('width', 'quality', 'interval')}
+    target_folder = proxy_day_folder(config, day)
+    marker = _load_marker(target_folder)
+    if marker.get('settings') == wanted and marker.get('complete'):
+        return 0
+    if marker and marker.get('settings') != wanted:
+        shutil.rmtree(target_folder, ignore_errors=True)
+
+    source_folder = day_folder(config, day)
+    if not os.path.isdir(source_folder):
+        return 0
+    frames = []
+    for name in list_frames(source_folder, config['image_output'].get('image_extension', 'jpg')):
+        when, tag = parse_frame_name(name)
+        if when is not None and tag is None and not os.path.islink(os.path.join(source_folder, name)):
+            frames.append((when, name))
+
+    os.makedirs(target_folder, exist_ok=True)
+    existing = set(os.listdir(target_folder))
+    created = 0
+    for _, name in decimate(frames, settings['interval']):
+        if name in existing:
+            continue
+        try:
+            make_proxy(os.path.join(source_folder, name), os.path.join(target_folder, name), settings['width'], settings['quality'])
+            created += 1
+        except Exception as e:
+            print(f"Error creating proxy for {name}: {e}")
+
+    complete = day < (today or datetime.date.today())
+    atomic_write_bytes(os.path.join(target_folder, MARKER_FILE), json.dumps({"settings": wanted, "complete": complete}).encode('utf-8'))
+    if created:
+        log_message(logger, f"Created {created} proxies for {day}")
+    return created
+
+
+def update_proxies(config, start_date=None, end_date=None, logger=None):
+    """
+    Brings the proxy store up to date for the days in the image tree within a date range.
+
+    Returns:
+        int: Number of proxies created.
+    """
+    return sum(update_day(config, day, logger=logger) for day, _ in list_day_folders(config, start_date, end_date))
+
+
+def list_proxies(config, start_date=None, end_date=None):
+    """
+    Lists the proxies within a date range without touching the original frames.
+
+    Returns:
+        list: (datetime, path) tuples in time order.
+    """
+    proxies = []
+    for _, folder in list_day_folders(config, start_date, end_date, root_folder=proxy_settings(config)['root_folder']):
+        for name in list_frames(folder, config['image_output'].get('image_extension', 'jpg')):
+            when, _ = parse_frame_name(name)
+            if when is not None:
+                proxies.append((when, os.path.join(folder, name)))
+    return proxies
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Create the missing proxy frames for a date range.')
+    parser.add_argument('--from', dest='start', help='First date, YYYY-MM-DD (default: all days).')
+    parser.add_argument('--to', dest='end', help='Last date, YYYY-MM-DD (defaults to --from).')
+    args = parser.parse_args()
+
+    start_date, end_date = parse_date_range(args.start, args.end)
+    config = load_config()
+    print(f"Created {update_proxies(config, start_date, end_date)} proxies.")
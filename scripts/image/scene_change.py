@@ -0,0 +1,91 @@
+# scripts/image/scene_change.py
+
+import time
+from collections import deque
+
+import numpy as np
+
+# Defaults for the event_mode section of config.yaml
+THRESHOLD = 8.0  # Mean absolute difference (0-255) between a frame and the background that counts as a change
+DOWNSAMPLE_WIDTH = 64  # Approximate width of the frames the metric is computed on
+BACKGROUND_WEIGHT = 0.1  # How fast the background follows slow changes (clouds, light)
+WARMUP_FRAMES = 5  # Frames ignored after the camera is (re)opened while AE settles
+BURST_INTERVAL = 5  # Minimum seconds between two triggered captures
+MAX_EVENTS_PER_HOUR = 60  # Budget of triggered captures per rolling hour
+
+
+class SceneChangeDetector:
+    """
+    Flags fast scene changes from lores frames between the scheduled stills.
+
+    Only the luma plane is used, subsampled to roughly DOWNSAMPLE_WIDTH pixels wide, and compared to a
+    slowly updated background. That keeps the per-frame cost to a few thousand pixels of NumPy work.
+    Triggered captures are limited by a minimum spacing and an hourly budget.
+    """
+
+    def __init__(self, config, clock=time.time):
+        settings = config.get('event_mode', {})
+        self.threshold = settings.get('threshold', THRESHOLD)
+        self.downsample_width = settings.get('downsample_width', DOWNSAMPLE_WIDTH)
+        self.background_weight = settings.get('background_weight', BACKGROUND_WEIGHT)
+        self.warmup_frames = settings.get('warmup_frames', WARMUP_FRAMES)
+        self.burst_interval = settings.get('burst_interval', BURST_INTERVAL)
+        self.max_events_per_hour = settings.get('max_events_per_hour', MAX_EVENTS_PER_HOUR)
+        self.clock = clock
+
+        self.background = None
+        self.frames_seen = 0
+        self.metric = 0.0
+        self.triggered = False
+        self.captures = deque()
+
+    def reset(self):
+        """
+        Forgets the background, e.g. after the camera was closed for a still.
+        """
+        self.background = None
+        self.frames_seen = 0
+        self.triggered = False
+
+    def update(self, array, size, stride=None):
+        """
+        Feeds the next lores frame to the detector.
+
+        Parameters:
+            array (numpy.ndarray): YUV420 lores buffer; only the luma rows are read.
+            size (tuple): (width, height) of the lores stream.
+            stride (int, optional): Unused, accepted so the detector can share the preview's frame callback.
+
+        Returns:
+            bool: True if this frame triggered a capture.
+        """
+        width, height = size
+        step = max(1, width // self.downsample_width)
+        luma = array[:height:step, :width:step].astype(np.float32)
+
+        self.frames_seen += 1
+        if self.background is None or self.background.shape != luma.shape or self.frames_seen <= self.warmup_frames:
+            self.background = luma
+            return False
+
+        self.metric = float(np.mean(np.abs(luma - self.background)))
+        self.background += self.background_weight * (luma - self.background)
+
+        if self.metric > self.threshold and self.capture_allowed():
+            self.triggered = True
+        return self.triggered
+
+    def capture_allowed(self):
+        now = self.clock()
+        while self.captures and now - self.captures[0] > 3600:
+            self.captures.popleft()
+        if len(self.captures) >= self.max_events_per_hour:
+            return False
+        return not self.captures or now - self.captures[-1] >= self.burst_interval
+
+    def record_capture(self):
+        """
+        Registers a triggered capture against the budget and re-arms the detector.
+        """
+        self.captures.append(self.clock())
+        self.reset()
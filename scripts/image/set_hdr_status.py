@@ -1,42 +1,170 @@
 # scripts/image/set_hdr_status.py
 
-import json
+import fcntl
 import os
-import subprocess
+import struct
 import time
-from datetime import datetime, timedelta
 
 from scripts.log.logging import log_message
 
-# Path to store the last HDR change time
-LAST_HDR_CHANGE_PATH = 'temp/last_hdr_change.json'
-HDR_COOLDOWN_PERIOD = timedelta(hours=1)  # 1 hour cooldown period
+HDR_DEVICE_PATH = '/dev/v4l-subdev0'
+HDR_COOLDOWN_PERIOD = 3600  # 1 hour cooldown period, in seconds
+HDR_SETTLE_TIME = 0.0  # Extra fixed wait after a WDR change; AE convergence is detected from frame metadata instead
 
-def load_last_hdr_change_time():
-    if os.path.exists(LAST_HDR_CHANGE_PATH):
+# V4L2 ioctl numbers and control id (see linux/videodev2.h and linux/v4l2-controls.h)
+VIDIOC_G_CTRL = 0xc008561b  # _IOWR('V', 27, struct v4l2_control)
+VIDIOC_S_CTRL = 0xc008561c  # _IOWR('V', 28, struct v4l2_control)
+V4L2_CID_WIDE_DYNAMIC_RANGE = 0x009a0915  # V4L2_CID_CAMERA_CLASS_BASE + 21
+V4L2_CONTROL = struct.Struct('Ii')  # struct v4l2_control { __u32 id; __s32 value; }
+
+
+class V4l2HdrDevice:
+    """
+    Reads and writes the sensor's wide_dynamic_range control directly on the V4L2 subdevice.
+    """
+
+    def __init__(self, device_path=HDR_DEVICE_PATH):
+        self.device_path = device_path
+
+    def _ioctl(self, request, value=0):
+        buffer = bytearray(V4L2_CONTROL.pack(V4L2_CID_WIDE_DYNAMIC_RANGE, value))
+        fd = os.open(self.device_path, os.O_RDWR)
         try:
-            with open(LAST_HDR_CHANGE_PATH, 'r') as file:
-                data = json.load(file)
-                return datetime.fromisoformat(data["last_change"])
-        except Exception as e:
-            log_message(None, f"Error loading last HDR change time: {e}")
-    return datetime.min  # Return a very old time if no record exists
-
-def save_last_hdr_change_time():
-    try:
-        with open(LAST_HDR_CHANGE_PATH, 'w') as file:
-            json.dump({"last_change": datetime.now().isoformat()}, file)
-    except Exception as e:
-        log_message(None, f"Error saving last HDR change time: {e}")
+            fcntl.ioctl(fd, request, buffer)
+        finally:
+            os.close(fd)
+        return V4L2_CONTROL.unpack(buffer)[1]
+
+    def get_wdr(self):
+        return bool(self._ioctl(VIDIOC_G_CTRL))
+
+    def set_wdr(self, enable):
+        self._ioctl(VIDIOC_S_CTRL, 1 if enable else 0)
+
+
+class FakeHdrDevice:
+    """
+    In-memory stand-in for V4l2HdrDevice, for running the HDR logic without a camera.
+
+    Every write is recorded in `writes` so callers can check what would have been sent to the sensor.
+    """
+
+    def __init__(self, state=False):
+        self.state = state
+        self.reads = 0
+        self.writes = []
+
+    def get_wdr(self):
+        self.reads += 1
+        return self.state
+
+    def set_wdr(self, enable):
+        self.writes.append(enable)
+        self.state = enable
+
+
+class HdrController:
+    """
+    Keeps track of the sensor's HDR state in memory.
+
+    The device is read once and the cached state is used afterwards. The cooldown between changes
+    is tracked with a monotonic clock in this process, and after a change the caller only has to
+    wait for whatever part of the settle time has not already passed.
+    """
+
+    def __init__(self, device, cooldown=HDR_COOLDOWN_PERIOD, settle_time=HDR_SETTLE_TIME, clock=time.monotonic, sleep=time.sleep):
+        self.device = device
+        self.cooldown = cooldown
+        self.settle_time = settle_time
+        self.clock = clock
+        self.sleep = sleep
+        self.state = None
+        self.last_change = None
+
+    def get_state(self):
+        """
+        Returns the HDR state, reading it from the device only the first time.
+
+        Returns:
+            bool: True if HDR is enabled.
+        """
+        if self.state is None:
+            self.state = self.device.get_wdr()
+        return self.state
+
+    def refresh(self):
+        self.state = None
+        return self.get_state()
+
+    def in_cooldown(self):
+        return self.last_change is not None and self.clock() - self.last_change < self.cooldown
+
+    def set_state(self, enable, logger=None):
+        """
+        Sets the HDR (Wide Dynamic Range) state of the camera unless it already matches or the cooldown is active.
+
+        Parameters:
+            enable (bool): True to enable HDR, False to disable.
+            logger (logging.Logger, optional): Logger for status messages.
+
+        Returns:
+            bool: True if the state was changed.
+        """
+        current_state = self.get_state()
+        if current_state == enable:
+            return False
+
+        if self.in_cooldown():
+            if logger:
+                log_message(logger, f"HDR change is in cooldown. Skipping change. Current state: {current_state}, Desired state: {enable}")
+            return False
+
+        if logger:
+            log_message(logger, "Enabling HDR" if enable else "Disabling HDR")
+        self.device.set_wdr(enable)
+        self.state = enable
+        self.last_change = self.clock()
+        return True
+
+    def remaining_settle_time(self):
+        if self.last_change is None:
+            return 0
+        return max(0, self.settle_time - (self.clock() - self.last_change))
+
+    def wait_until_settled(self):
+        """
+        Sleeps for the part of the settle time that has not yet elapsed since the last change.
+
+        Returns:
+            float: The time slept, in seconds.
+        """
+        remaining = self.remaining_settle_time()
+        if remaining > 0:
+            self.sleep(remaining)
+        return remaining
+
+
+_controllers = {}  # Camera id (None for a single camera) -> HdrController
+
+def get_hdr_controller(config=None):
+    """
+    Returns the camera's HDR controller (each sensor has its own V4L2 subdevice), creating it on first use.
+
+    Parameters:
+        config (dict, optional): The configuration dictionary, used for the device path and settle time.
+
+    Returns:
+        HdrController: The shared controller.
+    """
+    key = (config or {}).get('camera_id')
+    if key not in _controllers:
+        camera_settings = (config or {}).get('camera_settings', {})
+        device = V4l2HdrDevice(camera_settings.get('hdr_device', HDR_DEVICE_PATH))
+        _controllers[key] = HdrController(device, settle_time=camera_settings.get('hdr_settle_time', HDR_SETTLE_TIME))
+    return _controllers[key]
 
 def get_current_hdr_state():
-    result = subprocess.run(
-        ["v4l2-ctl", "--get-ctrl=wide_dynamic_range", "-d", "/dev/v4l-subdev0"],
-        capture_output=True,
-        text=True
-    )
-    output = result.stdout.strip()
-    return "wide_dynamic_range: 1" in output
+    return get_hdr_controller().get_state()
 
 def set_hdr_state(enable, logger=None):
     """
@@ -45,24 +173,4 @@ def set_hdr_state(enable, logger=None):
     Parameters:
         enable (bool): True to enable HDR, False to disable.
     """
-    current_state = get_current_hdr_state()
-    last_change_time = load_last_hdr_change_time()
-
-    if datetime.now() - last_change_time < HDR_COOLDOWN_PERIOD:
-        if logger:
-            log_message(logger, f"HDR change is in cooldown. Skipping change. Current state: {current_state}, Desired state: {enable}")
-        return
-
-    if enable and not current_state:
-        if logger:
-            log_message(logger, "Enabling HDR")
-        os.system("v4l2-ctl --set-ctrl wide_dynamic_range=1 -d /dev/v4l-subdev0")
-        save_last_hdr_change_time()
-        time.sleep(5)  # Adding a delay after enabling HDR
-
-    elif not enable and current_state:
-        if logger:
-            log_message(logger, "Disabling HDR")
-        os.system("v4l2-ctl --set-ctrl wide_dynamic_range=0 -d /dev/v4l-subdev0")
-        save_last_hdr_change_time()
-        time.sleep(5)  # Adding a delay after disabling HDR
+    return get_hdr_controller().set_state(enable, logger)
@@ -0,0 +1,149 @@
+# scripts/image/settle_detector.py
+
+import time
+from collections import namedtuple
+
+from scripts.log.logging import log_message
+
+SETTLE_TIMEOUT = 5.0  # Seconds to wait for convergence before giving up and using the latest frame
+STABLE_FRAMES = 2  # Consecutive frames that must agree before AE/AWB counts as converged
+EXPOSURE_TOLERANCE = 0.05  # Max relative ExposureTime change between frames
+GAIN_TOLERANCE = 0.05  # Max relative AnalogueGain change between frames
+LUX_TOLERANCE = 0.1  # Max relative Lux change between frames
+LUX_FLOOR = 0.5  # Absolute Lux change that is always considered stable (avoids noise at night)
+
+SettleResult = namedtuple('SettleResult', ['settled', 'elapsed', 'frames', 'metadata'])
+
+
+def _relative_change(previous, current):
+    if previous is None or current is None:
+        return 0.0
+    if previous == 0:
+        return 0.0 if current == 0 else 1.0
+    return abs(current - previous) / abs(previous)
+
+
+class SettleDetector:
+    """
+    Decides from per-frame metadata when the AE/AWB pipeline has converged.
+
+    With auto exposure the frame is settled once AeLocked is set (if required) and ExposureTime,
+    AnalogueGain and Lux have stayed within tolerance for `stable_frames` frames in a row. With manual
+    exposure there is nothing to converge, so the first frame that carries the requested exposure
+    time is accepted.
+    """
+
+    def __init__(self, require_ae_lock=True, expected_exposure=None, stable_frames=STABLE_FRAMES,
+                 exposure_tolerance=EXPOSURE_TOLERANCE, gain_tolerance=GAIN_TOLERANCE, lux_tolerance=LUX_TOLERANCE):
+        self.require_ae_lock = require_ae_lock
+        self.expected_exposure = expected_exposure
+        self.stable_frames = stable_frames
+        self.exposure_tolerance = exposure_tolerance
+        self.gain_tolerance = gain_tolerance
+        self.lux_tolerance = lux_tolerance
+        self.previous = None
+        self.stable = 0
+
+    def update(self, metadata):
+        """
+        Feeds the metadata of the next frame to the detector.
+
+        Parameters:
+            metadata (dict): Frame metadata as returned by Picamera2.
+
+        Returns:
+            bool: True once the pipeline is considered settled.
+        """
+        if self.expected_exposure:
+            exposure = metadata.get('ExposureTime')
+            return exposure is not None and _relative_change(self.expected_exposure, exposure) <= self.exposure_tolerance
+
+        previous, self.previous = self.previous, metadata
+        if previous is None:
+            return False
+
+        lux_change = abs(metadata.get('Lux', 0) - previous.get('Lux', 0))
+        steady = (
+            _relative_change(previous.get('ExposureTime'), metadata.get('ExposureTime')) <= self.exposure_tolerance
+            and _relative_change(previous.get('AnalogueGain'), metadata.get('AnalogueGain')) <= self.gain_tolerance
+            and (lux_change <= LUX_FLOOR or _relative_change(previous.get('Lux'), metadata.get('Lux')) <= self.lux_tolerance)
+        )
+        self.stable = self.stable + 1 if steady else 0
+
+        ae_ok = metadata.get('AeLocked', True) or not self.require_ae_lock
+        return ae_ok and self.stable >= self.stable_frames - 1
+
+
+def _log_settle(result, label, logger):
+    status = "converged" if result.settled else "timed out"
+    message = f"Settle ({label}): {status} after {result.elapsed:.2f}s and {result.frames} frames"
+    if logger:
+        log_message(logger, message)
+    else:
+        print(message)
+
+
+def wait_for_settle(picam2, detector, timeout=SETTLE_TIMEOUT, label="metering", logger=None):
+    """
+    Waits on a started camera until the detector reports convergence or the timeout expires.
+
+    Parameters:
+        picam2 (Picamera2): The started camera.
+        detector (SettleDetector): Detector configured for the current exposure mode.
+        timeout (float): Maximum time to wait, in seconds.
+        label (str): Name of the caller, used in the log line.
+        logger (logging.Logger, optional): Logger for the settle time.
+
+    Returns:
+        SettleResult: Whether it settled, how long it took, frames inspected and the last frame's metadata.
+    """
+    start = time.monotonic()
+    frames = 0
+    metadata = {}
+    settled = False
+    while not settled and time.monotonic() - start < timeout:
+        metadata = picam2.capture_metadata()
+        frames += 1
+        settled = detector.update(metadata)
+
+    result = SettleResult(settled, time.monotonic() - start, frames, metadata)
+    _log_settle(result, label, logger)
+    return result
+
+
+def capture_settled_request(picam2, detector, timeout=SETTLE_TIMEOUT, label="capture", logger=None):
+    """
+    Captures requests until the detector reports convergence and returns the settled one.
+
+    The frame that proves convergence is the one handed back, so no extra frame is spent after
+    settling; this matters at night when a single frame can take 20 seconds. If the timeout
+    expires the most recent request is returned instead.
+
+    Parameters:
+        picam2 (Picamera2): The started camera.
+        detector (SettleDetector): Detector configured for the current exposure mode.
+        timeout (float): Maximum time to wait, in seconds.
+        label (str): Name of the caller, used in the log line.
+        logger (logging.Logger, optional): Logger for the settle time.
+
+    Returns:
+        tuple: (request, SettleResult). The caller must release the request.
+    """
+    start = time.monotonic()
+    frames = 0
+    request = None
+    metadata = {}
+    settled = False
+    while True:
+        if request is not None:
+            request.release()
+        request = picam2.capture_request()
+        metadata = request.get_metadata()
+        frames += 1
+        settled = detector.update(metadata)
+        if settled or time.monotonic() - start >= timeout:
+            break
+
+    result = SettleResult(settled, time.monotonic() - start, frames, metadata)
+    _log_settle(result, label, logger)
+    return request, result
@@ -1,39 +1,169 @@
+import atexit
+import json
 import logging
+import logging.handlers
 import os
+import queue
 from datetime import datetime
-from colored import fg, attr
 
-def setup_logger(name, log_file, level=logging.INFO):
+# Defaults for the logging section of config.yaml
+JSON_LINES = True  # One JSON object per line instead of plain text
+MAX_BYTES = 5 * 1024 * 1024  # Size at which a log file is rotated
+BACKUP_COUNT = 5  # Rotated files kept
+SUMMARY_LOGGER = 'capture_summary'  # Logger the per-frame capture summary is sent to
+
+_listeners = {}  # Log file path -> QueueListener writing it
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """
+    Formats records as single-line JSON objects.
+
+    Every line has the fields time, level, logger and message; structured values passed to
+    log_message() follow as extra top-level fields.
+    """
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in getattr(record, 'fields', {}).items():
+            entry.setdefault(key, value)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class CaptureSummaryFormatter(logging.Formatter):
+    """
+    Renders the per-frame capture summary as the colored, table-like console block.
+    """
+
+    def format(self, record):
+        from colored import fg, attr
+
+        green = fg('green')
+        firstColor = fg('white')
+        yellow = fg('yellow')
+        reset = attr('reset')
+        column_width = 26  # Set column width for consistency
+
+        fields = getattr(record, 'fields', {})
+        lines = ["-" * 50, f"{green}Capture Summary:{reset}"]
+        for label, key in (('File Name:', 'file_name'), ('ISO:', 'iso'), ('Shutter Speed:', 'shutter_speed'),
+                           ('Quality:', 'quality'), ('Compression:', 'compression'), ('Daylight:', 'daylight'), ('HDR:', 'hdr')):
+            lines.append(f"{firstColor}{label:<{column_width}}{yellow}{fields.get(key)}{reset}")
+        for title, key in (('Camera Configuration:', 'controls'), ('Metadata Information:', 'metadata')):
+            lines += ["\n" + "-" * 50, f"{green}{title}{reset}"]
+            for name, value in fields.get(key, {}).items():
+                lines.append(f"{firstColor}{name:<{column_width}}{yellow}{value}{reset}")
+        lines.append("-" * 50)
+        return "\n".join(lines)
+
+
+def _file_handler(log_file, json_lines, max_bytes, backup_count, rotate_when):
+    if rotate_when:
+        handler = logging.handlers.TimedRotatingFileHandler(log_file, when=rotate_when, backupCount=backup_count)
+    else:
+        handler = logging.handlers.RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count)
+    if json_lines:
+        handler.setFormatter(JsonLinesFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S'))
+    return handler
+
+
+def _queue_handler(key, make_handler):
+    """
+    Returns a QueueHandler feeding a background QueueListener that owns the handler made by `make_handler` (one per key).
+    """
+    if key not in _listeners:
+        log_queue = queue.SimpleQueue()
+        listener = logging.handlers.QueueListener(log_queue, make_handler(), respect_handler_level=True)
+        listener.start()
+        _listeners[key] = (listener, logging.handlers.QueueHandler(log_queue))
+    return _listeners[key][1]
+
+
+def setup_logger(name, log_file, level=logging.INFO, json_lines=JSON_LINES, max_bytes=MAX_BYTES, backup_count=BACKUP_COUNT, rotate_when=None):
     """
     Sets up a logger with the specified name, log file, and level.
 
+    The logger only puts records on a queue; a background listener formats and writes them, so
+    file I/O never happens on the capture path. Calling this again for the same logger does not
+    add another handler.
+
     Parameters:
         name (str): The name of the logger.
         log_file (str): The file path where the logs will be stored.
         level (int): The logging level (e.g., logging.INFO, logging.DEBUG).
+        json_lines (bool): Write JSON lines instead of plain text.
+        max_bytes (int): Size at which the file is rotated.
+        backup_count (int): Number of rotated files to keep.
+        rotate_when (str, optional): Rotate by time instead of size, e.g. 'midnight'.
 
     Returns:
         logging.Logger: Configured logger.
     """
-    formatter = logging.Formatter('%(asctime)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
-    handler = logging.FileHandler(log_file)
-    handler.setFormatter(formatter)
-
     logger = logging.getLogger(name)
     logger.setLevel(level)
-    logger.addHandler(handler)
-    
+
+    handler = _queue_handler(os.path.abspath(log_file), lambda: _file_handler(log_file, json_lines, max_bytes, backup_count, rotate_when))
+    if handler not in logger.handlers:
+        logger.addHandler(handler)
+
     return logger
 
-def log_message(logger, message):
+def logging_options(config):
+    """
+    Returns the setup_logger keyword arguments from the logging section of config.yaml.
+
+    Parameters:
+        config (dict): The configuration dictionary.
+
+    Returns:
+        dict: Keyword arguments for setup_logger.
+    """
+    settings = config.get('logging', {})
+    return {
+        "json_lines": settings.get('json_lines', JSON_LINES),
+        "max_bytes": settings.get('max_bytes', MAX_BYTES),
+        "backup_count": settings.get('backup_count', BACKUP_COUNT),
+        "rotate_when": settings.get('rotate_when'),
+    }
+
+def setup_console_summary(enabled=True):
+    """
+    Prints the colored capture summary on the console for every frame (opt-in, off by default).
+
+    Parameters:
+        enabled (bool): Whether to show the summary.
+    """
+    logger = logging.getLogger(SUMMARY_LOGGER)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    if enabled and not logger.handlers:
+        def make_handler():
+            handler = logging.StreamHandler()
+            handler.setFormatter(CaptureSummaryFormatter())
+            return handler
+        logger.addHandler(_queue_handler('<console summary>', make_handler))
+
+def log_message(logger, message, **fields):
     """
     Logs a message using the provided logger.
 
     Parameters:
-        logger (logging.Logger): The logger to use.
+        logger (logging.Logger): The logger to use; nothing is logged if it is None.
         message (str): The message to log.
+        **fields: Structured values added to the JSON line.
     """
-    logger.info(message)
+    if logger is None:
+        return
+    logger.info(message, extra={"fields": fields} if fields else None)
 
 def setup_logging_directory():
     """
@@ -43,44 +173,33 @@ def setup_logging_directory():
     os.makedirs(logs_dir, exist_ok=True)
     return logs_dir
 
-def log_colored_capture(file_name, iso, shutter_speed, quality, compression, daylight, hdr_state, camera_config, metadataForPrint):
+def log_colored_capture(file_name, iso, shutter_speed, quality, compression, daylight, hdr_state, camera_config, metadataForPrint, logger=None):
     """
-    Logs the image capture details with a table-like formatted output and colored sections.
-    """
-    # Define colors
-    green = fg('green')
-    firstColor = fg('white')
-    yellow = fg('yellow')
-    red = fg('red')
-    reset = attr('reset')
-
-    print("-" * 50)
-
-    # Set column width for consistency
-    column_width = 26
-
-    # Log the capture details
-    print(f"{green}Capture Summary:{reset}")
-    print(f"{firstColor}{'File Name:':<{column_width}}{yellow}{file_name}{reset}")
-    print(f"{firstColor}{'ISO:':<{column_width}}{yellow}{iso}{reset}")
-    print(f"{firstColor}{'Shutter Speed:':<{column_width}}{yellow}{shutter_speed}{reset}")
-    print(f"{firstColor}{'Quality:':<{column_width}}{yellow}{quality}{reset}")
-    print(f"{firstColor}{'Compression:':<{column_width}}{yellow}{compression}{reset}")
-    print(f"{firstColor}{'Daylight:':<{column_width}}{yellow}{daylight}{reset}")
-    print(f"{firstColor}{'HDR:':<{column_width}}{yellow}{hdr_state}{reset}")
-
-    print("\n" + "-" * 50)
+    Logs the image capture details.
 
-    # Log camera configuration
-    print(f"{green}Camera Configuration:{reset}")
-    for key, value in camera_config['controls'].items():
-        print(f"{firstColor}{key:<{column_width}}{yellow}{value}{reset}")
-
-    print("\n" + "-" * 50)
-
-    # Log metadata
-    print(f"{green}Metadata Information:{reset}")
-    for key, value in metadataForPrint.items():
-        print(f"{firstColor}{key:<{column_width}}{yellow}{value}{reset}")
-
-    print("-" * 50)
+    The record goes to `logger` as structured fields and, if setup_console_summary() was called, to
+    the console as a table-like formatted output with colored sections. Formatting happens on the
+    listener thread.
+    """
+    fields = {
+        "file_name": file_name,
+        "iso": iso,
+        "shutter_speed": shutter_speed,
+        "quality": quality,
+        "compression": compression,
+        "daylight": daylight,
+        "hdr": hdr_state,
+        "controls": dict(camera_config['controls']),
+        "metadata": metadataForPrint,
+    }
+    log_message(logger, "Capture", **fields)
+
+    summary = logging.getLogger(SUMMARY_LOGGER)
+    if summary.handlers:
+        summary.info("Capture", extra={"fields": fields})
+
+
+@atexit.register
+def _stop_listeners():
+    for listener, _ in _listeners.values():
+        listener.stop()
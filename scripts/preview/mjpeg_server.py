@@ -0,0 +1,233 @@
+# scripts/preview/mjpeg_server.py
+
+import queue
+import threading
+from http import server
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, urlparse
+
+import simplejpeg
+
+PAGE = """\
+<html>
+<head>
+<title>{name} - Live preview</title>
+</head>
+<body style="margin:0;background:#000;">
+<img src="stream.mjpg" style="width:100%;height:auto;" />
+</body>
+</html>
+"""
+
+
+class FrameBuffer:
+    """
+    Holds the most recently encoded JPEG frame and wakes up streaming clients when a new one arrives.
+    """
+
+    def __init__(self):
+        self.frame = None
+        self.condition = threading.Condition()
+
+    def publish(self, jpeg):
+        with self.condition:
+            self.frame = jpeg
+            self.condition.notify_all()
+
+    def wait_for_frame(self, timeout=None):
+        with self.condition:
+            self.condition.wait(timeout)
+            return self.frame
+
+
+class PreviewEncoder:
+    """
+    Encodes raw lores frames to JPEG on its own thread.
+
+    The capture loop hands frames over with submit() and never waits for the encoder. Only the
+    newest frame is kept, so a slow encode drops frames instead of holding up the camera.
+    """
+
+    def __init__(self, frame_buffer, quality=70):
+        self.frame_buffer = frame_buffer
+        self.quality = quality
+        self.pending = queue.Queue(maxsize=1)
+        self.thread = threading.Thread(target=self._run, name="preview-encoder", daemon=True)
+        self.thread.start()
+
+    def submit(self, array, size, stride):
+        """
+        Queues a YUV420 lores frame for encoding, replacing any frame that is still waiting.
+
+        Parameters:
+            array (numpy.ndarray): The YUV420 buffer as returned by capture_array("lores").
+            size (tuple): (width, height) of the lores stream.
+            stride (int): Row stride of the lores buffer in bytes.
+        """
+        try:
+            self.pending.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            self.pending.put_nowait((array, size, stride))
+        except queue.Full:
+            pass
+
+    def _run(self):
+        while True:
+            array, (width, height), stride = self.pending.get()
+            try:
+                self.frame_buffer.publish(encode_yuv420(array, width, height, stride, self.quality))
+            except Exception as e:
+                print(f"Error encoding preview frame: {e}")
+
+
+def encode_yuv420(array, width, height, stride, quality):
+    """
+    Encodes a YUV420 buffer to JPEG without converting it to RGB first.
+
+    Parameters:
+        array (numpy.ndarray): The YUV420 buffer, (height * 3 / 2) rows of `stride` bytes.
+        width (int): Image width.
+        height (int): Image height.
+        stride (int): Row stride of the buffer in bytes.
+        quality (int): JPEG quality.
+
+    Returns:
+        bytes: The encoded JPEG.
+    """
+    y_plane = array[:height, :width]
+    # The chroma planes have half the stride, so in half-stride rows they start after the 2 x height rows of Y
+    reshaped = array.reshape((-1, stride // 2))
+    u_plane = reshaped[2 * height:2 * height + height // 2, :width // 2]
+    v_plane = reshaped[2 * height + height // 2:3 * height, :width // 2]
+    return simplejpeg.encode_jpeg_yuv_planes(y_plane, u_plane, v_plane, quality)
+
+
+class StreamingHandler(server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path in ('/', '/index.html'):
+            content = PAGE.format(name=self.server.preview.name).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html')
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+        elif self.path == '/stream.mjpg':
+            self.stream()
+        elif self.path.split('?')[0] == '/still.jpg' and self.server.preview.still_renderer is not None:
+            self.still()
+        else:
+            self.send_error(404)
+            self.end_headers()
+
+    def stream(self):
+        preview = self.server.preview
+        self.send_response(200)
+        self.send_header('Age', '0')
+        self.send_header('Cache-Control', 'no-cache, private')
+        self.send_header('Pragma', 'no-cache')
+        self.send_header('Content-Type', 'multipart/x-mixed-replace; boundary=FRAME')
+        self.end_headers()
+
+        preview.client_joined()
+        try:
+            while True:
+                # While the camera is busy with a still, no frames arrive; keep the connection open.
+                frame = preview.frame_buffer.wait_for_frame(timeout=5)
+                if frame is None:
+                    continue
+                self.wfile.write(b'--FRAME\r\n')
+                self.send_header('Content-Type', 'image/jpeg')
+                self.send_header('Content-Length', str(len(frame)))
+                self.end_headers()
+                self.wfile.write(frame)
+                self.wfile.write(b'\r\n')
+        except Exception:
+            # Client went away
+            pass
+        finally:
+            preview.client_left()
+
+    def still(self):
+        query = parse_qs(urlparse(self.path).query)
+        try:
+            width = int(query['width'][0]) if 'width' in query else None
+            content = self.server.preview.still_renderer(width)
+        except Exception as e:
+            self.send_error(500, str(e))
+            return
+        self.send_response(200)
+        self.send_header('Cache-Control', 'no-cache, private')
+        self.send_header('Content-Type', 'image/jpeg')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        # Keep the capture log free of per-request noise
+        pass
+
+
+class ThreadingHTTPServer(ThreadingMixIn, server.HTTPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class PreviewServer:
+    """
+    MJPEG preview server fed from the lores stream.
+
+    The server itself only keeps a socket open. Frames are pushed in with submit() while the
+    timelapse loop has the camera open between stills; with no clients connected the loop never
+    opens the camera for the preview at all. With a `still_renderer` (a callable taking a width
+    and returning JPEG bytes), /still.jpg serves the latest still as well.
+    """
+
+    def __init__(self, port=8000, quality=70, name="Camera", still_renderer=None):
+        self.name = name
+        self.still_renderer = still_renderer
+        self.frame_buffer = FrameBuffer()
+        self.encoder = PreviewEncoder(self.frame_buffer, quality)
+        self.clients = 0
+        self.clients_lock = threading.Lock()
+        self.client_event = threading.Event()
+        self.httpd = ThreadingHTTPServer(('', port), StreamingHandler)
+        self.httpd.preview = self
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="preview-server", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def client_joined(self):
+        with self.clients_lock:
+            self.clients += 1
+            self.client_event.set()
+
+    def client_left(self):
+        with self.clients_lock:
+            self.clients -= 1
+            if self.clients == 0:
+                self.client_event.clear()
+
+    def has_clients(self):
+        return self.clients > 0
+
+    def wait_for_client(self, timeout):
+        """
+        Blocks until at least one client is connected or the timeout expires.
+
+        Parameters:
+            timeout (float): Maximum time to wait in seconds.
+
+        Returns:
+            bool: True if a client is connected.
+        """
+        return self.client_event.wait(max(0, timeout))
+
+    def submit(self, array, size, stride):
+        self.encoder.submit(array, size, stride)
@@ -0,0 +1,142 @@
+# scripts/schedule/scheduler.py
+
+import math
+from datetime import timedelta
+
+from scripts.schedule.solar import day_phases, NIGHT, TRANSITION, DAY, TRANSITION_ELEVATION
+
+PRE_SWITCH = 300  # Seconds before a phase change at which the camera is prepared for the next phase
+
+
+class SolarScheduler:
+    """
+    Picks the capture interval from the sun's position instead of a single constant.
+
+    Each day's phases (night, sunrise/sunset transition, day) are computed once from the configured
+    latitude and longitude, without any network access, and reused for every frame of that day.
+    """
+
+    def __init__(self, config):
+        schedule = config['schedule']
+        default_interval = config['camera_settings']['interval']
+        self.latitude = schedule['latitude']
+        self.longitude = schedule['longitude']
+        self.transition_elevation = tuple(schedule.get('transition_elevation', TRANSITION_ELEVATION))
+        intervals = schedule.get('intervals', {})
+        self.intervals = {phase: intervals.get(phase, default_interval) for phase in (NIGHT, TRANSITION, DAY)}
+        self.pre_switch = timedelta(seconds=schedule.get('pre_switch', PRE_SWITCH))
+        self.cache = {}
+
+    def phases_for(self, day):
+        if day not in self.cache:
+            # Only yesterday, today and tomorrow are ever needed
+            self.cache = {cached: periods for cached, periods in self.cache.items() if abs((cached - day).days) <= 1}
+            self.cache[day] = day_phases(day, self.latitude, self.longitude, self.transition_elevation)
+        return self.cache[day]
+
+    def phase_at(self, when):
+        """
+        Returns the phase of the day at a moment.
+
+        Parameters:
+            when (datetime): Timezone-aware datetime.
+
+        Returns:
+            str: 'night', 'transition' or 'day'.
+        """
+        for start, end, phase in self.phases_for(when.date()):
+            if start <= when < end:
+                return phase
+        return self.phases_for(when.date())[-1][2]
+
+    def next_change(self, when):
+        """
+        Finds the next moment the phase changes after `when`, looking into the following day if needed.
+
+        Parameters:
+            when (datetime): Timezone-aware datetime.
+
+        Returns:
+            tuple: (datetime of the change, phase after the change), or (None, None) if it doesn't change within two days.
+        """
+        current = self.phase_at(when)
+        for day in (when.date(), when.date() + timedelta(days=1), when.date() + timedelta(days=2)):
+            for start, _, phase in self.phases_for(day):
+                if start > when and phase != current:
+                    return start, phase
+        return None, None
+
+    def interval_at(self, when):
+        """
+        Returns the capture interval in seconds for a moment.
+
+        If a phase with a shorter interval starts before the regular interval is up, the interval is
+        cut short so the denser sampling starts on time.
+
+        Parameters:
+            when (datetime): Timezone-aware datetime.
+
+        Returns:
+            float: Seconds until the next capture should start.
+        """
+        interval = self.intervals[self.phase_at(when)]
+        change, next_phase = self.next_change(when)
+        if change is not None and self.intervals[next_phase] < interval:
+            interval = max(0, min(interval, (change - when).total_seconds()))
+        return interval
+
+    def upcoming_phase(self, when):
+        """
+        Returns the phase that starts within the pre-switch window after `when`, if any.
+
+        Parameters:
+            when (datetime): Timezone-aware datetime.
+
+        Returns:
+            tuple: (datetime of the change, next phase), or (None, None) if no change is imminent.
+        """
+        change, next_phase = self.next_change(when)
+        if change is not None and change - when <= self.pre_switch:
+            return change, next_phase
+        return None, None
+
+
+class StaggeredSchedule:
+    """
+    Decides which camera captures next when one process drives several cameras.
+
+    Captures run one at a time. The cameras start spread evenly over the interval, and every camera
+    keeps to its own grid of slots (first slot + n x interval), so they stay apart instead of
+    drifting into the same second. A capture that had to wait for another camera is taken as soon as
+    possible; slots that passed in the meantime are skipped rather than caught up.
+    """
+
+    def __init__(self, count, interval, start):
+        spacing = interval / count
+        self.due = [start + position * spacing for position in range(count)]
+
+    def next_camera(self):
+        """
+        Returns:
+            tuple: (position of the camera that is due first, time.time() value it is due at).
+        """
+        position = min(range(len(self.due)), key=self.due.__getitem__)
+        return position, self.due[position]
+
+    def captured(self, position, interval, when):
+        """
+        Schedules a camera's next capture after it captured.
+
+        Parameters:
+            position (int): The camera's position.
+            interval (float): Its current interval in seconds.
+            when (float): time.time() value after the capture.
+
+        Returns:
+            float: time.time() value of its next capture.
+        """
+        due = self.due[position] + interval
+        if due < when:
+            due = due + math.ceil((when - due) / interval) * interval if interval > 0 else when
+        self.due[position] = due
+        return due
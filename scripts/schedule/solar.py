@@ -0,0 +1,152 @@
+# scripts/schedule/solar.py
+
+import math
+from datetime import datetime, time, timedelta, timezone
+
+# Phases of the day by sun elevation, from darkest to brightest
+NIGHT = 'night'
+TRANSITION = 'transition'
+DAY = 'day'
+
+TRANSITION_ELEVATION = (-6.0, 6.0)  # Sun elevation band (degrees) treated as sunrise/sunset
+SCAN_STEP = timedelta(minutes=10)  # Coarse step when searching a day for phase changes
+CROSSING_PRECISION = timedelta(seconds=1)
+
+
+def _solar_terms(when):
+    """
+    Returns the sun's declination (degrees) and the equation of time (minutes) for a moment,
+    using the NOAA solar calculation equations.
+
+    Parameters:
+        when (datetime): Timezone-aware datetime.
+
+    Returns:
+        tuple: (declination, equation_of_time)
+    """
+    utc = when.astimezone(timezone.utc)
+    julian_day = utc.timestamp() / 86400.0 + 2440587.5
+    julian_century = (julian_day - 2451545.0) / 36525.0
+
+    mean_longitude = (280.46646 + julian_century * (36000.76983 + julian_century * 0.0003032)) % 360
+    mean_anomaly = 357.52911 + julian_century * (35999.05029 - 0.0001537 * julian_century)
+    eccentricity = 0.016708634 - julian_century * (0.000042037 + 0.0000001267 * julian_century)
+
+    anomaly = math.radians(mean_anomaly)
+    equation_of_center = (math.sin(anomaly) * (1.914602 - julian_century * (0.004817 + 0.000014 * julian_century))
+                          + math.sin(2 * anomaly) * (0.019993 - 0.000101 * julian_century)
+                          + math.sin(3 * anomaly) * 0.000289)
+    omega = math.radians(125.04 - 1934.136 * julian_century)
+    apparent_longitude = mean_longitude + equation_of_center - 0.00569 - 0.00478 * math.sin(omega)
+
+    mean_obliquity = 23 + (26 + (21.448 - julian_century * (46.815 + julian_century * (0.00059 - julian_century * 0.001813))) / 60) / 60
+    obliquity = math.radians(mean_obliquity + 0.00256 * math.cos(omega))
+    declination = math.degrees(math.asin(math.sin(obliquity) * math.sin(math.radians(apparent_longitude))))
+
+    y = math.tan(obliquity / 2) ** 2
+    longitude = math.radians(mean_longitude)
+    equation_of_time = 4 * math.degrees(
+        y * math.sin(2 * longitude)
+        - 2 * eccentricity * math.sin(anomaly)
+        + 4 * eccentricity * y * math.sin(anomaly) * math.cos(2 * longitude)
+        - 0.5 * y * y * math.sin(4 * longitude)
+        - 1.25 * eccentricity * eccentricity * math.sin(2 * anomaly)
+    )
+    return declination, equation_of_time
+
+
+def sun_elevation(when, latitude, longitude):
+    """
+    Calculates the sun's elevation above the horizon, without atmospheric refraction.
+
+    Parameters:
+        when (datetime): Timezone-aware datetime.
+        latitude (float): Latitude in degrees, north positive.
+        longitude (float): Longitude in degrees, east positive.
+
+    Returns:
+        float: Elevation in degrees (negative below the horizon).
+    """
+    declination, equation_of_time = _solar_terms(when)
+    utc = when.astimezone(timezone.utc)
+    minutes = utc.hour * 60 + utc.minute + utc.second / 60.0
+    true_solar_time = (minutes + equation_of_time + 4 * longitude) % 1440
+    hour_angle = math.radians(true_solar_time / 4 - 180)
+
+    lat = math.radians(latitude)
+    decl = math.radians(declination)
+    cos_zenith = math.sin(lat) * math.sin(decl) + math.cos(lat) * math.cos(decl) * math.cos(hour_angle)
+    return 90 - math.degrees(math.acos(max(-1.0, min(1.0, cos_zenith))))
+
+
+def solar_noon(day, longitude, tz=None):
+    """
+    Returns the moment of solar noon (sun at its highest) for a date.
+
+    Parameters:
+        day (date): The local date.
+        longitude (float): Longitude in degrees, east positive.
+        tz (tzinfo, optional): Timezone of the result, defaults to the local timezone.
+
+    Returns:
+        datetime: Timezone-aware datetime of solar noon.
+    """
+    midnight_utc = datetime.combine(day, time.min, tzinfo=timezone.utc)
+    _, equation_of_time = _solar_terms(midnight_utc + timedelta(hours=12))
+    noon = midnight_utc + timedelta(minutes=720 - 4 * longitude - equation_of_time)
+    return noon.astimezone(tz)
+
+
+def phase_for_elevation(elevation, transition_elevation=TRANSITION_ELEVATION):
+    low, high = transition_elevation
+    if elevation < low:
+        return NIGHT
+    if elevation < high:
+        return TRANSITION
+    return DAY
+
+
+def day_phases(day, latitude, longitude, transition_elevation=TRANSITION_ELEVATION, tz=None):
+    """
+    Precomputes the phases of a local day as a list of contiguous periods.
+
+    The day is scanned in coarse steps and every phase change is then refined by bisection, so
+    polar day and polar night (no sunrise or sunset at all) come out naturally as a single period.
+
+    Parameters:
+        day (date): The local date.
+        latitude (float): Latitude in degrees, north positive.
+        longitude (float): Longitude in degrees, east positive.
+        transition_elevation (tuple): (low, high) sun elevation band treated as sunrise/sunset.
+        tz (tzinfo, optional): Timezone for the day boundaries, defaults to the local timezone.
+
+    Returns:
+        list: (start, end, phase) tuples covering local midnight to the following midnight.
+    """
+    start = datetime.combine(day, time.min).astimezone(tz)
+    end = datetime.combine(day + timedelta(days=1), time.min).astimezone(tz)
+
+    def phase_at(when):
+        return phase_for_elevation(sun_elevation(when, latitude, longitude), transition_elevation)
+
+    periods = []
+    period_start = start
+    current_phase = phase_at(start)
+    step_start = start
+    while step_start < end:
+        step_end = min(step_start + SCAN_STEP, end)
+        if phase_at(step_end) != current_phase:
+            # Bisect to find the moment the phase changes inside this step
+            low, high = step_start, step_end
+            while high - low > CROSSING_PRECISION:
+                middle = low + (high - low) / 2
+                if phase_at(middle) == current_phase:
+                    low = middle
+                else:
+                    high = middle
+            periods.append((period_start, high, current_phase))
+            period_start = high
+            current_phase = phase_at(high)
+        step_start = step_end
+    periods.append((period_start, end, current_phase))
+    return periods
@@ -0,0 +1,130 @@
+# scripts/storage/atomic_write.py
+
+import errno
+import os
+import shutil
+
+
+def _fsync_directory(directory):
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def atomic_write_bytes(path, data):
+    """
+    Writes a file so readers only ever see the old or the complete new content.
+
+    The data goes to a temporary file next to the target, is fsynced, and then renamed over it.
+
+    Parameters:
+        path (str): The destination path.
+        data (bytes): The file content.
+
+    Returns:
+        int: Number of bytes written.
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    _fsync_directory(os.path.dirname(os.path.abspath(path)))
+    return len(data)
+
+
+def atomic_save_image(image, path, **save_options):
+    """
+    Saves a PIL image atomically (temporary file, fsync, rename).
+
+    Parameters:
+        image (PIL.Image.Image): The image to save.
+        path (str): The destination path.
+        **save_options: Passed on to Image.save (format, quality, ...).
+
+    Returns:
+        int: Number of bytes written.
+    """
+    tmp_path = f"{path}.tmp"
+    save_options.setdefault('format', 'JPEG')
+    with open(tmp_path, 'wb') as f:
+        image.save(f, **save_options)
+        f.flush()
+        os.fsync(f.fileno())
+        size = f.tell()
+    os.replace(tmp_path, path)
+    _fsync_directory(os.path.dirname(os.path.abspath(path)))
+    return size
+
+
+def atomic_copy(source, path):
+    """
+    Copies a file atomically (temporary file next to the target, fsync, rename).
+
+    Parameters:
+        source (str): The file to copy.
+        path (str): The destination path.
+
+    Returns:
+        int: Number of bytes written.
+    """
+    tmp_path = f"{path}.tmp"
+    with open(source, 'rb') as src, open(tmp_path, 'wb') as f:
+        shutil.copyfileobj(src, f, 1024 * 1024)
+        f.flush()
+        os.fsync(f.fileno())
+        size = f.tell()
+    os.replace(tmp_path, path)
+    _fsync_directory(os.path.dirname(os.path.abspath(path)))
+    return size
+
+
+def publish_file(staged_path, path):
+    """
+    Moves a finished file into place so readers only ever see the complete file.
+
+    A file staged on the same filesystem is fsynced and renamed; one staged elsewhere (e.g. on a
+    tmpfs) is copied next to the target first.
+
+    Parameters:
+        staged_path (str): The finished file.
+        path (str): The destination path.
+
+    Returns:
+        int: Number of bytes written to the destination filesystem by publishing.
+    """
+    try:
+        with open(staged_path, 'rb+') as f:
+            os.fsync(f.fileno())
+        os.replace(staged_path, path)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        size = atomic_copy(staged_path, path)
+        os.remove(staged_path)
+        return size
+    _fsync_directory(os.path.dirname(os.path.abspath(path)))
+    return 0
+
+
+def atomic_symlink(target, path):
+    """
+    Points a symlink at a new target without a moment where it is missing.
+
+    Parameters:
+        target (str): What the link points to.
+        path (str): The symlink path.
+    """
+    tmp_path = f"{path}.tmp"
+    if os.path.lexists(tmp_path):
+        os.remove(tmp_path)
+    os.symlink(target, tmp_path)
+    os.replace(tmp_path, path)
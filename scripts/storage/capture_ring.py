@@ -0,0 +1,226 @@
+# scripts/storage/capture_ring.py
+
+import argparse
+import math
+import mmap
+import os
+import struct
+import time
+from collections import namedtuple
+
+# Defaults for the capture_ring section of config.yaml
+RING_PATH = '/dev/shm/timelapse_captures'  # On a tmpfs, so nothing ever reaches the SD card
+CAPACITY = 1024  # Number of capture records kept
+
+MAGIC = b'TLRING01'
+# Header: magic, capacity, record size, next record index (monotonic, never wraps)
+HEADER = struct.Struct('<8sIIQ')
+HEADER_SIZE = 64
+INDEX_OFFSET = 16
+
+PATH_LENGTH = 200
+# Slot: sequence (odd while the writer is in it), record index, then the record fields
+SEQUENCE = struct.Struct('<Q')
+RECORD = struct.Struct(f'<Qd12dB{PATH_LENGTH}s')
+SLOT_SIZE = SEQUENCE.size + RECORD.size + SEQUENCE.size
+
+FIELDS = ['timestamp', 'light_level', 'iso', 'shutter_speed', 'lux', 'exposure_time', 'analogue_gain',
+          'digital_gain', 'sensor_temperature', 'metering_time', 'settle_time', 'capture_time', 'total_time',
+          'daylight', 'file_name']
+CaptureRecord = namedtuple('CaptureRecord', ['index'] + FIELDS)
+
+
+def _number(value):
+    """
+    Stores missing or "auto" values as NaN.
+    """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+class CaptureRing:
+    """
+    Fixed-size ring buffer of the most recent capture records in a shared memory file.
+
+    There is one writer (the timelapse process). Each slot is guarded by a sequence counter that is
+    odd while the slot is being written (a seqlock): the writer never waits for anyone, and readers
+    copy a slot and retry if the counter moved. Readers map the file read-only, so watching the live
+    pipeline costs neither disk access nor a database query.
+    """
+
+    def __init__(self, path=RING_PATH, capacity=CAPACITY):
+        self.path = path
+        size = HEADER_SIZE + capacity * SLOT_SIZE
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            existing = os.fstat(fd).st_size
+            if existing != size:
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, size)
+            self.buffer = mmap.mmap(fd, size, access=mmap.ACCESS_WRITE)
+        finally:
+            os.close(fd)
+
+        magic, stored_capacity, record_size, index = HEADER.unpack_from(self.buffer, 0)
+        if magic != MAGIC or stored_capacity != capacity or record_size != RECORD.size:
+            self.buffer[:] = bytes(size)
+            index = 0
+        self.capacity = capacity
+        self.index = index
+        HEADER.pack_into(self.buffer, 0, MAGIC, capacity, RECORD.size, index)
+
+    def append(self, **fields):
+        """
+        Appends a capture record, overwriting the oldest one when the ring is full.
+
+        Parameters:
+            **fields: Any of FIELDS; missing numbers are stored as NaN.
+
+        Returns:
+            int: The record's index.
+        """
+        offset = HEADER_SIZE + (self.index % self.capacity) * SLOT_SIZE
+        sequence = SEQUENCE.unpack_from(self.buffer, offset)[0]
+
+        SEQUENCE.pack_into(self.buffer, offset, sequence + 1)
+        file_name = (fields.get('file_name') or '').encode('utf-8')[:PATH_LENGTH]
+        values = [_number(fields.get(name, time.time() if name == 'timestamp' else None)) for name in FIELDS[:-2]]
+        RECORD.pack_into(self.buffer, offset + SEQUENCE.size, self.index, *values, 1 if fields.get('daylight') else 0, file_name)
+        SEQUENCE.pack_into(self.buffer, offset + SEQUENCE.size + RECORD.size, sequence + 2)
+        SEQUENCE.pack_into(self.buffer, offset, sequence + 2)
+
+        # Publish the record last, so readers never look at a slot before it is complete
+        self.index += 1
+        struct.pack_into('<Q', self.buffer, INDEX_OFFSET, self.index)
+        return self.index - 1
+
+    def close(self):
+        self.buffer.close()
+
+
+class CaptureRingReader:
+    """
+    Read-only view of a capture ring written by another process.
+    """
+
+    def __init__(self, path=RING_PATH):
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            self.buffer = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+        finally:
+            os.close(fd)
+        magic, self.capacity, record_size, _ = HEADER.unpack_from(self.buffer, 0)
+        if magic != MAGIC or record_size != RECORD.size:
+            self.buffer.close()
+            raise ValueError(f"{path} is not a capture ring")
+
+    def next_index(self):
+        return struct.unpack_from('<Q', self.buffer, INDEX_OFFSET)[0]
+
+    def read(self, index, retries=100):
+        """
+        Copies one record out of the ring.
+
+        Parameters:
+            index (int): The record's index.
+            retries (int): How often to retry while the writer is busy with the slot.
+
+        Returns:
+            CaptureRecord: The record, or None if it has been overwritten already.
+        """
+        offset = HEADER_SIZE + (index % self.capacity) * SLOT_SIZE
+        for _ in range(retries):
+            before = SEQUENCE.unpack_from(self.buffer, offset)[0]
+            if before % 2:
+                continue
+            values = RECORD.unpack_from(self.buffer, offset + SEQUENCE.size)
+            after = SEQUENCE.unpack_from(self.buffer, offset + SEQUENCE.size + RECORD.size)[0]
+            if before != after or SEQUENCE.unpack_from(self.buffer, offset)[0] != before:
+                continue
+            if values[0] != index:
+                return None
+            record = list(values)
+            record[-2] = bool(record[-2])
+            record[-1] = record[-1].rstrip(b'\0').decode('utf-8', 'replace')
+            return CaptureRecord(*record)
+        return None
+
+    def latest(self, count=1):
+        """
+        Returns up to `count` of the most recent records, oldest first.
+        """
+        end = self.next_index()
+        records = (self.read(index) for index in range(max(0, end - min(count, self.capacity)), end))
+        return [record for record in records if record is not None]
+
+    def follow(self, poll_interval=0.5):
+        """
+        Yields records as they are appended, starting with the next one.
+        """
+        index = self.next_index()
+        while True:
+            end = self.next_index()
+            if end - index > self.capacity:
+                # Fell behind; skip what has been overwritten
+                index = end - self.capacity
+            while index < end:
+                record = self.read(index)
+                if record is not None:
+                    yield record
+                index += 1
+            time.sleep(poll_interval)
+
+    def close(self):
+        self.buffer.close()
+
+
+_ring = None
+
+def get_capture_ring(config):
+    """
+    Returns the process-wide capture ring writer, or None if it is disabled in config.yaml.
+
+    Parameters:
+        config (dict): The configuration dictionary.
+
+    Returns:
+        CaptureRing: The shared ring.
+    """
+    global _ring
+    settings = config.get('capture_ring', {})
+    if not settings.get('enabled', False):
+        return None
+    if _ring is None:
+        try:
+            _ring = CaptureRing(settings.get('path', RING_PATH), settings.get('capacity', CAPACITY))
+        except OSError as e:
+            print(f"Error opening capture ring: {e}")
+            return None
+    return _ring
+
+
+def format_record(record):
+    return (f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record.timestamp))}  "
+            f"light {record.light_level:6.1f}  ISO {record.iso:6.2f}  shutter {record.shutter_speed:>10.0f}  "
+            f"lux {record.lux:8.1f}  temp {record.sensor_temperature:5.1f}  "
+            f"cycle {record.total_time:5.1f}s  {record.file_name}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Show the most recent captures from the shared capture ring.')
+    parser.add_argument('--path', default=RING_PATH, help='Path of the ring file.')
+    parser.add_argument('-n', '--count', type=int, default=10, help='Number of records to show.')
+    parser.add_argument('--follow', action='store_true', help='Keep printing new captures as they happen.')
+    args = parser.parse_args()
+
+    reader = CaptureRingReader(args.path)
+    for record in reader.latest(args.count):
+        print(format_record(record))
+    if args.follow:
+        try:
+            for record in reader.follow():
+                print(format_record(record))
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,46 @@
+# scripts/storage/rate_limiter.py
+
+import threading
+import time
+
+
+class RateLimiter:
+    """
+    Token bucket that limits throughput in bytes per second.
+
+    Callers report what they are about to read or write with consume(); it sleeps as long as needed
+    to stay under the rate. A single limiter can be shared between threads to cap their combined rate.
+    """
+
+    def __init__(self, rate, burst=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.burst = burst if burst is not None else rate
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = self.burst
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def consume(self, amount):
+        """
+        Takes `amount` bytes from the bucket, sleeping until they are available.
+
+        Parameters:
+            amount (int): Number of bytes.
+
+        Returns:
+            float: Seconds slept.
+        """
+        if not self.rate:
+            return 0.0
+
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+        if wait > 0:
+            self.sleep(wait)
+        return wait
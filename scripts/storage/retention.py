@@ -0,0 +1,321 @@
+# scripts/storage/retention.py
+
+import argparse
+import datetime
+import json
+import os
+import shutil
+import threading
+import time
+
+import yaml
+from PIL import Image
+
+from scripts.image.image_tree import list_day_folders, list_frames, video_path_for_day
+from scripts.image.overlay_sidecar import SIDECAR_FILE
+from scripts.image.proxy_store import update_day as update_proxies_for_day
+from scripts.log.logging import log_message
+from scripts.storage.atomic_write import atomic_save_image, atomic_write_bytes
+from scripts.storage.rate_limiter import RateLimiter
+
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), '../../config.yaml')
+MARKER_FILE = '.retention.json'  # Per-day record of which policy has been applied
+
+# Defaults for the retention section of config.yaml
+HIGH_WATERMARK = 85  # Disk usage (%) at which policies are applied ahead of their age
+LOW_WATERMARK = 75  # Disk usage (%) at which early application stops again
+IO_RATE_LIMIT = 5  # MB/s of combined reads and writes
+BATCH_SIZE = 20  # Files handled per incremental step
+CHECK_INTERVAL = 600  # Seconds between checks when there is nothing to do
+MIN_AGE_DAYS = 1  # Never touch today's (or younger) folders, even under disk pressure
+
+ACTIONS = ('downscale', 'recompress', 'delete')
+
+
+def load_config(config_path=CONFIG_PATH):
+    with open(config_path, 'r') as file:
+        return yaml.safe_load(file)
+
+
+def load_marker(folder):
+    path = os.path.join(folder, MARKER_FILE)
+    if os.path.exists(path):
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"Error reading retention marker {path}: {e}")
+    return {"tier": -1}
+
+
+def save_marker(folder, marker):
+    atomic_write_bytes(os.path.join(folder, MARKER_FILE), json.dumps(marker).encode('utf-8'))
+
+
+def downscale_frame(path, size, quality):
+    """
+    Shrinks a frame to fit within `size`, letting the JPEG decoder do most of the scaling.
+
+    Returns:
+        int: Bytes written (0 if the frame was already small enough).
+    """
+    with Image.open(path) as img:
+        if img.width <= size[0] and img.height <= size[1]:
+            return 0
+        img.draft('RGB', tuple(size))
+        small = img.convert('RGB')
+    small.thumbnail(tuple(size), Image.LANCZOS)
+    return atomic_save_image(small, path, quality=quality, optimize=True)
+
+
+def recompress_frame(path, quality):
+    """
+    Re-encodes a frame at a lower JPEG quality.
+
+    Returns:
+        int: Bytes written.
+    """
+    with Image.open(path) as img:
+        image = img.convert('RGB')
+    return atomic_save_image(image, path, quality=quality, optimize=True)
+
+
+class RetentionEngine:
+    """
+    Applies tiered retention policies to the day folders of the image tree.
+
+    Policies are ordered by age (for example downscale after 14 days, recompress after 30, delete
+    after 90) and only apply to days whose video has been produced. When disk usage reaches the high
+    watermark, the oldest days are moved one tier further regardless of age until usage is back under
+    the low watermark. Work is done a few files at a time; progress within a day is kept in a marker
+    file, so the engine can be interrupted at any point.
+    """
+
+    def __init__(self, config, idle_event=None, logger=None, dry_run=False):
+        settings = config.get('retention', {})
+        self.config = config
+        self.policies = sorted(settings.get('policies', []), key=lambda policy: policy['after_days'])
+        for policy in self.policies:
+            if policy['action'] not in ACTIONS:
+                raise ValueError(f"Unknown retention action: {policy['action']}")
+        self.high_watermark = settings.get('high_watermark', HIGH_WATERMARK)
+        self.low_watermark = settings.get('low_watermark', LOW_WATERMARK)
+        self.require_video = settings.get('require_video', True)
+        self.min_age_days = max(MIN_AGE_DAYS, settings.get('min_age_days', MIN_AGE_DAYS))
+        self.limiter = RateLimiter(settings.get('io_rate_limit', IO_RATE_LIMIT) * 1024 * 1024)
+        self.idle_event = idle_event
+        self.logger = logger
+        self.dry_run = dry_run
+        self.pressure = False
+
+    def log(self, message):
+        if self.logger:
+            log_message(self.logger, message)
+        else:
+            print(message)
+
+    def disk_usage_percent(self):
+        usage = shutil.disk_usage(self.config['image_output']['root_folder'])
+        return 100.0 * usage.used / usage.total
+
+    def update_pressure(self):
+        usage = self.disk_usage_percent()
+        if usage >= self.high_watermark:
+            self.pressure = True
+        elif usage <= self.low_watermark:
+            self.pressure = False
+        return self.pressure
+
+    def target_tier(self, day, today, applied):
+        age = (today - day).days
+        target = -1
+        for index, policy in enumerate(self.policies):
+            if age >= policy['after_days']:
+                target = index
+        if self.pressure:
+            target = max(target, min(applied + 1, len(self.policies) - 1))
+        return target
+
+    def next_task(self, today):
+        """
+        Finds the oldest day that needs a (further) policy applied.
+
+        Parameters:
+            today (date): The current date.
+
+        Returns:
+            tuple: (day, folder, marker, tier index), or None if there is nothing to do.
+        """
+        for day, folder in list_day_folders(self.config):
+            if (today - day).days < self.min_age_days:
+                continue
+            if self.require_video and not os.path.exists(video_path_for_day(self.config, day)):
+                continue
+            marker = load_marker(folder)
+            applied = marker.get('tier', -1)
+            tier = self.target_tier(day, today, applied)
+            if tier > applied:
+                # Tiers are applied in order (downscale, then recompress), except that a
+                # day due for deletion is deleted right away
+                if self.policies[tier]['action'] != 'delete':
+                    tier = applied + 1
+                return day, folder, marker, tier
+        return None
+
+    def process_file(self, path, policy):
+        if self.idle_event is not None:
+            # Never compete with a capture in progress
+            self.idle_event.wait()
+
+        if policy['action'] == 'delete':
+            os.remove(path)
+            return
+
+        if os.path.islink(path):
+            # Near-duplicate references follow the frame they point to
+            return
+        size = os.path.getsize(path)
+        self.limiter.consume(size)
+        if policy['action'] == 'downscale':
+            written = downscale_frame(path, policy.get('size', [1920, 1080]), policy.get('quality', 85))
+        else:
+            written = recompress_frame(path, policy.get('quality', 70))
+        self.limiter.consume(written)
+
+    def apply(self, day, folder, marker, tier, max_files=BATCH_SIZE):
+        """
+        Applies policy `tier` to up to `max_files` frames of a day, continuing where the last call stopped.
+
+        Returns:
+            int: Number of files handled.
+        """
+        policy = self.policies[tier]
+        in_progress = marker.get('in_progress')
+        position = in_progress['position'] if in_progress and in_progress['tier'] == tier else 0
+
+        frames = list_frames(folder, self.config['image_output'].get('image_extension', 'jpg'))
+        if policy['action'] == 'delete':
+            # Deleted files drop out of the listing, so always start from the first remaining one
+            position = 0
+        batch = frames[position:position + max_files]
+
+        if self.dry_run:
+            print(f"{day}: would {policy['action']} {len(frames) - position} frames (policy after {policy['after_days']} days)")
+            return len(frames) - position
+
+        if position == 0 and self.config.get('proxies', {}).get('enabled', False):
+            # Long-range timelapses are made from proxies, so they are taken from the originals first
+            update_proxies_for_day(self.config, day, logger=self.logger)
+
+        for name in batch:
+            try:
+                self.process_file(os.path.join(folder, name), policy)
+            except Exception as e:
+                self.log(f"Retention: error processing {name}: {e}")
+
+        position += len(batch)
+        finished = position >= len(frames)
+        if policy['action'] == 'delete' and finished:
+            self.remove_folder(folder)
+            self.log(f"Retention: deleted {day}")
+        elif finished:
+            save_marker(folder, {"tier": tier, "action": policy['action']})
+            self.log(f"Retention: applied {policy['action']} to {day}")
+        else:
+            save_marker(folder, {"tier": marker.get('tier', -1), "in_progress": {"tier": tier, "position": position}})
+        return len(batch)
+
+    def remove_folder(self, folder):
+        for name in (MARKER_FILE, SIDECAR_FILE):
+            path = os.path.join(folder, name)
+            if os.path.exists(path):
+                os.remove(path)
+        try:
+            os.rmdir(folder)
+        except OSError:
+            # Something other than frames is still in there; leave it
+            pass
+
+    def run_once(self, today=None, max_files=BATCH_SIZE):
+        """
+        Performs one incremental step of retention work.
+
+        Returns:
+            int: Number of files handled (0 when there is nothing to do).
+        """
+        if not self.policies:
+            return 0
+        today = today or datetime.date.today()
+        if not self.dry_run:
+            self.update_pressure()
+        task = self.next_task(today)
+        if task is None:
+            return 0
+        return self.apply(*task, max_files=max_files)
+
+
+class RetentionWorker(threading.Thread):
+    """
+    Runs the retention engine in the background of the timelapse process, at the lowest CPU priority.
+    """
+
+    def __init__(self, engine, check_interval=CHECK_INTERVAL, batch_size=BATCH_SIZE):
+        super().__init__(name="retention", daemon=True)
+        self.engine = engine
+        self.check_interval = check_interval
+        self.batch_size = batch_size
+
+    def run(self):
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+        except (AttributeError, OSError):
+            pass
+
+        while True:
+            try:
+                handled = self.engine.run_once(max_files=self.batch_size)
+            except Exception as e:
+                self.engine.log(f"Retention error: {e}")
+                handled = 0
+            if handled == 0:
+                time.sleep(self.check_interval)
+
+
+def start_retention_worker(config, idle_event=None, logger=None):
+    """
+    Starts the background retention worker if it is enabled in config.yaml.
+
+    Returns:
+        RetentionWorker: The running worker, or None if retention is disabled.
+    """
+    settings = config.get('retention', {})
+    if not settings.get('enabled', False):
+        return None
+    worker = RetentionWorker(RetentionEngine(config, idle_event, logger),
+                             settings.get('check_interval', CHECK_INTERVAL), settings.get('batch_size', BATCH_SIZE))
+    worker.start()
+    return worker
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Apply the retention policies from config.yaml to the image tree.')
+    parser.add_argument('--dry-run', action='store_true', help='Only show what would be done.')
+    args = parser.parse_args()
+
+    config = load_config()
+    engine = RetentionEngine(config, dry_run=args.dry_run)
+    if args.dry_run:
+        today = datetime.date.today()
+        print(f"Disk usage: {engine.disk_usage_percent():.1f}% (high watermark {engine.high_watermark}%, low {engine.low_watermark}%)")
+        for day, folder in list_day_folders(config):
+            marker = load_marker(folder)
+            if (today - day).days < engine.min_age_days:
+                continue
+            if engine.require_video and not os.path.exists(video_path_for_day(config, day)):
+                print(f"{day}: skipped, no video yet")
+                continue
+            for tier in range(marker.get('tier', -1) + 1, engine.target_tier(day, today, marker.get('tier', -1)) + 1):
+                engine.apply(day, folder, marker, tier)
+    else:
+        while engine.run_once():
+            pass
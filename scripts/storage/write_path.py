@@ -0,0 +1,272 @@
+# scripts/storage/write_path.py
+
+import atexit
+import json
+import os
+import threading
+import time
+
+from scripts.log.logging import log_message
+from scripts.storage.atomic_write import atomic_copy, atomic_write_bytes, publish_file
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..'))
+CAPTURE_METADATA_PATH = os.path.join(ROOT_DIR, 'data/capture_metadata.json')
+EVALUATION_METADATA_PATH = os.path.join(ROOT_DIR, 'data/evaluation_measure.json')
+LAST_MEASUREMENT_PATH = os.path.join(ROOT_DIR, 'temp/last_measurement.json')
+LIGHT_VALUATION_PATH = os.path.join(ROOT_DIR, 'temp/light_valuation.jpg')
+
+# State files written every cycle; with a staging dir their live copies sit on the tmpfs and
+# only reach the SD card in the periodic flush
+STATE_FILES = (CAPTURE_METADATA_PATH, EVALUATION_METADATA_PATH, LAST_MEASUREMENT_PATH)
+# Files the metering scripts write in their own process
+METERING_FILES = (EVALUATION_METADATA_PATH, LAST_MEASUREMENT_PATH, LIGHT_VALUATION_PATH)
+
+# Defaults for the storage section of config.yaml
+STATE_FLUSH_INTERVAL = 300  # Seconds between flushes of the state files to data/ and temp/
+
+
+def staging_dir(config):
+    """
+    Returns the configured staging folder (normally on a tmpfs), or None if staging is off.
+    """
+    if not config:
+        return None
+    return config.get('storage', {}).get('staging_dir') or None
+
+
+def camera_state_path(config, durable_path):
+    """
+    Returns a camera's own copy of a state or scratch file when one process drives several cameras,
+    e.g. data/capture_metadata_cam1.json; with a single camera the path is returned unchanged.
+    """
+    camera_id = (config or {}).get('camera_id')
+    if not camera_id:
+        return durable_path
+    stem, extension = os.path.splitext(durable_path)
+    suffix = f"_{camera_id}"
+    return durable_path if stem.endswith(suffix) else f"{stem}{suffix}{extension}"
+
+
+def live_path(config, durable_path):
+    """
+    Returns where a state or scratch file is written during a cycle.
+
+    Parameters:
+        config (dict): The configuration dictionary (None for the durable path).
+        durable_path (str): The file's path under data/ or temp/.
+
+    Returns:
+        str: The path in the staging folder, or the (camera's) durable path if staging is off.
+    """
+    durable_path = camera_state_path(config, durable_path)
+    directory = staging_dir(config)
+    if directory is None:
+        return durable_path
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, os.path.basename(durable_path))
+
+
+def readable_path(config, durable_path):
+    """
+    Returns the freshest existing copy of a state file: the live one if there is one, else the durable one.
+    """
+    path = live_path(config, durable_path)
+    return path if os.path.exists(path) else camera_state_path(config, durable_path)
+
+
+def write_json_state(config, durable_path, data, indent=4):
+    """
+    Atomically writes a state file to its live location (used by the metering scripts).
+
+    Parameters:
+        config (dict): The configuration dictionary.
+        durable_path (str): The file's path under data/ or temp/.
+        data (dict): The content.
+        indent (int, optional): JSON indentation.
+
+    Returns:
+        str: The path written.
+    """
+    path = live_path(config, durable_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    atomic_write_bytes(path, json.dumps(data, indent=indent).encode('utf-8'))
+    return path
+
+
+class WritePath:
+    """
+    Single place where the capture pipeline writes to storage.
+
+    Frames are written and overlaid in a staging location and published with fsync and rename, so
+    the web root never holds a half-written JPEG. With `storage.staging_dir` on a tmpfs, the 4K frame
+    reaches the SD card exactly once. The per-cycle state files are kept live in the staging folder
+    (or in memory) and flushed together every `state_flush_interval` seconds.
+
+    Bytes that reach persistent storage are counted per frame, so the effect on SD card wear can be measured.
+    """
+
+    def __init__(self, config, clock=time.monotonic):
+        settings = config.get('storage', {})
+        self.config = config
+        self.staging_dir = staging_dir(config)
+        self.flush_interval = settings.get('state_flush_interval', STATE_FLUSH_INTERVAL)
+        self.clock = clock
+        self.lock = threading.Lock()
+
+        self.pending = {}  # Durable path -> bytes of state files produced in this process
+        self.seen_mtimes = {}  # Path -> mtime of state files written by the metering scripts
+        self.external_dirty = set()  # Their durable paths that are behind the live copy
+        self.last_flush = clock()
+        self.frame_bytes = {}
+        self.total_bytes = 0
+        self.frames = 0
+
+        if self.staging_dir:
+            os.makedirs(self.staging_dir, exist_ok=True)
+
+    def is_durable(self, path):
+        return self.staging_dir is None or not os.path.abspath(path).startswith(os.path.abspath(self.staging_dir) + os.sep)
+
+    def record(self, category, path, nbytes):
+        """
+        Counts bytes written to `path` if it is on persistent storage.
+        """
+        if nbytes and self.is_durable(path):
+            with self.lock:
+                self.frame_bytes[category] = self.frame_bytes.get(category, 0) + nbytes
+
+    def stage(self, path):
+        """
+        Returns where a frame headed for `path` is written and post-processed before publishing.
+
+        Without a staging folder, this is a hidden file next to the target (same filesystem, so
+        publishing is a rename); the frame listings skip dotfiles.
+        """
+        if self.staging_dir:
+            return os.path.join(self.staging_dir, os.path.basename(path))
+        return os.path.join(os.path.dirname(path), f".{os.path.basename(path)}")
+
+    def save_staged(self, image, staged_path, category='image', **save_options):
+        """
+        Writes an image to its staging path and counts the bytes.
+        """
+        image.save(staged_path, **save_options)
+        self.record(category, staged_path, os.path.getsize(staged_path))
+
+    def publish(self, staged_path, path):
+        """
+        Moves a finished frame from staging into the image tree.
+        """
+        self.record('image', path, publish_file(staged_path, path))
+
+    def write_state(self, durable_path, data):
+        """
+        Stores a state file written by this process (e.g. capture_metadata.json).
+
+        With a staging folder the live copy is written there right away; either way the durable copy
+        is only written by the next flush.
+        """
+        durable_path = camera_state_path(self.config, durable_path)
+        content = json.dumps(data, indent=4, default=str).encode('utf-8')
+        if self.staging_dir:
+            atomic_write_bytes(live_path(self.config, durable_path), content)
+        with self.lock:
+            self.pending[durable_path] = content
+
+    def collect_external_state(self):
+        """
+        Accounts for the state and scratch files the metering scripts wrote since the last call.
+
+        Returns:
+            list: Durable paths whose live copy in the staging folder changed.
+        """
+        changed = []
+        for durable_path in METERING_FILES:
+            path = live_path(self.config, durable_path)
+            try:
+                mtime = os.path.getmtime(path)
+            except OSError:
+                continue
+            if self.seen_mtimes.get(path) == mtime:
+                continue
+            first_look = path not in self.seen_mtimes
+            self.seen_mtimes[path] = mtime
+            if durable_path != LIGHT_VALUATION_PATH:
+                changed.append(camera_state_path(self.config, durable_path))
+            if not first_look:
+                # Files found at startup were written before this process was counting
+                self.record('metering', path, os.path.getsize(path))
+        return changed
+
+    def flush(self, force=False):
+        """
+        Writes the state files to data/ and temp/ if the flush interval has passed (or `force`).
+
+        Returns:
+            int: Bytes written.
+        """
+        changed = self.collect_external_state()
+        if not force and self.clock() - self.last_flush < self.flush_interval:
+            with self.lock:
+                self.external_dirty.update(changed)
+            return 0
+
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            external, self.external_dirty = self.external_dirty | set(changed), set()
+            self.last_flush = self.clock()
+
+        written = 0
+        for durable_path, content in pending.items():
+            try:
+                os.makedirs(os.path.dirname(durable_path), exist_ok=True)
+                written += atomic_write_bytes(durable_path, content)
+            except Exception as e:
+                print(f"Error flushing {durable_path}: {e}")
+        if self.staging_dir:
+            for durable_path in external - set(pending):
+                try:
+                    written += atomic_copy(live_path(self.config, durable_path), durable_path)
+                except Exception as e:
+                    print(f"Error flushing {durable_path}: {e}")
+        self.record('state', ROOT_DIR, written)
+        return written
+
+    def end_frame(self, logger=None):
+        """
+        Finishes a capture cycle: flushes state if due and reports the bytes the frame cost.
+
+        Returns:
+            dict: Bytes written per category for this frame.
+        """
+        self.flush()
+        with self.lock:
+            report, self.frame_bytes = self.frame_bytes, {}
+            frame_total = sum(report.values())
+            self.total_bytes += frame_total
+            self.frames += 1
+
+        details = ", ".join(f"{category} {size / 1024:.0f} KB" for category, size in sorted(report.items()))
+        message = (f"Bytes written this frame: {frame_total / 1024:.0f} KB ({details or 'nothing'}); "
+                   f"average {self.total_bytes / self.frames / 1024:.0f} KB over {self.frames} frames")
+        log_message(logger, message, bytes_written=report)
+        return report
+
+
+_write_paths = {}  # Camera id (None for a single camera) -> WritePath
+
+def get_write_path(config):
+    """
+    Returns the camera's write path, creating it on first use. Pending state is flushed at exit.
+
+    Parameters:
+        config (dict): The configuration dictionary.
+
+    Returns:
+        WritePath: The shared write path.
+    """
+    key = config.get('camera_id')
+    if key not in _write_paths:
+        _write_paths[key] = WritePath(config)
+        atexit.register(_write_paths[key].flush, True)
+    return _write_paths[key]
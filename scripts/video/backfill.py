@@ -0,0 +1,243 @@
+#!/usr/bin/python
+import argparse
+import concurrent.futures
+import datetime
+import hashlib
+import importlib
+import json
+import os
+import sys
+import time
+
+import yaml
+
+from ..log.logging import setup_logger, log_message, logging_options
+from ..image.image_tree import day_folder, parse_date_range
+from ..image.overlay_sidecar import SIDECAR_FILE, sidecar_path
+from ..storage.atomic_write import atomic_write_bytes
+from ..storage.retention import load_marker
+from . import ffmpeg as ff_script
+
+timelapse = importlib.import_module('.create-timelapse', __package__)
+
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), '../../config.yaml')
+MANIFEST_SUFFIX = '.manifest.json'  # Stored next to each video: what it was rendered from
+
+# Defaults for the video_output.backfill section of config.yaml
+WORKERS = 2  # Days rendered at the same time
+CPU_BUDGET = os.cpu_count() or 4  # Encoder threads shared by all workers
+
+
+def load_config(config_path=CONFIG_PATH):
+    with open(config_path, 'r') as config_file:
+        return yaml.safe_load(config_file)
+
+
+def settings_hash(config, include_events):
+    """
+    Hashes everything besides the frames that decides what a rendered video looks like.
+    """
+    outputs = [(profile, profile['name']) for profile in ff_script.video_profiles(config)]
+    settings = ff_script.ffmpeg_settings(config, '<frames>', outputs)
+    return hashlib.sha256(json.dumps([settings, bool(include_events)]).encode('utf-8')).hexdigest()
+
+
+def frames_hash(config, image_files):
+    """
+    Hashes a day's frame set: names, sizes and modification times, in order, plus the overlay sidecars.
+    """
+    digest = hashlib.sha256()
+    folders = []
+    for image_file in image_files:
+        folder = os.path.join(config['image_output']['root_folder'], *image_file.split('_')[1:4])
+        if folder not in folders:
+            folders.append(folder)
+        try:
+            stat = os.stat(os.path.join(folder, image_file))
+            digest.update(f"{image_file}:{stat.st_size}:{stat.st_mtime_ns}\n".encode('utf-8'))
+        except OSError:
+            digest.update(f"{image_file}:missing\n".encode('utf-8'))
+    # Frames stored clean get their overlay from the sidecar, so its changes count as well
+    for folder in folders:
+        try:
+            stat = os.stat(sidecar_path(folder))
+            digest.update(f"{SIDECAR_FILE}:{stat.st_size}:{stat.st_mtime_ns}\n".encode('utf-8'))
+        except OSError:
+            pass
+    return digest.hexdigest()
+
+
+def load_manifest(video_path):
+    try:
+        with open(video_path + MANIFEST_SUFFIX, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class DayJob:
+    """
+    One day of a backfill: its plan, whether it needs rendering, and how it went.
+    """
+
+    def __init__(self, day):
+        self.day = day
+        self.status = 'pending'
+        self.frames = 0
+        self.duration = 0.0
+        self.size = 0
+        self.video_path = None
+        self.image_folder = None
+        self.image_files = []
+        self.manifest = None
+
+
+def plan_jobs(config, start_date, end_date, include_events=None, force=False, dry_run=False):
+    """
+    Plans the days of a backfill and marks the ones whose video is already up to date.
+
+    Planning is done one day at a time, before any rendering starts, because picking a day's
+    frames moves post-midnight frames into the next day's folder. A dry run plans read-only and
+    changes nothing on disk.
+
+    Returns:
+        list: DayJob objects, oldest first.
+    """
+    if include_events is None:
+        include_events = config['video_output'].get('include_event_frames', False)
+    expected_settings = settings_hash(config, include_events)
+
+    jobs = []
+    day = start_date
+    while day <= end_date:
+        job = DayJob(day)
+        jobs.append(job)
+        day += datetime.timedelta(days=1)
+
+        plan = timelapse.plan_timelapse(config, job.day, include_events=include_events, read_only=dry_run)
+        if plan is None or not plan[2]:
+            job.status = 'no frames'
+            continue
+        job.image_folder, job.video_path, job.image_files = plan
+        job.frames = len(job.image_files)
+        job.manifest = {"date": job.day.isoformat(), "settings": expected_settings,
+                        "frames": frames_hash(config, job.image_files), "frame_count": job.frames}
+
+        if force or not all(os.path.exists(ff_script.profile_path(job.video_path, profile)) for profile in ff_script.video_profiles(config)):
+            continue
+        previous = load_manifest(job.video_path)
+        if previous and previous.get('settings') == expected_settings and previous.get('frames') == job.manifest['frames']:
+            job.status = 'up to date'
+        elif previous and previous.get('settings') == expected_settings and load_marker(day_folder(config, job.day)).get('tier', -1) >= 0:
+            # The frames were downscaled or recompressed by retention after the video was made
+            job.status = 'up to date'
+        if job.status == 'up to date':
+            job.size = os.path.getsize(job.video_path)
+    return jobs
+
+
+def render_job(config, job, threads, logger):
+    start = time.time()
+    job.status = 'rendering'
+    try:
+        ok = ff_script.ffmpeg_command(job.image_folder, job.video_path, config, job.image_files, logger, threads=threads)
+    except Exception as e:
+        log_message(logger, f"Backfill of {job.day} failed: {e}")
+        ok = False
+    job.duration = time.time() - start
+    if ok:
+        # The manifest is written last: a day without one (or with an old one) is rendered again next time
+        job.manifest["rendered_at"] = datetime.datetime.now().isoformat(timespec='seconds')
+        atomic_write_bytes(job.video_path + MANIFEST_SUFFIX, json.dumps(job.manifest, indent=4).encode('utf-8'))
+        job.size = os.path.getsize(job.video_path)
+        job.status = 'rendered'
+    else:
+        job.status = 'failed'
+    log_message(logger, f"Backfill {job.day}: {job.status} ({job.frames} frames, {job.duration:.0f} s)",
+                date=job.day.isoformat(), status=job.status, frames=job.frames, seconds=round(job.duration, 1))
+    return job
+
+
+def run_backfill(config, start_date, end_date, workers=None, cpu_budget=None, include_events=None, force=False, dry_run=False):
+    """
+    Renders the videos of a date range, skipping days that are up to date.
+
+    Days are rendered concurrently by `workers` threads, each driving one FFmpeg process limited to
+    its share of `cpu_budget` encoder threads. Every video is written under a temporary name and
+    its manifest only after it is complete, so an interrupted backfill simply resumes when run again.
+
+    Parameters:
+        config (dict): The configuration dictionary.
+        start_date (date): First day.
+        end_date (date): Last day.
+        workers (int, optional): Days rendered at once; defaults to video_output.backfill.workers.
+        cpu_budget (int, optional): Total encoder threads; defaults to video_output.backfill.cpu_budget.
+        include_events (bool, optional): Include scene-change frames.
+        force (bool): Render even days that are up to date.
+        dry_run (bool): Only report what would be rendered.
+
+    Returns:
+        list: The DayJob objects with their outcome.
+    """
+    settings = config['video_output'].get('backfill', {})
+    workers = max(1, workers or settings.get('workers', WORKERS))
+    cpu_budget = max(1, cpu_budget or settings.get('cpu_budget', CPU_BUDGET))
+    threads = max(1, cpu_budget // workers)
+    logger = setup_logger('timelapse_backfill', os.path.join(config['logging']['log_directory'], 'backfill.log'), **logging_options(config))
+
+    jobs = plan_jobs(config, start_date, end_date, include_events, force, dry_run)
+    pending = [job for job in jobs if job.status == 'pending']
+    log_message(logger, f"Backfill {start_date} to {end_date}: {len(pending)} of {len(jobs)} days to render with {workers} workers x {threads} threads")
+    if dry_run:
+        for job in pending:
+            job.status = 'would render'
+        return jobs
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+    try:
+        futures = [executor.submit(render_job, config, job, threads, logger) for job in pending]
+        for future in concurrent.futures.as_completed(futures):
+            future.result()
+    except KeyboardInterrupt:
+        print("Interrupted; finished days are kept, run the same command again to resume.")
+        executor.shutdown(wait=False, cancel_futures=True)
+        for job in pending:
+            if job.status == 'pending':
+                job.status = 'cancelled'
+        raise
+    finally:
+        executor.shutdown(wait=True)
+    return jobs
+
+
+def print_summary(jobs):
+    print(f"{'Date':<12}{'Status':<14}{'Frames':>8}{'Time':>10}{'Size':>10}")
+    print("-" * 54)
+    for job in jobs:
+        duration = f"{job.duration:.0f} s" if job.duration else ""
+        size = f"{job.size / (1024 * 1024):.1f} MB" if job.size else ""
+        print(f"{job.day.isoformat():<12}{job.status:<14}{job.frames:>8}{duration:>10}{size:>10}")
+    totals = {}
+    for job in jobs:
+        totals[job.status] = totals.get(job.status, 0) + 1
+    print("-" * 54)
+    print(", ".join(f"{count} {status}" for status, count in totals.items()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Render (or re-render) the timelapse videos of a date range.')
+    parser.add_argument('--from', dest='start', required=True, help='First date, YYYY-MM-DD.')
+    parser.add_argument('--to', dest='end', help='Last date, YYYY-MM-DD (defaults to --from).')
+    parser.add_argument('--workers', type=int, help='Days rendered at the same time.')
+    parser.add_argument('--cpu-budget', type=int, help='Encoder threads shared by all workers.')
+    parser.add_argument('--force', action='store_true', help='Render even days whose video is up to date.')
+    parser.add_argument('--dry-run', action='store_true', help='Only show which days would be rendered.')
+    parser.add_argument('--include-events', dest='include_events', action='store_true', default=None, help='Include frames captured on scene changes.')
+    parser.add_argument('--exclude-events', dest='include_events', action='store_false', help='Leave out frames captured on scene changes.')
+    args = parser.parse_args()
+
+    start_date, end_date = parse_date_range(args.start, args.end)
+    config = load_config()
+    jobs = run_backfill(config, start_date, end_date, args.workers, args.cpu_budget, args.include_events, args.force, args.dry_run)
+    print_summary(jobs)
+    sys.exit(1 if any(job.status == 'failed' for job in jobs) else 0)
@@ -1,15 +1,17 @@
 #!/usr/bin/python
 import os
 import sys
-import subprocess
 import datetime
 import yaml
 import argparse
 
 
 # Now perform the necessary imports
-from ..log.logging import setup_logger, log_message, setup_logging_directory
+from ..log.logging import setup_logger, log_message, setup_logging_directory, logging_options
 from . import ffmpeg as ff_script
+from ..image.frame_names import is_event_frame, parse_frame_name
+from ..image.duplicate_detector import DUPLICATE_TAG
+from ..config.cameras import camera_configs
 
 def load_config(config_path):
     with open(config_path, 'r') as config_file:
@@ -17,8 +19,8 @@ def load_config(config_path):
 
 # (Rest of your script follows...)
 
-def create_timelapse(config, date=None, upload=True, debug=False, only_upload=False):
-    logger = setup_logger('timelapse_creation', os.path.join(config['logging']['log_directory'], 'create_timelapse.log'))
+def create_timelapse(config, date=None, upload=True, debug=False, only_upload=False, include_events=None):
+    logger = setup_logger('timelapse_creation', os.path.join(config['logging']['log_directory'], 'create_timelapse.log'), **logging_options(config))
 
     # Get the specified or previous day's date
     if date:
@@ -33,6 +35,56 @@ def create_timelapse(config, date=None, upload=True, debug=False, only_upload=Fa
     # Convert date to string format
     specified_date_str = specified_date.strftime('%Y/%m/%d')
 
+    plan = plan_timelapse(config, specified_date, debug, include_events)
+    if plan is None:
+        log_message(logger, f"No images found for {specified_date_str}")
+        return
+    image_folder, video_path, selected_images = plan
+
+    # With only_upload, an earlier run's video is uploaded if there is one
+    rendered = os.path.exists(video_path)
+    if not only_upload:
+        rendered = False
+        if config['video_output'].get('offload', {}).get('enabled', False):
+            # Encode on other machines so the encode does not compete with the captures for the CPU
+            from .encode_offload import render_offloaded
+
+            rendered = render_offloaded(video_path, config, selected_images, logger)
+            if not rendered:
+                log_message(logger, "Encode offload did not complete, encoding locally.")
+        if not rendered:
+            rendered = ff_script.ffmpeg_command(image_folder, video_path, config, selected_images, logger)
+        if not rendered:
+            log_message(logger, f"Timelapse video for {specified_date_str} could not be rendered")
+
+    if config.get('proxies', {}).get('enabled', False):
+        # The day is complete now, so its proxies for long-range timelapses can be made
+        from ..image.proxy_store import update_day as update_proxies_for_day
+
+        update_proxies_for_day(config, specified_date, logger=logger)
+
+    # Upload file; a failed upload stays queued and is resumed by the next run
+    if upload and config.get('video_upload', {}).get('enabled', False) and rendered:
+        from .uploader import queue_upload
+
+        queue_upload(config, video_path, specified_date.strftime('%Y-%m-%d'), logger)
+
+    log_message(logger, f"Timelapse creation complete for {specified_date_str} and stored at {video_path}")
+
+def plan_timelapse(config, specified_date, debug=False, include_events=None, read_only=False):
+    """
+    Works out where a day's video goes and which frames it is made of (05:00 to 05:00 the next day).
+
+    Parameters:
+        config (dict): The configuration dictionary.
+        specified_date (date): The day.
+        debug (bool): Use the debug video folder and file name.
+        include_events (bool, optional): Include scene-change frames; defaults to video_output.include_event_frames.
+        read_only (bool): Only look: do not create the video folder or move post-midnight frames (for dry runs).
+
+    Returns:
+        tuple: (image_folder, video_path, selected_images), or None if the day has no image folder.
+    """
     # Generate the video filename and video parameters
     if debug:
         video_filename = f"{specified_date.strftime('%Y_%m_%d')}_{config['video_output']['video_width']}_{config['video_output']['video_height']}_{config['video_output']['constant_rate_factor']}.{config['video_output']['video_format']}"
@@ -52,34 +104,51 @@ def create_timelapse(config, date=None, upload=True, debug=False, only_upload=Fa
 
     # Check if the image folder exists
     if not os.path.exists(image_folder):
-        log_message(logger, f"No images found for {specified_date_str}")
-        return
+        return None
 
     # Create the timelapse video folder if it doesn't exist
-    os.makedirs(video_folder, exist_ok=True)
+    if not read_only:
+        os.makedirs(video_folder, exist_ok=True)
 
     # Identify the starting and ending images
     start_time_str = specified_date.strftime('_%Y_%m_%d_05_00_00')
     end_time_str = (specified_date + datetime.timedelta(days=1)).strftime('_%Y_%m_%d_05_00_00')
-    start_image, end_image, selected_images = get_image_range_for_period(config, image_folder, start_time_str, end_time_str)
-
-    if not only_upload:
-       ff_script.ffmpeg_command(image_folder, video_path, config, selected_images, logger)
+    if include_events is None:
+        include_events = config['video_output'].get('include_event_frames', False)
+    include_duplicates = not config['video_output'].get('skip_duplicate_frames', False)
+    start_image, end_image, selected_images = get_image_range_for_period(config, image_folder, start_time_str, end_time_str, include_events, include_duplicates, read_only)
+
+    return image_folder, video_path, selected_images
+
+def frame_time(path):
+    """
+    Returns a frame's capture time from its file name.
+
+    Retention rewrites frames in place, which changes their ctime, so the file times no longer say
+    when a frame was taken. Only frames whose name has no timestamp fall back to the ctime (of the
+    link itself for near-duplicate symlinks, not of the referenced frame).
+    """
+    captured, _ = parse_frame_name(path)
+    if captured is not None:
+        return captured
+    return datetime.datetime.fromtimestamp(os.lstat(path).st_ctime).replace(microsecond=0)
+
+def is_duplicate_frame(folder, img):
+    return os.path.islink(os.path.join(folder, img)) or parse_frame_name(img)[1] == DUPLICATE_TAG
+
+def get_images_from_folder(folder, start_time=None, end_time=None, min_size_kb=30, include_events=True, include_duplicates=True):
+    min_size_bytes = min_size_kb * 1024  # Convert KB to bytes
 
-    # Upload file
-    if upload and config.get('video_upload', {}).get('enabled', False):
-        upload_script = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'upload-timelapse-video.py')
-        date_arg = specified_date.strftime('%Y-%m-%d')  # Format the date as 'YYYY-MM-DD'
-        upload_command = ['python3', upload_script, '--file', video_path, '--date', date_arg]
-        subprocess.run(upload_command, check=True)
+    images = sorted([img for img in os.listdir(folder) if img.endswith('.jpg') and not img.startswith('.') and os.path.exists(os.path.join(folder, img)) and os.path.getsize(os.path.join(folder, img)) > min_size_bytes],
+                    key=lambda x: frame_time(os.path.join(folder, x)))
 
-    log_message(logger, f"Timelapse creation complete for {specified_date_str} and stored at {video_path}")
-
-def get_images_from_folder(folder, start_time=None, end_time=None, min_size_kb=30):
-    min_size_bytes = min_size_kb * 1024  # Convert KB to bytes
+    # Frames captured on a scene change are tagged in their name and can be left out
+    if not include_events:
+        images = [img for img in images if not is_event_frame(img)]
 
-    images = sorted([img for img in os.listdir(folder) if img.endswith('.jpg') and os.path.getsize(os.path.join(folder, img)) > min_size_bytes],
-                    key=lambda x: os.path.getctime(os.path.join(folder, x)))
+    # Near-duplicates (references or flagged frames) add nothing but decode time
+    if not include_duplicates:
+        images = [img for img in images if not is_duplicate_frame(folder, img)]
 
     if start_time is None and end_time is None:
         return images
@@ -87,9 +156,7 @@ def get_images_from_folder(folder, start_time=None, end_time=None, min_size_kb=3
     selected_images = []
 
     for img in images:
-        img_path = os.path.join(folder, img)
-        img_date_str = datetime.datetime.fromtimestamp(os.path.getctime(img_path)).strftime('%Y_%m_%d_%H_%M_%S')
-        img_datetime = datetime.datetime.strptime(img_date_str, '%Y_%m_%d_%H_%M_%S')
+        img_datetime = frame_time(os.path.join(folder, img))
 
         if start_time and img_datetime < start_time:
             continue
@@ -101,28 +168,32 @@ def get_images_from_folder(folder, start_time=None, end_time=None, min_size_kb=3
 
     return selected_images
 
-def get_image_range_for_period(config, image_folder, start_time_str, end_time_str):
+def get_image_range_for_period(config, image_folder, start_time_str, end_time_str, include_events=True, include_duplicates=True, read_only=False):
     start_datetime = datetime.datetime.strptime(start_time_str, '_%Y_%m_%d_%H_%M_%S')
     end_datetime = datetime.datetime.strptime(end_time_str, '_%Y_%m_%d_%H_%M_%S')
 
     # Get images from the first day (05:00 to midnight)
-    first_day_images = get_images_from_folder(image_folder, start_time=start_datetime)
+    first_day_images = get_images_from_folder(image_folder, start_time=start_datetime, include_events=include_events, include_duplicates=include_duplicates)
 
     # Calculate the next day date and its folder
     next_day_date = (datetime.datetime.strptime(start_time_str, '_%Y_%m_%d_%H_%M_%S').date() + datetime.timedelta(days=1))
     next_day_folder = os.path.join(config['image_output']['root_folder'], next_day_date.strftime('%Y/%m/%d'))
 
-    # If the next_day_folder doesn't exist, create it
-    if not os.path.exists(next_day_folder):
-        os.makedirs(next_day_folder, exist_ok=True)
+    # A read-only plan leaves post-midnight frames where they are; they are then found in the first folder
+    if not read_only:
+        # If the next_day_folder doesn't exist, create it
+        if not os.path.exists(next_day_folder):
+            os.makedirs(next_day_folder, exist_ok=True)
 
-    # For every image after midnight, move them to the next_day_folder
-    for img in os.listdir(image_folder):
-        if img.startswith(next_day_date.strftime('%Y_%m_%d')):
-            os.rename(os.path.join(image_folder, img), os.path.join(next_day_folder, img))
+        # For every image after midnight, move them to the next_day_folder
+        for img in os.listdir(image_folder):
+            if img.startswith(next_day_date.strftime('%Y_%m_%d')):
+                os.rename(os.path.join(image_folder, img), os.path.join(next_day_folder, img))
 
     # Now, get images from the next day (midnight to 05:00)
-    second_day_images = get_images_from_folder(next_day_folder, end_time=end_datetime)
+    second_day_images = []
+    if os.path.isdir(next_day_folder):
+        second_day_images = get_images_from_folder(next_day_folder, end_time=end_datetime, include_events=include_events, include_duplicates=include_duplicates)
 
     # Combine lists
     all_images = first_day_images + second_day_images
@@ -138,6 +209,8 @@ if __name__ == "__main__":
     parser.add_argument('--dont-upload', action='store_true', help='If set, the video will not be uploaded.')
     parser.add_argument('--only-upload', action='store_true', help='If set, only the upload will be done without creating a new timelapse.')
     parser.add_argument('--debug', action='store_true', help='If set, debug mode will be enabled.')
+    parser.add_argument('--include-events', dest='include_events', action='store_true', default=None, help='Include frames captured on scene changes (overrides video_output.include_event_frames).')
+    parser.add_argument('--exclude-events', dest='include_events', action='store_false', help='Leave out frames captured on scene changes.')
     args = parser.parse_args()
 
     if args.only_upload and args.dont_upload:
@@ -146,4 +219,6 @@ if __name__ == "__main__":
 
     config = load_config(os.path.join(os.path.dirname(__file__), '../../config.yaml'))
 
-    create_timelapse(config, args.date, not args.dont_upload, args.debug, args.only_upload)
+    # One video per camera, each from its own image folder
+    for camera in camera_configs(config):
+        create_timelapse(camera, args.date, not args.dont_upload, args.debug, args.only_upload, args.include_events)
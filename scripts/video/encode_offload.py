@@ -0,0 +1,459 @@
+#!/usr/bin/python
+import hashlib
+import json
+import os
+import secrets
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http import server
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, urlparse
+
+from ..log.logging import log_message
+from ..image.add_image_overlay import OVERLAY_IMAGE_PATH
+from ..storage.atomic_write import atomic_write_bytes
+from . import ffmpeg as ff_script
+from .overlay_subtitles import write_overlay_subtitles
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..'))
+DATA_DIR = os.path.join(ROOT, 'data')
+
+# Defaults for the video_output.offload section of config.yaml
+PORT = 8765
+SEGMENT_FRAMES = 600  # Frames per segment a worker encodes
+LEASE_SECONDS = 120  # A segment whose worker stops renewing its lease this long is handed out again
+MAX_ATTEMPTS = 3  # Leases per segment before the render gives up
+WORKER_TIMEOUT = 900  # Seconds without any worker activity before the Pi encodes the video itself
+LOCAL_WORKERS = 0  # Workers started on this machine (for testing the setup without other machines)
+
+CONTEXT_FRAMES = 4  # Frames decoded on both sides of a segment, so the deflicker window (5 frames) matches a full render
+NO_WORK_WAIT = 5  # Seconds a worker is told to wait when every remaining segment is leased
+
+
+class LeaseError(Exception):
+    """
+    Raised for a lease that is unknown, expired or does not cover the request.
+    """
+
+
+class Segment:
+    """
+    A run of frames encoded by one worker into one file per profile.
+    """
+
+    def __init__(self, index, first, end):
+        self.index = index
+        self.first = first
+        self.end = end
+        self.state = 'pending'  # pending, leased, done or failed
+        self.attempts = 0
+        self.lease = None
+        self.expires = 0
+        self.worker = None
+        self.error = None
+        self.outputs = {}  # Profile number -> stored segment file
+        self.overlay = None  # Subtitle track of the segment's frames, for frames stored clean
+
+    def context(self, frame_count):
+        return max(0, self.first - CONTEXT_FRAMES), min(frame_count, self.end + CONTEXT_FRAMES)
+
+
+class RenderJob:
+    """
+    One video split into segments that workers lease, encode and upload.
+
+    A lease is handed out per segment and has to be renewed while the worker encodes; a segment whose
+    lease expires, or whose worker reports a failure, goes back to the queue until it has been leased
+    `max_attempts` times. Uploads are only accepted from the current lease holder and with a matching
+    SHA-256, so a slow or broken worker can never overwrite a good segment.
+    """
+
+    def __init__(self, frame_paths, profiles, framerate, segment_dir, camera_name="Camera", segment_frames=SEGMENT_FRAMES,
+                 lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS, clock=time.time):
+        self.frame_paths = frame_paths
+        self.profiles = profiles
+        self.framerate = framerate
+        self.segment_dir = segment_dir
+        self.camera_name = camera_name
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.clock = clock
+        self.segments = [Segment(index, first, min(first + segment_frames, len(frame_paths)))
+                         for index, first in enumerate(range(0, len(frame_paths), segment_frames))]
+        # The tracks are made before any worker can lease, so lease() never reads frames or sidecars under the lock
+        for segment in self.segments:
+            segment.overlay = self._overlay(segment)
+        self.leases = {}
+        self.last_activity = clock()
+        self.condition = threading.Condition()
+
+    @property
+    def finished(self):
+        return all(segment.state == 'done' for segment in self.segments)
+
+    @property
+    def failed(self):
+        return next((segment for segment in self.segments if segment.state == 'failed'), None)
+
+    def counts(self):
+        counts = {}
+        for segment in self.segments:
+            counts[segment.state] = counts.get(segment.state, 0) + 1
+        return counts
+
+    def _release(self, segment, error):
+        self.leases.pop(segment.lease, None)
+        segment.lease = None
+        segment.error = error
+        segment.state = 'failed' if segment.attempts >= self.max_attempts else 'pending'
+        self.condition.notify_all()
+
+    def _expire(self):
+        now = self.clock()
+        for segment in self.segments:
+            if segment.state == 'leased' and segment.expires < now:
+                self._release(segment, f"lease of {segment.worker} expired")
+
+    def _segment(self, lease):
+        segment = self.leases.get(lease)
+        if segment is None or segment.lease != lease or segment.state != 'leased':
+            raise LeaseError("Unknown or expired lease")
+        return segment
+
+    def _overlay(self, segment):
+        with tempfile.NamedTemporaryFile('r', suffix='.ass', dir=self.segment_dir) as track:
+            covered, size = write_overlay_subtitles(track.name, self.frame_paths[segment.first:segment.end], self.camera_name)
+            return {"subtitles": track.read(), "source_size": list(size)} if covered else None
+
+    def lease(self, worker):
+        """
+        Leases the next pending segment to a worker.
+
+        A worker that already holds a lease gets that one again, with its time renewed: a retried
+        request whose answer was lost must not lease (and use up an attempt of) a second segment.
+
+        Returns:
+            dict: The task (see the worker), {"wait": seconds} if every remaining segment is leased,
+            or {"finished": True} once the job is done or has failed.
+        """
+        with self.condition:
+            self._expire()
+            self.last_activity = self.clock()
+            if self.finished or self.failed:
+                return {"finished": True}
+            held = next((segment for segment in self.segments if segment.state == 'leased' and segment.worker == worker), None)
+            if held is not None:
+                held.expires = self.clock() + self.lease_seconds
+                return self._task(held)
+            segment = next((segment for segment in self.segments if segment.state == 'pending'), None)
+            if segment is None:
+                return {"wait": NO_WORK_WAIT}
+            segment.state = 'leased'
+            segment.attempts += 1
+            segment.worker = worker
+            segment.lease = secrets.token_hex(16)
+            segment.expires = self.clock() + self.lease_seconds
+            segment.outputs = {}
+            self.leases[segment.lease] = segment
+            return self._task(segment)
+
+    def _task(self, segment):
+        context_first, context_end = segment.context(len(self.frame_paths))
+        return {
+            "lease": segment.lease,
+            "lease_seconds": self.lease_seconds,
+            "segment": segment.index,
+            "first": segment.first,
+            "end": segment.end,
+            "context_first": context_first,
+            "context_end": context_end,
+            "framerate": self.framerate,
+            "profiles": self.profiles,
+            "overlay": segment.overlay,
+        }
+
+    def renew(self, lease):
+        with self.condition:
+            segment = self._segment(lease)
+            segment.expires = self.clock() + self.lease_seconds
+            self.last_activity = self.clock()
+
+    def frame_path(self, lease, index):
+        """
+        Returns the path of a frame, if it is one the lease's segment needs.
+        """
+        with self.condition:
+            segment = self._segment(lease)
+            context_first, context_end = segment.context(len(self.frame_paths))
+            if not context_first <= index < context_end:
+                raise LeaseError(f"Frame {index} is not part of segment {segment.index}")
+            return self.frame_paths[index]
+
+    def check_lease(self, lease):
+        with self.condition:
+            self._segment(lease)
+
+    def store(self, lease, profile_index, data):
+        """
+        Stores an encoded segment file; the segment is done once every profile has been stored.
+        """
+        with self.condition:
+            segment = self._segment(lease)
+            if not 0 <= profile_index < len(self.profiles):
+                raise LeaseError(f"Unknown profile {profile_index}")
+            path = os.path.join(self.segment_dir, f"{segment.index:05d}_{profile_index}.{self.profiles[profile_index]['container']}")
+        atomic_write_bytes(path, data)
+        with self.condition:
+            # The lease may have expired during the write
+            segment = self._segment(lease)
+            segment.outputs[profile_index] = path
+            segment.expires = self.clock() + self.lease_seconds
+            self.last_activity = self.clock()
+            if len(segment.outputs) == len(self.profiles):
+                segment.state = 'done'
+                self.leases.pop(lease, None)
+                self.condition.notify_all()
+
+    def fail(self, lease, error):
+        with self.condition:
+            segment = self._segment(lease)
+            self.last_activity = self.clock()
+            self._release(segment, f"{segment.worker}: {error}")
+
+    def wait(self, timeout):
+        with self.condition:
+            self._expire()
+            self.condition.wait(timeout)
+            self._expire()
+
+
+class OffloadHandler(server.BaseHTTPRequestHandler):
+    """
+    The job protocol, JSON over HTTP:
+
+        POST /lease {"worker": name}            -> a task, {"wait": seconds} or {"finished": true};
+                                                   a worker holding a lease gets the same task again
+        POST /renew?lease=...                   -> keep the lease while encoding
+        GET  /frames/<n>?lease=...              -> frame n of the video (X-Content-SHA256 header)
+        GET  /overlay.png?lease=...             -> the overlay graphic for frames stored clean
+        PUT  /segments/<profile>?lease=...      -> an encoded segment (X-Content-SHA256 header)
+        POST /fail?lease=... {"error": text}    -> give the segment back
+    """
+
+    def do_GET(self):
+        self.handle_request('GET')
+
+    def do_POST(self):
+        self.handle_request('POST')
+
+    def do_PUT(self):
+        self.handle_request('PUT')
+
+    def handle_request(self, method):
+        job = self.server.job
+        url = urlparse(self.path)
+        lease = parse_qs(url.query).get('lease', [None])[0]
+        parts = url.path.strip('/').split('/')
+        token = self.server.token
+        if token and not secrets.compare_digest(self.headers.get('Authorization', ''), f"Bearer {token}"):
+            self.send_json(401, {"error": "Unauthorized"})
+            return
+        try:
+            if method == 'POST' and parts == ['lease']:
+                self.send_json(200, job.lease(str(self.read_json().get('worker', self.client_address[0]))))
+            elif method == 'POST' and parts == ['renew']:
+                job.renew(lease)
+                self.send_json(200, {})
+            elif method == 'POST' and parts == ['fail']:
+                job.fail(lease, str(self.read_json().get('error', 'unknown error')))
+                self.send_json(200, {})
+            elif method == 'GET' and len(parts) == 2 and parts[0] == 'frames' and parts[1].isdigit():
+                self.send_file(job.frame_path(lease, int(parts[1])), 'image/jpeg')
+            elif method == 'GET' and parts == ['overlay.png']:
+                job.check_lease(lease)
+                self.send_file(OVERLAY_IMAGE_PATH, 'image/png')
+            elif method == 'PUT' and len(parts) == 2 and parts[0] == 'segments' and parts[1].isdigit():
+                data = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if hashlib.sha256(data).hexdigest() != self.headers.get('X-Content-SHA256'):
+                    self.send_json(422, {"error": "Checksum mismatch"})
+                    return
+                job.store(lease, int(parts[1]), data)
+                self.send_json(200, {})
+            else:
+                self.send_json(404, {"error": "Not found"})
+        except LeaseError as e:
+            self.send_json(409, {"error": str(e)})
+        except (OSError, ValueError) as e:
+            self.send_json(500, {"error": str(e)})
+
+    def read_json(self):
+        length = int(self.headers.get('Content-Length', 0))
+        return json.loads(self.rfile.read(length)) if length else {}
+
+    def send_json(self, status, payload):
+        content = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def send_file(self, path, content_type):
+        with open(path, 'rb') as f:
+            content = f.read()
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(content)))
+        self.send_header('X-Content-SHA256', hashlib.sha256(content).hexdigest())
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        # Workers poll; keep the render log to the job's own messages
+        pass
+
+
+class ThreadingHTTPServer(ThreadingMixIn, server.HTTPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class EncodeCoordinator:
+    """
+    Serves a RenderJob to encode workers over HTTP (see OffloadHandler for the protocol).
+    """
+
+    def __init__(self, job, port=PORT, token=None, host=''):
+        self.job = job
+        self.httpd = ThreadingHTTPServer((host, port), OffloadHandler)
+        self.httpd.job = job
+        self.httpd.token = token
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="encode-coordinator", daemon=True)
+
+    @property
+    def port(self):
+        return self.httpd.server_address[1]
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def start_local_workers(count, url, token=None):
+    """
+    Starts encode workers on this machine, e.g. to try the setup with every worker on localhost.
+
+    Returns:
+        list: The worker processes.
+    """
+    command = [sys.executable, '-m', 'scripts.video.encode_worker', url, '--idle-exit', '30']
+    if token:
+        command += ['--token', token]
+    return [subprocess.Popen(command + ['--name', f"local-{number}"], cwd=ROOT) for number in range(count)]
+
+
+def concat_segments(segment_paths, output_path, list_path):
+    """
+    Joins encoded segments into one video without re-encoding them.
+
+    Returns:
+        tuple: (return code, stderr text)
+    """
+    with open(list_path, 'w') as f:
+        for path in segment_paths:
+            f.write(f"file '{path}'\n")
+    process = subprocess.run(['ffmpeg', '-y', '-f', 'concat', '-safe', '0', '-i', list_path, '-c', 'copy', output_path],
+                             capture_output=True, text=True)
+    return process.returncode, process.stderr
+
+
+def render_offloaded(video_path, config, image_files, logger=None):
+    """
+    Renders a video on encode workers instead of this machine (video_output.offload).
+
+    The frames are split into segments; workers lease them over HTTP, fetch their frames, encode
+    every profile of the segment and upload the results, which are joined here with a stream copy.
+    Each segment is encoded with a few frames of context on both sides, so the deflicker filter
+    gives the same result at segment boundaries as in a single render. The finished videos are
+    renamed into place like a local render.
+
+    Parameters:
+        video_path (str): Where to store the main video.
+        config (dict): The configuration dictionary.
+        image_files (list): Frame file names in order.
+        logger (logging.Logger, optional): Logger for status messages.
+
+    Returns:
+        bool: True if the videos were created; False if no worker picked up the job in time or a
+        segment failed on every attempt, so the caller can encode locally instead.
+    """
+    settings = config['video_output'].get('offload', {})
+    frame_paths = ff_script.frame_paths(config, image_files)
+    if not frame_paths:
+        return False
+    profiles = ff_script.video_profiles(config)
+    outputs = [(profile, ff_script.profile_path(video_path, profile)) for profile in profiles]
+    name = os.path.splitext(os.path.basename(video_path))[0]
+    segment_dir = os.path.join(DATA_DIR, f"encode_{name}")
+    shutil.rmtree(segment_dir, ignore_errors=True)
+    os.makedirs(segment_dir)
+
+    job = RenderJob(frame_paths, profiles, config['video_output']['framerate'], segment_dir,
+                    camera_name=config['camera_settings'].get('name', "Camera Name"),
+                    segment_frames=settings.get('segment_frames', SEGMENT_FRAMES),
+                    lease_seconds=settings.get('lease_seconds', LEASE_SECONDS),
+                    max_attempts=settings.get('max_attempts', MAX_ATTEMPTS))
+    token = settings.get('token') or None
+    coordinator = EncodeCoordinator(job, settings.get('port', PORT), token)
+    coordinator.start()
+    workers = start_local_workers(settings.get('local_workers', LOCAL_WORKERS), f"http://127.0.0.1:{coordinator.port}", token)
+    worker_timeout = settings.get('worker_timeout', WORKER_TIMEOUT)
+    log_message(logger, f"Offloading {len(frame_paths)} frames in {len(job.segments)} segments on port {coordinator.port}",
+                frames=len(frame_paths), segments=len(job.segments))
+
+    start_time = time.time()
+    try:
+        reported = None
+        while not job.finished:
+            job.wait(5)
+            counts = job.counts()
+            if counts != reported:
+                log_message(logger, "Encode segments: " + ", ".join(f"{count} {state}" for state, count in counts.items()), **counts)
+                reported = counts
+            failed = job.failed
+            if failed is not None:
+                log_message(logger, f"Segment {failed.index} failed {failed.attempts} times, last error: {failed.error}")
+                return False
+            if time.time() - job.last_activity > worker_timeout:
+                log_message(logger, f"No encode worker activity for {worker_timeout} seconds")
+                return False
+
+        partial_outputs = [(profile, ff_script.partial_path(path)) for profile, path in outputs]
+        for index, (profile, partial) in enumerate(partial_outputs):
+            segment_paths = [segment.outputs[index] for segment in job.segments]
+            returncode, errors = concat_segments(segment_paths, partial, os.path.join(segment_dir, f"concat_{index}.txt"))
+            if returncode != 0:
+                log_message(logger, f"FFmpeg Error joining segments: {errors}")
+                for _, path in partial_outputs:
+                    if os.path.exists(path):
+                        os.remove(path)
+                return False
+        for (_, path), (_, partial) in zip(outputs, partial_outputs):
+            os.replace(partial, path)
+    finally:
+        coordinator.stop()
+        for worker in workers:
+            worker.terminate()
+        shutil.rmtree(segment_dir, ignore_errors=True)
+
+    workers_used = sorted({segment.worker for segment in job.segments})
+    log_message(logger, f"Timelapse encoded by {', '.join(workers_used)} in {ff_script.format_duration(time.time() - start_time)}",
+                workers=workers_used, path=video_path)
+    return True
@@ -0,0 +1,228 @@
+#!/usr/bin/python
+import argparse
+import hashlib
+import json
+import os
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from . import ffmpeg as ff_script
+
+# Defaults for the command line
+POLL = 10  # Seconds between lease requests while there is no work
+RETRIES = 4  # Attempts per request before the worker gives up on a segment
+BACKOFF = 2.0  # Seconds before the first retry, doubled for every further one
+TIMEOUT = 60  # Seconds per HTTP request
+
+
+class ProtocolError(Exception):
+    """
+    Raised when the coordinator refuses a request (e.g. the lease expired) or a transfer stays corrupt.
+    """
+
+    def __init__(self, status, message):
+        super().__init__(f"{status}: {message}")
+        self.status = status
+
+
+class CoordinatorClient:
+    """
+    Talks to an EncodeCoordinator (see scripts/video/encode_offload.py for the protocol).
+
+    Network errors and server errors are retried with exponential backoff; a refused request
+    (4xx) is not, as retrying would not change the answer. Every request is safe to repeat: a
+    repeated lease request returns the lease the worker already holds.
+    """
+
+    def __init__(self, url, token=None, retries=RETRIES, backoff=BACKOFF, timeout=TIMEOUT, sleep=time.sleep):
+        self.url = url.rstrip('/')
+        self.token = token
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.sleep = sleep
+
+    def request(self, method, path, data=None, headers=None, lease=None, verify=False):
+        """
+        Sends a request, retrying transient failures.
+
+        Parameters:
+            verify (bool): Check the body against the X-Content-SHA256 header and retry on a mismatch.
+
+        Returns:
+            bytes: The response body.
+        """
+        url = self.url + path + (f"?lease={lease}" if lease else '')
+        headers = dict(headers or {})
+        if self.token:
+            headers['Authorization'] = f"Bearer {self.token}"
+        for attempt in range(self.retries):
+            try:
+                with urllib.request.urlopen(urllib.request.Request(url, data=data, headers=headers, method=method), timeout=self.timeout) as response:
+                    body = response.read()
+                    if not verify or hashlib.sha256(body).hexdigest() == response.headers.get('X-Content-SHA256'):
+                        return body
+                    error = ProtocolError(response.status, f"checksum mismatch for {path}")
+            except urllib.error.HTTPError as e:
+                message = e.read().decode('utf-8', 'replace')
+                # A checksum mismatch on an upload is a transfer error as well
+                if e.code < 500 and e.code != 422:
+                    raise ProtocolError(e.code, message)
+                error = ProtocolError(e.code, message)
+            except (urllib.error.URLError, OSError) as e:
+                error = e
+            if attempt + 1 < self.retries:
+                self.sleep(self.backoff * 2 ** attempt)
+        raise error
+
+    def call(self, method, path, payload=None, lease=None):
+        data = json.dumps(payload).encode('utf-8') if payload is not None else None
+        body = self.request(method, path, data, {'Content-Type': 'application/json'}, lease)
+        return json.loads(body) if body else {}
+
+    def download(self, path, target, lease):
+        with open(target, 'wb') as f:
+            f.write(self.request('GET', path, lease=lease, verify=True))
+
+    def upload(self, path, source, lease):
+        with open(source, 'rb') as f:
+            data = f.read()
+        headers = {'Content-Type': 'application/octet-stream', 'X-Content-SHA256': hashlib.sha256(data).hexdigest()}
+        self.request('PUT', path, data, headers, lease)
+
+
+class LeaseKeeper:
+    """
+    Renews a lease in the background while the segment is encoded.
+    """
+
+    def __init__(self, client, task):
+        self.client = client
+        self.lease = task['lease']
+        self.interval = task['lease_seconds'] / 3
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="lease-keeper", daemon=True)
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.client.call('POST', '/renew', lease=self.lease)
+            except Exception as e:
+                print(f"Could not renew lease: {e}")
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+
+
+def encode_segment(client, task, work_dir, threads=None):
+    """
+    Fetches a segment's frames and encodes every profile of it.
+
+    Parameters:
+        client (CoordinatorClient): The coordinator.
+        task (dict): The leased task.
+        work_dir (str): Empty folder for the frames and outputs.
+        threads (int, optional): Limit on FFmpeg's encoder threads.
+
+    Returns:
+        list: The encoded files, one per profile in the task's order.
+    """
+    lease = task['lease']
+    list_path = os.path.join(work_dir, 'frames.txt')
+    with open(list_path, 'w') as f:
+        for index in range(task['context_first'], task['context_end']):
+            frame_path = os.path.join(work_dir, f"{index:06d}.jpg")
+            client.download(f"/frames/{index}", frame_path, lease)
+            f.write(f"file '{frame_path}'\n")
+
+    overlay = None
+    if task.get('overlay'):
+        subtitles_path = os.path.join(work_dir, 'overlay.ass')
+        with open(subtitles_path, 'w', encoding='utf-8') as f:
+            f.write(task['overlay']['subtitles'])
+        image_path = os.path.join(work_dir, 'overlay.png')
+        client.download('/overlay.png', image_path, lease)
+        from PIL import Image
+
+        with Image.open(image_path) as overlay_image:
+            image_size = overlay_image.size
+        overlay = {"subtitles": subtitles_path, "image": image_path, "image_size": image_size, "source_size": task['overlay']['source_size']}
+
+    outputs = [(profile, os.path.join(work_dir, f"segment_{number}.{profile['container']}")) for number, profile in enumerate(task['profiles'])]
+    frame_range = (task['first'] - task['context_first'], task['end'] - task['context_first'])
+    settings = ff_script.ffmpeg_settings({'video_output': {'framerate': task['framerate']}}, list_path, outputs,
+                                         max(1, threads // len(outputs)) if threads else None, overlay, frame_range)
+    command = ['ffmpeg', '-loglevel', 'error'] + [item for setting in settings for item in setting if item is not None]
+    process = subprocess.run(command, capture_output=True, text=True)
+    if process.returncode != 0:
+        raise RuntimeError(f"FFmpeg failed: {process.stderr.strip()[-500:]}")
+    return [path for _, path in outputs]
+
+
+def run_worker(url, token=None, name=None, threads=None, idle_exit=None, poll=POLL):
+    """
+    Leases, encodes and uploads segments until stopped, or until idle for `idle_exit` seconds.
+
+    A segment that cannot be encoded is given back with its error, so the coordinator can hand it
+    to another worker.
+    """
+    client = CoordinatorClient(url, token)
+    # Leases are per worker name, so two workers on one host need different names
+    name = name or f"{socket.gethostname()}-{os.getpid()}"
+    last_work = time.time()
+    while True:
+        try:
+            task = client.call('POST', '/lease', {"worker": name})
+        except ProtocolError as e:
+            if e.status in (401, 403):
+                raise
+            print(f"Lease request failed: {e}")
+            task = {}
+        except Exception:
+            # No render running
+            task = {}
+
+        if 'lease' not in task:
+            if idle_exit is not None and time.time() - last_work > idle_exit:
+                return
+            time.sleep(task.get('wait', poll))
+            continue
+
+        print(f"Encoding segment {task['segment']} (frames {task['first']}-{task['end'] - 1})")
+        start_time = time.time()
+        with tempfile.TemporaryDirectory(prefix='encode_') as work_dir:
+            try:
+                with LeaseKeeper(client, task):
+                    paths = encode_segment(client, task, work_dir, threads)
+                    for number, path in enumerate(paths):
+                        client.upload(f"/segments/{number}", path, task['lease'])
+                print(f"Segment {task['segment']} done in {time.time() - start_time:.1f} seconds")
+            except Exception as e:
+                print(f"Segment {task['segment']} failed: {e}")
+                try:
+                    client.call('POST', '/fail', {"error": str(e)}, task['lease'])
+                except Exception:
+                    pass
+        last_work = time.time()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Encode timelapse segments for a Pi that offloads its video encode (video_output.offload).')
+    parser.add_argument('url', help='The coordinator, e.g. http://timelapse-pi:8765')
+    parser.add_argument('--token', help='Shared token (video_output.offload.token).')
+    parser.add_argument('--name', help='Worker name, unique per worker process (default: host name and process id).')
+    parser.add_argument('--threads', type=int, help='Limit on FFmpeg encoder threads.')
+    parser.add_argument('--idle-exit', type=float, help='Exit after this many seconds without work.')
+    parser.add_argument('--poll', type=float, default=POLL, help='Seconds between lease requests while there is no work.')
+    args = parser.parse_args()
+
+    run_worker(args.url, args.token, args.name, args.threads, args.idle_exit, args.poll)
@@ -1,50 +1,245 @@
 #!/usr/bin/python
 import subprocess
 import os
+import tempfile
 import time
-from colored import fg, attr
 from ..log.logging import setup_logger, log_message, setup_logging_directory
+from ..image.add_image_overlay import OVERLAY_IMAGE_PATH
+from .overlay_subtitles import overlay_filter, write_overlay_subtitles
 
 def format_duration(duration):
     minutes = int(duration // 60)
     seconds = int(duration % 60)
     return f"{minutes} minutes, {seconds} seconds"
-def ffmpeg_command(image_folder, video_path, config, image_files, logger):
-    # Ensure the data directory exists
-    data_dir = os.path.abspath(os.path.join(os.path.dirname(os.path.realpath(__file__)), '../../data'))
-    os.makedirs(data_dir, exist_ok=True)
+def video_profiles(config):
+    """
+    Returns the video variants to render: video_output.profiles, or a single profile made from the
+    top-level video_output settings.
 
-    # Path to the ffmpeg_list.txt file
-    list_path = os.path.join(data_dir, 'ffmpeg_list.txt')
-    
-    # Generate the list of image files for FFmpeg
-    with open(list_path, 'w') as f:
-        for image_file in image_files:
-            # Determine the correct folder for each image based on its filename
-            date_part = image_file.split('_')[1:4]
-            correct_folder = os.path.join(config['image_output']['root_folder'], *date_part)
-            f.write(f"file '{os.path.join(correct_folder, image_file)}'\n")
+    The first profile is the day's main video at the usual path; the others are stored next to it
+    with their suffix (default: _<name>).
+
+    Parameters:
+        config (dict): The configuration dictionary.
+
+    Returns:
+        list: Profile dictionaries with name, width, height, crf, bitrate, codec, container, suffix and speed.
+    """
+    video_output = config['video_output']
+    base = {
+        "name": "main",
+        "width": video_output['video_width'],
+        "height": video_output['video_height'],
+        "crf": video_output['constant_rate_factor'],
+        "bitrate": video_output['bitrate'],
+        "codec": 'libx264',
+        "container": video_output['video_format'],
+        "suffix": '',
+        "speed": 1,
+    }
+    profiles = video_output.get('profiles')
+    if not profiles:
+        return [base]
+    return [{**base, "suffix": '' if index == 0 else f"_{profile['name']}", **profile} for index, profile in enumerate(profiles)]
+
+def profile_path(video_path, profile):
+    """
+    Returns where a profile's variant of `video_path` is stored.
+    """
+    root, _ = os.path.splitext(video_path)
+    return f"{root}{profile['suffix']}.{profile['container']}"
 
-    ffmpeg_settings = [
+def ffmpeg_settings(config, list_path, outputs, threads=None, overlay=None, frame_range=None):
+    """
+    Returns the FFmpeg options (as option/value pairs) that render all outputs from one decode.
+
+    The frames are decoded and deflickered once, then split into one scaling branch per output.
+    With a deferred overlay, every branch composites the overlay graphic and draws the overlay
+    text after scaling, so both are rendered at the output resolution.
+
+    Parameters:
+        config (dict): The configuration dictionary.
+        list_path (str): The concat list of frames.
+        outputs (list): (profile, path) pairs.
+        threads (int, optional): Limit on FFmpeg's encoder threads per output.
+        overlay (dict, optional): Deferred overlay: subtitles (the .ass track), image and image_size (the overlay graphic) and source_size (capture resolution of the frames).
+        frame_range (tuple, optional): (first, end) frames of the list to output; the frames around
+            them are only decoded so the deflicker filter sees the same neighbours as in a full render.
+
+    Returns:
+        list: (option, value) pairs; the output paths appear as (path, None).
+    """
+    framerate = config['video_output']['framerate']
+    branches = []
+    for index, (profile, _) in enumerate(outputs):
+        branch = f"scale={profile['width']}:{profile['height']}"
+        if overlay:
+            overlay_input = "[1:v]" if len(outputs) == 1 else f"[o{index}]"
+            branch += f"[b{index}];{overlay_input}scale={round(profile['width'] * overlay['image_size'][0] / overlay['source_size'][0])}:{round(profile['height'] * overlay['image_size'][1] / overlay['source_size'][1])}[p{index}];"
+            branch += f"[b{index}][p{index}]overlay=0:0,{overlay_filter(overlay['subtitles'])}"
+        if profile.get('speed', 1) > 1:
+            # Shorter clip: compress time and drop the frames that no longer fit the frame rate
+            branch += f",setpts=PTS/{profile['speed']},fps={framerate}"
+        branches.append(branch)
+
+    graph = "[0:v]deflicker"
+    if frame_range:
+        graph += f",trim=start_frame={frame_range[0]}:end_frame={frame_range[1]}"
+    graph += ",setpts=N/FRAME_RATE/TB"
+    if len(outputs) == 1:
+        graph += f",{branches[0]}[v0]"
+    else:
+        graph += f",split={len(outputs)}" + "".join(f"[s{index}]" for index in range(len(outputs)))
+        graph += "".join(f";[s{index}]{branch}[v{index}]" for index, branch in enumerate(branches))
+    if overlay and len(outputs) > 1:
+        # The overlay graphic is a single still; the overlay filter keeps repeating it
+        graph = f"[1:v]split={len(outputs)}" + "".join(f"[o{index}]" for index in range(len(outputs))) + ";" + graph
+
+    settings = [
         ('-y', None),  # Overwrite the output file without asking for confirmation
         ('-f', 'concat'),
         ('-safe', '0'),
         ('-i', list_path),
-        ('-framerate', str(config['video_output']['framerate'])),
-        ('-s', f"{config['video_output']['video_width']}x{config['video_output']['video_height']}"),
-        ('-vf', f"deflicker,setpts=N/FRAME_RATE/TB"),
-        ('-c:v', 'libx264'),
-        ('-crf', str(config['video_output']['constant_rate_factor'])),
-        ('-b:v', str(config['video_output']['bitrate']))
     ]
+    if overlay:
+        settings.append(('-i', overlay['image']))
+    settings.append(('-filter_complex', graph))
+    for index, (profile, path) in enumerate(outputs):
+        settings += [
+            ('-map', f"[v{index}]"),
+            ('-framerate', str(framerate)),
+            ('-c:v', profile['codec']),
+            ('-crf', str(profile['crf'])),
+            ('-b:v', str(profile['bitrate'])),
+        ]
+        if profile.get('preset'):
+            settings.append(('-preset', profile['preset']))
+        if threads:
+            settings.append(('-threads', str(threads)))
+        settings.append((path, None))
+    return settings
+
+def frame_paths(config, image_files):
+    """
+    Returns the full paths of frames given by file name (or already as absolute paths).
+    """
+    paths = []
+    for image_file in image_files:
+        if os.path.isabs(image_file):
+            paths.append(image_file)
+            continue
+        # Determine the correct folder for each image based on its filename
+        date_part = image_file.split('_')[1:4]
+        correct_folder = os.path.join(config['image_output']['root_folder'], *date_part)
+        paths.append(os.path.join(correct_folder, image_file))
+    return paths
+
+def write_frame_list(list_path, config, image_files):
+    """
+    Writes the FFmpeg concat list for a day's frames (file names, or absolute paths used as they are).
+    """
+    with open(list_path, 'w') as f:
+        for path in frame_paths(config, image_files):
+            f.write(f"file '{path}'\n")
+
+def deferred_overlay(config, image_files, subtitles_path):
+    """
+    Prepares the overlay of frames stored clean (overlay.mode 'deferred') for rendering in the video.
+
+    Days captured with the overlay burned in have no overlay sidecar and are rendered as they are.
+
+    Returns:
+        dict: The overlay argument for ffmpeg_settings, or None if no frame has overlay fields.
+    """
+    paths = frame_paths(config, image_files)
+    if not paths:
+        return None
+    covered, size = write_overlay_subtitles(subtitles_path, paths, config['camera_settings'].get('name', "Camera Name"))
+    if not covered:
+        return None
+    from PIL import Image
+
+    with Image.open(OVERLAY_IMAGE_PATH) as overlay_image:
+        image_size = overlay_image.size
+    return {"subtitles": subtitles_path, "image": os.path.abspath(OVERLAY_IMAGE_PATH), "image_size": image_size, "source_size": size}
+
+def partial_path(path):
+    root, extension = os.path.splitext(path)
+    return f"{root}.part{extension}"
+
+def run_with_progress(command, total_frames, outputs, logger, step=10):
+    """
+    Runs FFmpeg and logs progress every `step` percent, with the current size of every output.
+
+    Returns:
+        tuple: (return code, stderr text)
+    """
+    with tempfile.TemporaryFile(mode='w+') as stderr:
+        process = subprocess.Popen(command[:1] + ['-progress', 'pipe:1', '-nostats'] + command[1:], stdout=subprocess.PIPE, stderr=stderr, text=True)
+        values = {}
+        next_report = step
+        for line in process.stdout:
+            key, _, value = line.strip().partition('=')
+            values[key] = value
+            if key != 'progress':
+                continue
+            frame = int(values.get('frame', 0) or 0)
+            percent = 100 * frame / total_frames if total_frames else 0
+            if percent >= next_report or (value == 'end' and next_report <= 100):
+                sizes = ", ".join(f"{profile['name']} {os.path.getsize(path) / (1024 * 1024):.1f} MB"
+                                  for profile, path in outputs if os.path.exists(path))
+                log_message(logger, f"Encoding {min(percent, 100):.0f}% ({frame}/{total_frames} frames, speed {values.get('speed', '?')}): {sizes}",
+                            frame=frame, total_frames=total_frames)
+                next_report = (int(percent) // step + 1) * step
+        process.wait()
+        stderr.seek(0)
+        return process.returncode, stderr.read()
+
+def ffmpeg_command(image_folder, video_path, config, image_files, logger, threads=None):
+    """
+    Renders a video, and every other configured profile, from a list of frames in one FFmpeg run.
+
+    The videos are written next to their final paths and renamed into place when FFmpeg succeeds, so
+    an interrupted render never leaves a truncated video behind. Every render has its own frame
+    list, so several days can be rendered at once.
+
+    Parameters:
+        image_folder (str): The day's image folder.
+        video_path (str): Where to store the main video.
+        config (dict): The configuration dictionary.
+        image_files (list): Frame file names in order.
+        logger (logging.Logger): Logger for status messages.
+        threads (int, optional): Limit on FFmpeg's encoder threads, shared by all outputs.
+
+    Returns:
+        bool: True if the videos were created.
+    """
+    from colored import fg, attr
+
+    # Ensure the data directory exists
+    data_dir = os.path.abspath(os.path.join(os.path.dirname(os.path.realpath(__file__)), '../../data'))
+    os.makedirs(data_dir, exist_ok=True)
+
+    # Path to this video's list file
+    list_path = os.path.join(data_dir, f"ffmpeg_list_{os.path.splitext(os.path.basename(video_path))[0]}.txt")
     
+    # Generate the list of image files for FFmpeg
+    write_frame_list(list_path, config, image_files)
+    subtitles_path = os.path.join(data_dir, f"overlay_{os.path.splitext(os.path.basename(video_path))[0]}.ass")
+    overlay = deferred_overlay(config, image_files, subtitles_path)
+
+    outputs = [(profile, profile_path(video_path, profile)) for profile in video_profiles(config)]
+    partial_outputs = [(profile, partial_path(path)) for profile, path in outputs]
+    # The thread limit covers the whole render, so it is shared between the outputs' encoders
+    ffmpeg_settings_list = ffmpeg_settings(config, list_path, partial_outputs, max(1, threads // len(outputs)) if threads else None, overlay)
+
     # Build the ffmpeg command
     ffmpeg_command = [
-        'ffmpeg'] + [item for sublist in ffmpeg_settings for item in sublist if item is not None] + [video_path]
+        'ffmpeg'] + [item for sublist in ffmpeg_settings_list for item in sublist if item is not None]
 
     # Display FFmpeg information settings
     log_message(logger, f"{fg('green')}FFmpeg Information Settings{attr('reset')}")
-    for setting in ffmpeg_settings:
+    for setting in ffmpeg_settings_list:
         if setting[1] is not None:
             log_message(logger, f"{fg('cyan')}{setting[0]} {attr('reset')}{fg(244)}{setting[1]}{attr('reset')}")
 
@@ -52,14 +247,31 @@ def ffmpeg_command(image_folder, video_path, config, image_files, logger):
 
     start_time = time.time()
     # Run the FFmpeg command
-    output = subprocess.run(ffmpeg_command, stderr=subprocess.PIPE, text=True)
-    if output.returncode != 0:
-        log_message(logger, f"FFmpeg Error: {output.stderr}")
+    returncode, errors = run_with_progress(ffmpeg_command, len(image_files), partial_outputs, logger)
+    os.remove(list_path)
+    if overlay:
+        os.remove(subtitles_path)
+    if returncode != 0:
+        log_message(logger, f"FFmpeg Error: {errors}")
+        for _, path in partial_outputs:
+            if os.path.exists(path):
+                os.remove(path)
+        return False
+    for (_, path), (_, partial) in zip(outputs, partial_outputs):
+        os.replace(partial, path)
 
     end_time = time.time()
 
     duration = end_time - start_time
     formatted_duration = format_duration(duration)
 
-    log_message(logger, f"{fg('green')}Timelapse video created{attr('reset')}{fg('dark_green')}: {attr('reset')}{fg(135)}{video_path}{attr('reset')}")
+    # All outputs share the decode, so the render time is reported once and the outputs by size and bitrate
+    framerate = config['video_output']['framerate']
+    for profile, path in outputs:
+        size = os.path.getsize(path)
+        seconds = len(image_files) / profile.get('speed', 1) / framerate
+        log_message(logger, f"{fg('green')}Timelapse video created{attr('reset')}{fg('dark_green')}: {attr('reset')}{fg(135)}{path}{attr('reset')} "
+                            f"({profile['width']}x{profile['height']}, {size / (1024 * 1024):.1f} MB, {size * 8 / seconds / 1000 if seconds else 0:.0f} kb/s)",
+                    profile=profile['name'], path=path, size=size)
     log_message(logger, f"{fg('green')}Duration{attr('reset')}{fg('dark_green')}: {attr('reset')}{fg(135)}{formatted_duration}")
+    return True
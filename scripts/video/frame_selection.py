@@ -0,0 +1,102 @@
+#!/usr/bin/python
+import datetime
+import re
+
+from ..schedule.solar import solar_noon
+
+MATCH_TOLERANCE = datetime.timedelta(minutes=60)  # Furthest a frame may be from a requested time of day
+
+PERIOD_UNITS = {'m': 'minutes', 'h': 'hours', 'd': 'days'}
+RULE_PATTERNS = [
+    ('every_nth', re.compile(r'^every (\d+)$')),
+    ('every_period', re.compile(r'^every (\d+)([mhd])$')),
+    ('at_time', re.compile(r'^at (\d{1,2}):(\d{2})$')),
+    ('solar_noon', re.compile(r'^solar-noon$')),
+]
+
+
+def parse_selection(text):
+    """
+    Parses a frame selection such as "every 6", "every 1h", "at 12:00" or "solar-noon".
+
+    Several rules can be combined with commas ("at 08:00, at 16:00"); the selection is their union.
+
+    Parameters:
+        text (str): The selection.
+
+    Returns:
+        list: (rule, arguments) tuples.
+    """
+    rules = []
+    for part in text.split(','):
+        part = ' '.join(part.strip().lower().split())
+        for rule, pattern in RULE_PATTERNS:
+            match = pattern.match(part)
+            if match:
+                rules.append((rule, match.groups()))
+                break
+        else:
+            raise ValueError(f"Unknown frame selection: '{part}' (use 'every N', 'every Nm/Nh/Nd', 'at HH:MM' or 'solar-noon')")
+    return rules
+
+
+def _nearest_per_day(frames, target_for_day):
+    by_day = {}
+    for frame in frames:
+        by_day.setdefault(frame[0].date(), []).append(frame)
+    selected = []
+    for day, day_frames in sorted(by_day.items()):
+        target = target_for_day(day)
+        best = min(day_frames, key=lambda frame: abs(frame[0] - target))
+        if abs(best[0] - target) <= MATCH_TOLERANCE:
+            selected.append(best)
+    return selected
+
+
+def _apply_rule(frames, rule, arguments, config):
+    if rule == 'every_nth':
+        return frames[::max(1, int(arguments[0]))]
+
+    if rule == 'every_period':
+        period = datetime.timedelta(**{PERIOD_UNITS[arguments[1]]: int(arguments[0])})
+        selected = []
+        next_time = None
+        for frame in frames:
+            if next_time is None:
+                next_time = datetime.datetime.combine(frame[0].date(), datetime.time.min)
+            if frame[0] >= next_time:
+                selected.append(frame)
+                while next_time <= frame[0]:
+                    next_time += period
+        return selected
+
+    if rule == 'at_time':
+        time_of_day = datetime.time(int(arguments[0]), int(arguments[1]))
+        return _nearest_per_day(frames, lambda day: datetime.datetime.combine(day, time_of_day))
+
+    if rule == 'solar_noon':
+        longitude = config.get('schedule', {}).get('longitude')
+        if longitude is None:
+            raise ValueError("solar-noon selection needs schedule.longitude in config.yaml")
+        # Frame names carry local wall-clock time
+        return _nearest_per_day(frames, lambda day: solar_noon(day, longitude).astimezone().replace(tzinfo=None))
+
+    raise ValueError(f"Unknown frame selection rule: {rule}")
+
+
+def select_frames(frames, selection, config=None):
+    """
+    Picks the frames of a long-range timelapse.
+
+    Parameters:
+        frames (list): (datetime, path) tuples in time order.
+        selection (str): The selection, see parse_selection().
+        config (dict, optional): The configuration dictionary (needed for solar-noon).
+
+    Returns:
+        list: The selected (datetime, path) tuples in time order.
+    """
+    selected = set()
+    for rule, arguments in parse_selection(selection):
+        selected.update(_apply_rule(frames, rule, arguments, config or {}))
+    return sorted(selected)
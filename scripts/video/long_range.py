@@ -0,0 +1,101 @@
+#!/usr/bin/python
+import argparse
+import copy
+import os
+import sys
+
+import yaml
+from PIL import Image
+
+from ..log.logging import setup_logger, log_message, logging_options
+from ..image.image_tree import parse_date_range
+from ..image.proxy_store import list_proxies, update_proxies
+from .frame_selection import select_frames
+from . import ffmpeg as ff_script
+
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), '../../config.yaml')
+
+
+def load_config(config_path=CONFIG_PATH):
+    with open(config_path, 'r') as config_file:
+        return yaml.safe_load(config_file)
+
+
+def default_output_path(config, start_date, end_date, selection):
+    slug = ''.join(c if c.isalnum() else '-' for c in selection.lower()).strip('-')
+    name = f"{config['video_output']['filename_prefix']}{start_date.isoformat()}_{end_date.isoformat()}_{slug}.{config['video_output']['video_format']}"
+    return os.path.join(config['video_output']['root_folder'], 'long_range', name)
+
+
+def proxy_video_config(config, frame_path):
+    """
+    Returns a copy of the configuration that renders one video at the size of the proxies.
+    """
+    with Image.open(frame_path) as img:
+        width, height = img.size
+    video_config = copy.deepcopy(config)
+    video_config['video_output'].pop('profiles', None)
+    # Even dimensions, as required by the encoder
+    video_config['video_output']['video_width'] = width - width % 2
+    video_config['video_output']['video_height'] = height - height % 2
+    return video_config
+
+
+def compile_long_range(config, start_date, end_date, selection, output_path=None, build=True, threads=None):
+    """
+    Renders a week, month or year timelapse from the proxy store.
+
+    Only the small, pre-decimated proxies are listed and decoded, so a year of frames costs about as
+    much as a single day of originals.
+
+    Parameters:
+        config (dict): The configuration dictionary.
+        start_date (date): First day.
+        end_date (date): Last day.
+        selection (str): Frame selection, e.g. "solar-noon" or "every 1h" (see frame_selection).
+        output_path (str, optional): Where to store the video.
+        build (bool): Create missing proxies for the range first.
+        threads (int, optional): Limit on FFmpeg's encoder threads.
+
+    Returns:
+        str: The video path, or None if nothing was rendered.
+    """
+    logger = setup_logger('timelapse_long_range', os.path.join(config['logging']['log_directory'], 'long_range.log'), **logging_options(config))
+    if build:
+        update_proxies(config, start_date, end_date, logger)
+
+    frames = select_frames(list_proxies(config, start_date, end_date), selection, config)
+    if not frames:
+        log_message(logger, f"No proxies match '{selection}' between {start_date} and {end_date}")
+        return None
+    log_message(logger, f"Long-range timelapse {start_date} to {end_date} ('{selection}'): {len(frames)} frames")
+
+    output_path = output_path or default_output_path(config, start_date, end_date, selection)
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    paths = [path for _, path in frames]
+    video_config = proxy_video_config(config, paths[0])
+    if not ff_script.ffmpeg_command(os.path.dirname(paths[0]), output_path, video_config, paths, logger, threads=threads):
+        return None
+    return output_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Render a week, month or year timelapse from proxy frames.')
+    parser.add_argument('--from', dest='start', required=True, help='First date, YYYY-MM-DD.')
+    parser.add_argument('--to', dest='end', required=True, help='Last date, YYYY-MM-DD.')
+    parser.add_argument('--select', default='every 1h', help="Frame selection: 'every N', 'every 30m', 'every 1h', 'at 12:00', 'solar-noon'; combine with commas.")
+    parser.add_argument('--output', help='Video path (default: under video_output.root_folder/long_range/).')
+    parser.add_argument('--no-build', action='store_true', help='Use the proxies as they are instead of creating missing ones first.')
+    parser.add_argument('--threads', type=int, help='Limit on FFmpeg encoder threads.')
+    args = parser.parse_args()
+
+    start_date, end_date = parse_date_range(args.start, args.end)
+    config = load_config()
+    try:
+        video_path = compile_long_range(config, start_date, end_date, args.select, args.output, not args.no_build, args.threads)
+    except ValueError as e:
+        print(e)
+        sys.exit(2)
+    if video_path is None:
+        sys.exit(1)
+    print(f"Stored at {video_path}")
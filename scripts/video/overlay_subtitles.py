@@ -0,0 +1,90 @@
+#!/usr/bin/python
+import os
+
+from ..image.add_image_overlay import overlay_layout
+from ..image.overlay_sidecar import OverlayRecords
+
+CONCAT_FRAME_RATE = 25  # Frame rate FFmpeg's concat demuxer gives a list of stills (the image2 default)
+
+ASS_HEADER = """[Script Info]
+ScriptType: v4.00+
+PlayResX: {width}
+PlayResY: {height}
+WrapStyle: 2
+ScaledBorderAndShadow: yes
+
+[V4+ Styles]
+Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding
+Style: Overlay,DejaVu Sans,30,&H00FFFFFF,&H00FFFFFF,&H00000000,&H00000000,-1,0,0,0,100,100,0,0,1,0,0,7,0,0,0,1
+
+[Events]
+Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
+"""
+
+
+def ass_time(centiseconds):
+    hours, rest = divmod(centiseconds, 360000)
+    minutes, rest = divmod(rest, 6000)
+    seconds, centiseconds = divmod(rest, 100)
+    return f"{hours}:{minutes:02d}:{seconds:02d}.{centiseconds:02d}"
+
+
+def frame_time(index):
+    # Rounded per frame boundary, so consecutive events always meet
+    return round(index * 100 / CONCAT_FRAME_RATE)
+
+
+def write_overlay_subtitles(path, frame_paths, camera_name):
+    """
+    Writes the overlay text of clean frames as an ASS subtitle track, one cue per frame.
+
+    The track is laid out in the frames' own pixel coordinates (PlayResX/PlayResY), so libass draws
+    the same layout as the burned-in overlay, but sharp at every output resolution.
+
+    Parameters:
+        path (str): Where to write the .ass file.
+        frame_paths (list): Frame paths in video order.
+        camera_name (str): Camera name shown at the top.
+
+    Returns:
+        tuple: (frames with overlay fields, (width, height) the frames were captured at); nothing is written if no frame has fields.
+    """
+    records = OverlayRecords()
+    frame_fields = [records.get(frame_path) for frame_path in frame_paths]
+    # The layout is made for the resolution the frames were captured at (retention may have downscaled them since)
+    size = next((tuple(fields['size']) for fields in frame_fields if fields and 'size' in fields), None)
+    if size is None:
+        from PIL import Image
+
+        with Image.open(frame_paths[0]) as first:
+            size = first.size
+
+    events = []  # [first frame, end frame, lines]
+    for index, fields in enumerate(frame_fields):
+        lines = tuple(overlay_layout(fields, camera_name, size[0])) if fields else None
+        if events and events[-1][2] == lines and events[-1][1] == index:
+            events[-1][1] = index + 1
+        else:
+            events.append([index, index + 1, lines])
+
+    covered = sum(end - start for start, end, lines in events if lines)
+    if not covered:
+        return 0, size
+
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(ASS_HEADER.format(width=size[0], height=size[1]))
+        for start, end, lines in events:
+            if not lines:
+                continue
+            for text, (x, y), font_size in lines:
+                text = text.replace('{', '(').replace('}', ')')
+                f.write(f"Dialogue: 0,{ass_time(frame_time(start))},{ass_time(frame_time(end))},Overlay,,0,0,0,,{{\\an7\\pos({x},{y})\\fs{font_size}}}{text}\n")
+    return covered, size
+
+
+def overlay_filter(subtitles_path):
+    """
+    Returns the subtitles filter for a track written by write_overlay_subtitles().
+    """
+    escaped = os.path.abspath(subtitles_path).replace('\\', '\\\\').replace(':', '\\:').replace("'", "\\'")
+    return f"subtitles=filename='{escaped}'"
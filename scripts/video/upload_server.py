@@ -0,0 +1,206 @@
+#!/usr/bin/python
+import argparse
+import base64
+import hashlib
+import json
+import os
+import secrets
+import threading
+from http import server
+from socketserver import ThreadingMixIn
+
+TUS_VERSION = '1.0.0'
+PREFIX = '/files/'
+
+
+class UploadStore:
+    """
+    Uploads of the stand-in server, kept as files so a restarted server can still resume them.
+
+    <id>.json holds the length, offset and metadata; <id>.part the bytes received. A complete upload
+    is checked against the sha256 in its metadata and renamed to its file name.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+
+    def _info_path(self, upload_id):
+        return os.path.join(self.folder, f"{upload_id}.json")
+
+    def info(self, upload_id):
+        if not upload_id.isalnum():
+            return None
+        try:
+            with open(self._info_path(upload_id), 'r') as f:
+                return json.load(f)
+        except OSError:
+            return None
+
+    def save(self, upload_id, info):
+        with open(self._info_path(upload_id), 'w') as f:
+            json.dump(info, f)
+
+    def create(self, length, metadata):
+        upload_id = secrets.token_hex(16)
+        open(os.path.join(self.folder, f"{upload_id}.part"), 'wb').close()
+        self.save(upload_id, {"length": length, "offset": 0, "metadata": metadata})
+        return upload_id
+
+    def append(self, upload_id, data):
+        with open(os.path.join(self.folder, f"{upload_id}.part"), 'ab') as f:
+            f.write(data)
+
+    def complete(self, upload_id, info):
+        """
+        Returns the stored file, or None if its content does not match its sha256 (the upload is then discarded).
+        """
+        part = os.path.join(self.folder, f"{upload_id}.part")
+        digest = hashlib.sha256()
+        with open(part, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        expected = info['metadata'].get('sha256')
+        if expected and digest.hexdigest() != expected:
+            os.remove(part)
+            os.remove(self._info_path(upload_id))
+            return None
+        path = os.path.join(self.folder, os.path.basename(info['metadata'].get('filename', upload_id)))
+        os.replace(part, path)
+        os.remove(self._info_path(upload_id))
+        return path
+
+
+def parse_metadata(header):
+    metadata = {}
+    for pair in filter(None, (header or '').split(',')):
+        key, _, value = pair.strip().partition(' ')
+        metadata[key] = base64.b64decode(value).decode('utf-8') if value else ''
+    return metadata
+
+
+class TusHandler(server.BaseHTTPRequestHandler):
+    """
+    Minimal tus 1.0 server (creation and checksum extensions, sha256 only) to test the uploader against.
+    """
+
+    def respond(self, status, headers=None):
+        self.send_response(status)
+        self.send_header('Tus-Resumable', TUS_VERSION)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def authorized(self):
+        token = self.server.token
+        if token and not secrets.compare_digest(self.headers.get('Authorization', ''), f"Bearer {token}"):
+            self.respond(401)
+            return False
+        return True
+
+    def do_OPTIONS(self):
+        self.respond(204, {'Tus-Version': TUS_VERSION, 'Tus-Extension': 'creation,checksum', 'Tus-Checksum-Algorithm': 'sha256'})
+
+    def do_POST(self):
+        if not self.authorized():
+            return
+        if self.path != PREFIX or not self.headers.get('Upload-Length', '').isdigit():
+            self.respond(400)
+            return
+        upload_id = self.server.store.create(int(self.headers['Upload-Length']), parse_metadata(self.headers.get('Upload-Metadata')))
+        self.respond(201, {'Location': PREFIX + upload_id})
+
+    def do_HEAD(self):
+        if not self.authorized():
+            return
+        info = self.server.store.info(self.path[len(PREFIX):]) if self.path.startswith(PREFIX) else None
+        if info is None:
+            self.respond(404)
+            return
+        self.respond(200, {'Upload-Offset': str(info['offset']), 'Upload-Length': str(info['length']), 'Cache-Control': 'no-store'})
+
+    def do_PATCH(self):
+        if not self.authorized():
+            return
+        store = self.server.store
+        upload_id = self.path[len(PREFIX):] if self.path.startswith(PREFIX) else ''
+        length = int(self.headers.get('Content-Length', 0))
+        self.server.patches += 1
+        if self.server.fail_every and self.server.patches % self.server.fail_every == 0:
+            # Simulate a dropped connection halfway through the chunk
+            self.rfile.read(length // 2)
+            self.close_connection = True
+            self.connection.close()
+            return
+        data = self.rfile.read(length)
+        with store.lock:
+            info = store.info(upload_id)
+            if info is None:
+                self.respond(404)
+                return
+            if self.headers.get('Content-Type') != 'application/offset+octet-stream':
+                self.respond(415)
+                return
+            if self.headers.get('Upload-Offset') != str(info['offset']):
+                self.respond(409)
+                return
+            algorithm, _, checksum = self.headers.get('Upload-Checksum', '').partition(' ')
+            if algorithm and (algorithm != 'sha256' or base64.b64encode(hashlib.sha256(data).digest()).decode('ascii') != checksum):
+                self.respond(460)
+                return
+            if info['offset'] + len(data) > info['length']:
+                self.respond(413)
+                return
+            store.append(upload_id, data)
+            info['offset'] += len(data)
+            if info['offset'] == info['length']:
+                path = store.complete(upload_id, info)
+                if path is None:
+                    self.respond(460)
+                    return
+                print(f"Received {path}")
+            else:
+                store.save(upload_id, info)
+        self.respond(204, {'Upload-Offset': str(info['offset'])})
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ThreadingHTTPServer(ThreadingMixIn, server.HTTPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+def start_upload_server(folder, port=0, token=None, fail_every=0, host='127.0.0.1'):
+    """
+    Starts the stand-in server on a background thread.
+
+    Returns:
+        ThreadingHTTPServer: The server; its endpoint is http://host:<server_address[1]>/files/.
+    """
+    httpd = ThreadingHTTPServer((host, port), TusHandler)
+    httpd.store = UploadStore(folder)
+    httpd.token = token
+    httpd.fail_every = fail_every
+    httpd.patches = 0
+    threading.Thread(target=httpd.serve_forever, name="upload-server", daemon=True).start()
+    return httpd
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Local stand-in for the video upload server (tus protocol), to test video_upload against.')
+    parser.add_argument('folder', help='Where received videos are stored.')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--token', help='Require this bearer token.')
+    parser.add_argument('--fail-every', type=int, default=0, help='Drop every Nth chunk halfway, to exercise resuming.')
+    args = parser.parse_args()
+
+    httpd = start_upload_server(args.folder, args.port, args.token, args.fail_every, host='')
+    print(f"Accepting uploads at http://localhost:{httpd.server_address[1]}{PREFIX} into {args.folder}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        httpd.shutdown()
@@ -0,0 +1,413 @@
+#!/usr/bin/python
+import argparse
+import base64
+import concurrent.futures
+import contextlib
+import datetime
+import fcntl
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from urllib.parse import urljoin
+
+import yaml
+
+from ..log.logging import setup_logger, log_message, logging_options
+from ..storage.atomic_write import atomic_write_bytes
+from ..storage.rate_limiter import RateLimiter
+
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), '../../config.yaml')
+QUEUE_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../data/upload_queue.json'))
+TUS_VERSION = '1.0.0'
+
+# Defaults for the video_upload section of config.yaml
+CHUNK_SIZE = 4 * 1024 * 1024  # Bytes per PATCH request; an interrupted upload resumes from the last complete chunk
+RATE_LIMIT = 1  # MB/s shared by all uploads of the process (0: no limit)
+CONCURRENCY = 1  # Files uploaded at the same time
+RETRIES = 5  # Attempts per request (reset by every chunk sent) before the upload is left for a later run
+BACKOFF = 2  # Seconds before the first retry, doubled after every failed attempt
+MAX_BACKOFF = 3600  # Longest wait before a later run tries an upload again
+MAX_ATTEMPTS = 20  # Runs an upload is tried in before it is marked failed
+
+_upload_limiter = None
+
+
+class UploadError(Exception):
+    """
+    Raised when the server refuses an upload; retrying would not help.
+    """
+
+
+class TransientError(UploadError):
+    """
+    Raised for failures worth retrying: network errors, server errors and rejected chunks.
+    """
+
+
+def get_upload_limiter(config):
+    """
+    Returns the process-wide bandwidth cap shared by every upload.
+    """
+    global _upload_limiter
+    if _upload_limiter is None:
+        rate = config.get('video_upload', {}).get('rate_limit', RATE_LIMIT)
+        _upload_limiter = RateLimiter(rate * 1024 * 1024)
+    return _upload_limiter
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ThrottledReader(io.RawIOBase):
+    """
+    Request body that takes what it hands out from a RateLimiter, so a chunk is sent at the capped rate.
+    """
+
+    def __init__(self, data, limiter):
+        self.data = memoryview(data)
+        self.position = 0
+        self.limiter = limiter
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        end = len(self.data) if size is None or size < 0 else min(len(self.data), self.position + size)
+        block = self.data[self.position:end].tobytes()
+        self.position = end
+        if block and self.limiter is not None:
+            self.limiter.consume(len(block))
+        return block
+
+
+class TusClient:
+    """
+    Client for a resumable upload server speaking the tus 1.0 core protocol with the creation and
+    checksum extensions: POST creates an upload, HEAD returns how much of it the server has, and
+    every PATCH appends one chunk carrying its SHA-256 in Upload-Checksum.
+    """
+
+    def __init__(self, endpoint, token=None, limiter=None, timeout=60):
+        self.endpoint = endpoint
+        self.token = token
+        self.limiter = limiter
+        self.timeout = timeout
+
+    def _request(self, method, url, data=None, headers=None):
+        headers = {'Tus-Resumable': TUS_VERSION, **(headers or {})}
+        if self.token:
+            headers['Authorization'] = f"Bearer {self.token}"
+        request = urllib.request.Request(url, data=data, headers=headers, method=method)
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                response.read()
+                return response.status, response.headers
+        except urllib.error.HTTPError as e:
+            return e.code, e.headers
+        except (urllib.error.URLError, OSError) as e:
+            raise TransientError(f"{method} {url}: {e}")
+
+    @staticmethod
+    def _check(status, method, expected):
+        if status == expected:
+            return
+        if status >= 500 or status in (409, 423, 460):
+            # Server trouble, an offset that moved or a chunk damaged on the way: try again
+            raise TransientError(f"{method} returned {status}")
+        raise UploadError(f"{method} returned {status}")
+
+    def create(self, length, metadata):
+        """
+        Creates an upload and returns its URL.
+        """
+        encoded = ",".join(f"{key} {base64.b64encode(str(value).encode('utf-8')).decode('ascii')}" for key, value in metadata.items())
+        status, headers = self._request('POST', self.endpoint, b'', {'Upload-Length': str(length), 'Upload-Metadata': encoded})
+        self._check(status, 'POST', 201)
+        return urljoin(self.endpoint, headers['Location'])
+
+    def offset(self, location):
+        """
+        Returns how many bytes of the upload the server has, or None if it no longer knows the upload.
+        """
+        status, headers = self._request('HEAD', location)
+        if status in (404, 410):
+            return None
+        self._check(status, 'HEAD', 200)
+        return int(headers['Upload-Offset'])
+
+    def patch(self, location, offset, chunk):
+        """
+        Sends one chunk at `offset` and returns the new offset.
+        """
+        checksum = base64.b64encode(hashlib.sha256(chunk).digest()).decode('ascii')
+        headers = {
+            'Content-Type': 'application/offset+octet-stream',
+            'Content-Length': str(len(chunk)),
+            'Upload-Offset': str(offset),
+            'Upload-Checksum': f"sha256 {checksum}",
+        }
+        status, response_headers = self._request('PATCH', location, ThrottledReader(chunk, self.limiter), headers)
+        if status == 404 or status == 410:
+            raise TransientError("Upload expired on the server")
+        self._check(status, 'PATCH', 204)
+        return int(response_headers['Upload-Offset'])
+
+
+class UploadQueue:
+    """
+    Persistent list of uploads, kept in one JSON file so pending uploads survive a reboot.
+
+    Every change is made under an exclusive lock on `<queue>.lock` and written atomically, so
+    create-timelapse and a queue run started from cron can share the file.
+    """
+
+    def __init__(self, path=QUEUE_PATH):
+        self.path = path
+
+    @contextlib.contextmanager
+    def locked(self):
+        """
+        Yields the entries for changing them; they are saved when the block ends.
+        """
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path + '.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            entries = self._load()
+            yield entries
+            atomic_write_bytes(self.path, json.dumps(entries, indent=4).encode('utf-8'))
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+        except ValueError as e:
+            print(f"Error reading upload queue {self.path}: {e}")
+            return []
+
+    def entries(self):
+        return self._load()
+
+    def add(self, path, date=None, metadata=None):
+        """
+        Queues a file. A file that is already queued keeps its progress unless its content changed.
+
+        Returns:
+            dict: The queue entry.
+        """
+        path = os.path.abspath(path)
+        entry = {
+            "path": path,
+            "date": date,
+            "size": os.path.getsize(path),
+            "sha256": file_sha256(path),
+            "metadata": metadata or {},
+            "location": None,
+            "offset": 0,
+            "attempts": 0,
+            "next_attempt": 0,
+            "status": 'pending',
+            "error": None,
+            "added": time.time(),
+        }
+        with self.locked() as entries:
+            existing = next((queued for queued in entries if queued['path'] == path), None)
+            if existing is not None and existing['sha256'] == entry['sha256'] and existing['status'] != 'done':
+                return existing
+            if existing is not None:
+                entries.remove(existing)
+            entries.append(entry)
+        return entry
+
+    def update(self, entry):
+        with self.locked() as entries:
+            for index, queued in enumerate(entries):
+                if queued['path'] == entry['path']:
+                    entries[index] = entry
+
+    def retry_failed(self):
+        with self.locked() as entries:
+            for entry in entries:
+                if entry['status'] == 'failed':
+                    entry.update({"status": 'pending', "attempts": 0, "next_attempt": 0})
+
+
+def upload_entry(client, queue, entry, chunk_size=CHUNK_SIZE, retries=RETRIES, backoff=BACKOFF, sleep=time.sleep):
+    """
+    Uploads (or resumes) one queued file, saving its offset after every chunk.
+
+    Parameters:
+        client (TusClient): The upload server.
+        queue (UploadQueue): The queue the entry belongs to.
+        entry (dict): The queue entry; updated in place.
+        chunk_size (int): Bytes per PATCH request.
+        retries (int): Attempts per request; a chunk that goes through starts the count again.
+        backoff (float): Seconds before the first retry, doubled for every further one.
+
+    Raises:
+        UploadError: When the upload did not complete.
+    """
+    failures = 0
+    while True:
+        try:
+            if entry['location'] is None:
+                metadata = {"filename": os.path.basename(entry['path']), "sha256": entry['sha256'], **entry['metadata']}
+                if entry['date']:
+                    metadata['date'] = entry['date']
+                entry['location'] = client.create(entry['size'], metadata)
+                entry['offset'] = 0
+                queue.update(entry)
+
+            offset = client.offset(entry['location'])
+            if offset is None:
+                # The server dropped the partial upload; start over
+                entry['location'] = None
+                raise TransientError("Upload no longer known to the server")
+            with open(entry['path'], 'rb') as f:
+                while offset < entry['size']:
+                    f.seek(offset)
+                    offset = client.patch(entry['location'], offset, f.read(chunk_size))
+                    entry['offset'] = offset
+                    queue.update(entry)
+                    failures = 0
+            return
+        except TransientError as e:
+            entry['error'] = str(e)
+            failures += 1
+            if failures >= retries:
+                raise TransientError(entry['error'])
+            sleep(backoff * 2 ** (failures - 1))
+
+
+def process_queue(config, logger=None, sleep=time.sleep):
+    """
+    Uploads every queued file that is due, `concurrency` at a time, sharing one bandwidth cap.
+
+    An upload that fails is left in the queue with its progress and tried again by a later run,
+    after a wait that doubles with every failed run; one that keeps failing is marked failed. Only
+    one process works through the queue at a time; others return right away.
+
+    Parameters:
+        config (dict): The configuration dictionary.
+        logger (logging.Logger, optional): Logger for status messages.
+
+    Returns:
+        dict: Number of uploads per outcome ('done', 'retry', 'failed'); None if another process is running the queue.
+    """
+    settings = config.get('video_upload', {})
+    queue = UploadQueue(settings.get('queue_file', QUEUE_PATH))
+    os.makedirs(os.path.dirname(queue.path), exist_ok=True)
+    with open(queue.path + '.run', 'a') as run_lock:
+        try:
+            fcntl.flock(run_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            log_message(logger, "Upload queue is already being processed by another process.")
+            return None
+
+        client = TusClient(settings['endpoint'], settings.get('token') or None, get_upload_limiter(config))
+        now = time.time()
+        due = [entry for entry in queue.entries() if entry['status'] == 'pending' and entry['next_attempt'] <= now]
+        outcomes = {}
+        outcomes_lock = threading.Lock()
+
+        def run(entry):
+            start_time = time.time()
+            start_offset = entry['offset']
+            try:
+                upload_entry(client, queue, entry, settings.get('chunk_size', CHUNK_SIZE), settings.get('retries', RETRIES),
+                             settings.get('backoff', BACKOFF), sleep)
+                entry.update({"status": 'done', "error": None, "finished": time.time()})
+                outcome = 'done'
+                seconds = time.time() - start_time
+                log_message(logger, f"Uploaded {entry['path']} ({entry['size'] / (1024 * 1024):.1f} MB, "
+                                    f"{(entry['size'] - start_offset) / (1024 * 1024) / max(seconds, 0.001):.2f} MB/s)",
+                            path=entry['path'], size=entry['size'], seconds=round(seconds, 1))
+            except UploadError as e:
+                entry['attempts'] += 1
+                entry['error'] = str(e)
+                permanent = not isinstance(e, TransientError)
+                if permanent or entry['attempts'] >= settings.get('max_attempts', MAX_ATTEMPTS):
+                    entry['status'] = 'failed'
+                    outcome = 'failed'
+                else:
+                    wait = min(settings.get('backoff', BACKOFF) * 2 ** (entry['attempts'] + settings.get('retries', RETRIES)),
+                               settings.get('max_backoff', MAX_BACKOFF))
+                    entry['next_attempt'] = time.time() + wait
+                    outcome = 'retry'
+                log_message(logger, f"Upload of {entry['path']} stopped at {entry['offset']} of {entry['size']} bytes ({outcome}): {e}",
+                            path=entry['path'], offset=entry['offset'], outcome=outcome)
+            queue.update(entry)
+            with outcomes_lock:
+                outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=settings.get('concurrency', CONCURRENCY)) as executor:
+            list(executor.map(run, due))
+        return outcomes
+
+
+def queue_upload(config, path, date=None, logger=None):
+    """
+    Queues a video for upload and works through the queue; a failed upload does not raise, it stays queued.
+
+    Returns:
+        dict: As process_queue; None if the video could not be queued or another process runs the queue.
+    """
+    metadata = {"camera": config['camera_id']} if config.get('camera_id') else {}
+    try:
+        entry = UploadQueue(config.get('video_upload', {}).get('queue_file', QUEUE_PATH)).add(path, date, metadata)
+    except OSError as e:
+        log_message(logger, f"Could not queue {path} for upload: {e}", path=path)
+        return None
+    log_message(logger, f"Queued {path} for upload ({entry['size'] / (1024 * 1024):.1f} MB)", path=path)
+    return process_queue(config, logger)
+
+
+def load_config(config_path=CONFIG_PATH):
+    with open(config_path, 'r') as config_file:
+        return yaml.safe_load(config_file)
+
+
+def print_status(queue):
+    print(f"{'Status':<9}{'Progress':>10}{'Tries':>7}  {'Next try':<20}File")
+    for entry in queue.entries():
+        progress = f"{100 * entry['offset'] / entry['size'] if entry['size'] else 100:.0f}%"
+        next_try = datetime.datetime.fromtimestamp(entry['next_attempt']).strftime('%Y-%m-%d %H:%M:%S') if entry['status'] == 'pending' and entry['next_attempt'] else ''
+        print(f"{entry['status']:<9}{progress:>10}{entry['attempts']:>7}  {next_try:<20}{entry['path']}")
+        if entry['error'] and entry['status'] != 'done':
+            print(f"{'':<28}{entry['error']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Upload queued timelapse videos (resumable, rate limited). Without options, works through the queue.')
+    parser.add_argument('--add', metavar='FILE', help='Queue a file before working through the queue.')
+    parser.add_argument('--date', help='Date of the queued video, YYYY-MM-DD.')
+    parser.add_argument('--retry-failed', action='store_true', help='Put failed uploads back in the queue.')
+    parser.add_argument('--status', action='store_true', help='Only show the queue.')
+    args = parser.parse_args()
+
+    config = load_config()
+    queue = UploadQueue(config.get('video_upload', {}).get('queue_file', QUEUE_PATH))
+    if args.status:
+        print_status(queue)
+        raise SystemExit(0)
+
+    logger = setup_logger('video_upload', os.path.join(config['logging']['log_directory'], 'video_upload.log'), **logging_options(config))
+    if args.retry_failed:
+        queue.retry_failed()
+    if args.add:
+        queue.add(args.add, args.date)
+    outcomes = process_queue(config, logger)
+    print(", ".join(f"{count} {outcome}" for outcome, count in (outcomes or {}).items()) or "Nothing to upload")
+    print_status(queue)
+    raise SystemExit(1 if outcomes and outcomes.get('failed') else 0)
@@ -0,0 +1,82 @@
+import importlib
+import sys
+import types
+
+import pytest
+
+
+class FakeRequest:
+    def __init__(self):
+        self.saved = []
+        self.released = False
+
+    def save(self, stream, path):
+        self.saved.append((stream, path))
+
+    def get_metadata(self):
+        return {"Lux": 120.0, "ExposureTime": 1000}
+
+    def release(self):
+        self.released = True
+
+
+class FakePicamera2:
+    opened = []
+
+    def __init__(self, index=0):
+        self.index = index
+        self.configured = None
+        self.started = False
+        self.closed = False
+        FakePicamera2.opened.append(self)
+
+    def create_still_configuration(self, main=None, lores=None, controls=None):
+        return {"main": main, "lores": lores, "controls": controls}
+
+    def configure(self, config):
+        self.configured = config
+
+    def start(self):
+        self.started = True
+
+    def stop(self):
+        self.started = False
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def module(monkeypatch):
+    picamera2 = types.ModuleType('picamera2')
+    picamera2.Picamera2 = FakePicamera2
+    libcamera = types.ModuleType('libcamera')
+    libcamera.controls = types.SimpleNamespace(AfModeEnum=types.SimpleNamespace(Manual=0))
+    monkeypatch.setitem(sys.modules, 'picamera2', picamera2)
+    monkeypatch.setitem(sys.modules, 'libcamera', libcamera)
+    monkeypatch.delitem(sys.modules, 'scripts.image.capture_light_valuation_image', raising=False)
+    FakePicamera2.opened = []
+    return importlib.import_module('scripts.image.capture_light_valuation_image')
+
+
+def test_captures_with_the_selected_camera(module, monkeypatch, tmp_path):
+    config = {
+        'camera_settings': {'main_size': [640, 480], 'lores_size': [320, 240]},
+        'cameras': [{'index': 0, 'id': 'left'}, {'index': 1, 'id': 'right'}],
+    }
+    request = FakeRequest()
+    written = {}
+    monkeypatch.setattr(module, 'load_config', lambda path: config)
+    monkeypatch.setattr(module, 'live_path', lambda config, path: str(tmp_path / 'light_valuation.jpg'))
+    monkeypatch.setattr(module, 'capture_settled_request', lambda picam2, detector, timeout, label: (request, None))
+    monkeypatch.setattr(module, 'write_json_state', lambda config, path, data: written.setdefault(config['camera_id'], data) and path)
+
+    module.capture_light_valuation_image(1)
+
+    camera, = FakePicamera2.opened
+    assert camera.index == 1
+    assert camera.configured['main'] == {"size": (640, 480)}
+    assert camera.closed
+    assert request.saved == [("main", str(tmp_path / 'light_valuation.jpg'))]
+    assert request.released
+    assert written == {'right': {"Lux": 120.0, "ExposureTime": 1000}}
@@ -0,0 +1,116 @@
+import hashlib
+import shutil
+import threading
+
+import pytest
+from PIL import Image
+
+from scripts.video import ffmpeg as ff_script
+from scripts.video.encode_offload import EncodeCoordinator, RenderJob
+from scripts.video.encode_worker import CoordinatorClient, ProtocolError, run_worker
+
+TOKEN = 'secret'
+CONFIG = {'video_output': {'video_width': 64, 'video_height': 48, 'constant_rate_factor': 28, 'bitrate': '1M', 'video_format': 'mp4', 'framerate': 25}}
+
+
+@pytest.fixture
+def job(tmp_path):
+    frame_paths = []
+    for index in range(10):
+        path = tmp_path / f"frame_{index:02d}.jpg"
+        Image.new('RGB', (64, 48), (index * 20, 100, 200)).save(path)
+        frame_paths.append(str(path))
+    segment_dir = tmp_path / 'segments'
+    segment_dir.mkdir()
+    return RenderJob(frame_paths, ff_script.video_profiles(CONFIG), 25, str(segment_dir), segment_frames=4, lease_seconds=60)
+
+
+@pytest.fixture
+def coordinator(job):
+    coordinator = EncodeCoordinator(job, port=0, token=TOKEN, host='127.0.0.1')
+    coordinator.start()
+    yield coordinator
+    coordinator.stop()
+
+
+def client(coordinator, token=TOKEN, retries=2):
+    slept = []
+    return CoordinatorClient(f"http://127.0.0.1:{coordinator.port}", token, retries=retries, timeout=5, sleep=slept.append), slept
+
+
+def test_repeated_lease_request_returns_the_held_lease(coordinator, job):
+    worker, _ = client(coordinator)
+
+    first = worker.call('POST', '/lease', {"worker": "a"})
+    again = worker.call('POST', '/lease', {"worker": "a"})
+    other = worker.call('POST', '/lease', {"worker": "b"})
+
+    assert again['lease'] == first['lease']
+    assert again['segment'] == first['segment'] == 0
+    assert other['segment'] == 1
+    assert job.segments[0].attempts == 1
+
+
+def test_frames_outside_the_segment_are_refused(coordinator, job, tmp_path):
+    worker, _ = client(coordinator)
+    task = worker.call('POST', '/lease', {"worker": "a"})
+
+    worker.download('/frames/3', tmp_path / 'frame.jpg', task['lease'])
+    with open(job.frame_paths[3], 'rb') as f:
+        assert (tmp_path / 'frame.jpg').read_bytes() == f.read()
+    with pytest.raises(ProtocolError) as refused:
+        worker.download(f"/frames/{task['context_end']}", tmp_path / 'frame.jpg', task['lease'])
+    assert refused.value.status == 409
+
+
+def test_wrong_token_is_refused_without_retrying(coordinator):
+    worker, slept = client(coordinator, token='wrong')
+
+    with pytest.raises(ProtocolError) as refused:
+        worker.call('POST', '/lease', {"worker": "a"})
+    assert refused.value.status == 401
+    assert slept == []
+
+
+def test_corrupt_upload_is_retried_and_not_stored(coordinator, job):
+    worker, slept = client(coordinator)
+    task = worker.call('POST', '/lease', {"worker": "a"})
+    headers = {'Content-Type': 'application/octet-stream', 'X-Content-SHA256': hashlib.sha256(b'other').hexdigest()}
+
+    with pytest.raises(ProtocolError) as refused:
+        worker.request('PUT', '/segments/0', b'segment', headers, task['lease'])
+    assert refused.value.status == 422
+    assert len(slept) == 1
+    assert job.segments[0].outputs == {}
+
+
+def test_segments_complete_once_every_profile_is_uploaded(coordinator, job, tmp_path):
+    worker, _ = client(coordinator)
+    encoded = tmp_path / 'segment.mp4'
+    encoded.write_bytes(b'encoded segment')
+
+    while True:
+        task = worker.call('POST', '/lease', {"worker": "a"})
+        if 'lease' not in task:
+            break
+        worker.upload('/segments/0', encoded, task['lease'])
+        assert job.segments[task['segment']].state == 'done'
+        with pytest.raises(ProtocolError) as refused:
+            worker.call('POST', '/renew', lease=task['lease'])
+        assert refused.value.status == 409
+
+    assert task == {"finished": True}
+    assert job.finished
+    with open(job.segments[-1].outputs[0], 'rb') as f:
+        assert f.read() == b'encoded segment'
+
+
+@pytest.mark.skipif(shutil.which('ffmpeg') is None, reason="needs ffmpeg")
+def test_local_worker_encodes_every_segment(coordinator, job):
+    worker = threading.Thread(target=run_worker, args=(f"http://127.0.0.1:{coordinator.port}", TOKEN, 'local'),
+                              kwargs={"idle_exit": 1, "poll": 0.1}, daemon=True)
+    worker.start()
+    worker.join(120)
+
+    assert job.finished
+    assert {segment.worker for segment in job.segments} == {'local'}
@@ -0,0 +1,40 @@
+import io
+
+import numpy as np
+from PIL import Image
+
+from scripts.preview.mjpeg_server import encode_yuv420
+
+
+def yuv420_buffer(width, height, stride, y, u, v):
+    """
+    Returns an I420 buffer as picamera2 delivers it: height * 3 / 2 rows of `stride` bytes.
+    """
+    array = np.zeros((height * 3 // 2, stride), dtype=np.uint8)
+    array[:height, :width] = y
+    chroma = array.reshape((-1, stride // 2))
+    chroma[2 * height:2 * height + height // 2, :width // 2] = u
+    chroma[2 * height + height // 2:3 * height, :width // 2] = v
+    return array
+
+
+def test_encode_yuv420_decodes_to_the_buffer_colour():
+    # Stride wider than the image, as with the lores stream
+    width, height, stride = 320, 240, 384
+    array = yuv420_buffer(width, height, stride, y=81, u=90, v=240)  # Red in BT.601
+
+    jpeg = encode_yuv420(array, width, height, stride, quality=90)
+
+    with Image.open(io.BytesIO(jpeg)) as image:
+        assert image.size == (width, height)
+        red, green, blue = image.convert('RGB').getpixel((width // 2, height // 2))
+    assert red > 200 and green < 60 and blue < 60
+
+
+def test_encode_yuv420_keeps_u_and_v_apart():
+    width, height, stride = 64, 48, 64
+    blue = yuv420_buffer(width, height, stride, y=41, u=240, v=110)
+
+    with Image.open(io.BytesIO(encode_yuv420(blue, width, height, stride, quality=90))) as image:
+        red, green, blue_value = image.convert('RGB').getpixel((32, 24))
+    assert blue_value > 200 and red < 60
@@ -0,0 +1,83 @@
+import numpy as np
+from PIL import Image
+
+from scripts.image.night_stack import capture_stack, stack_plan
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeRequest:
+    def make_image(self, stream):
+        return Image.new('RGB', (8, 4), (100, 100, 100))
+
+    def release(self):
+        pass
+
+
+class FakeCamera:
+    """
+    Takes `exposure` seconds of the fake clock per request.
+    """
+
+    def __init__(self, clock, exposure):
+        self.clock = clock
+        self.exposure = exposure
+        self.requests = 0
+
+    def capture_request(self):
+        self.requests += 1
+        self.clock.now += self.exposure
+        return FakeRequest()
+
+
+def config(**night_stack):
+    return {'camera_settings': {'interval': 30}, 'night_stack': {'enabled': True, **night_stack}}
+
+
+def test_plan_takes_its_time_limit_from_the_interval():
+    assert stack_plan(config(), False, 2.0, 16000000)['max_seconds'] == 30
+    assert stack_plan(config(max_seconds=12), False, 2.0, 16000000)['max_seconds'] == 12
+
+
+def slow_stack(monkeypatch, clock, seconds):
+    from scripts.image import night_stack
+
+    add = night_stack.FrameStack.add
+
+    def timed_add(self, frame):
+        clock.now += seconds
+        add(self, frame)
+
+    monkeypatch.setattr(night_stack.FrameStack, 'add', timed_add)
+
+
+def test_stack_stops_before_it_would_exceed_max_seconds(monkeypatch):
+    clock = FakeClock()
+    slow_stack(monkeypatch, clock, 1.0)
+    camera = FakeCamera(clock, exposure=2.0)
+    plan = {"frames": 8, "exposure": 2000000, "gain": 16.0, "mode": 'mean', "sigma": 3.0, "max_seconds": 10}
+
+    image, stack = capture_stack(camera, Image.new('RGB', (8, 4), (100, 100, 100)), plan, clock=clock)
+
+    # Every exposure takes 3 seconds with combining it, counted from the start of the first: a fourth would end at 12
+    assert stack.frames == 3
+    assert camera.requests == 2
+    assert clock.now + 2.0 <= plan['max_seconds']
+    assert np.asarray(image).max() == 100
+
+
+def test_stack_takes_every_exposure_within_max_seconds(monkeypatch):
+    clock = FakeClock()
+    slow_stack(monkeypatch, clock, 0.1)
+    camera = FakeCamera(clock, exposure=2.0)
+    plan = {"frames": 4, "exposure": 2000000, "gain": 8.0, "mode": 'sigma_clip', "sigma": 3.0, "max_seconds": 30}
+
+    _, stack = capture_stack(camera, Image.new('RGB', (8, 4), (100, 100, 100)), plan, clock=clock)
+
+    assert stack.frames == 4
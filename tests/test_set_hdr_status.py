@@ -0,0 +1,76 @@
+from scripts.image.set_hdr_status import FakeHdrDevice, HdrController
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+def controller(state=False, cooldown=3600, settle_time=0.0):
+    device = FakeHdrDevice(state)
+    clock = FakeClock()
+    return HdrController(device, cooldown=cooldown, settle_time=settle_time, clock=clock, sleep=clock.sleep), device, clock
+
+
+def test_state_is_read_from_the_device_once():
+    hdr, device, _ = controller(state=True)
+
+    assert hdr.get_state() is True
+    assert hdr.get_state() is True
+    assert device.reads == 1
+
+
+def test_matching_state_is_not_written():
+    hdr, device, _ = controller(state=True)
+
+    assert hdr.set_state(True) is False
+    assert device.writes == []
+
+
+def test_change_updates_the_cached_state_without_reading_again():
+    hdr, device, _ = controller(state=False)
+
+    assert hdr.set_state(True) is True
+    assert device.writes == [True]
+    assert hdr.get_state() is True
+    assert device.reads == 1
+
+
+def test_cooldown_refuses_a_second_change_until_it_has_passed():
+    hdr, device, clock = controller(state=False, cooldown=3600)
+    hdr.set_state(True)
+
+    clock.now += 3599
+    assert hdr.in_cooldown()
+    assert hdr.set_state(False) is False
+    assert device.writes == [True]
+
+    clock.now += 1
+    assert hdr.set_state(False) is True
+    assert device.writes == [True, False]
+
+
+def test_settle_wait_only_covers_the_time_not_yet_passed():
+    hdr, _, clock = controller(state=False, settle_time=2.0)
+    hdr.set_state(True)
+
+    clock.now += 1.5
+    assert hdr.wait_until_settled() == 0.5
+    assert clock.slept == [0.5]
+    assert hdr.wait_until_settled() == 0
+    assert clock.slept == [0.5]
+
+
+def test_no_settle_wait_without_a_change():
+    hdr, _, clock = controller(state=False, settle_time=2.0)
+
+    assert hdr.wait_until_settled() == 0
+    assert clock.slept == []
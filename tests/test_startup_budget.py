@@ -0,0 +1,21 @@
+import os
+
+import pytest
+
+from scripts.benchmark.startup_budget import ENTRY_POINTS, check_entry_points
+
+# The budgets are set for a Raspberry Pi 4; a loaded CI machine gets the same leeway again (override
+# with e.g. STARTUP_BUDGET_FACTOR=1 to hold the entry points to the budgets themselves)
+BUDGET_FACTOR = float(os.environ.get('STARTUP_BUDGET_FACTOR', 4))
+
+
+@pytest.mark.parametrize('name', list(ENTRY_POINTS))
+def test_entry_point_starts_without_side_effects(name):
+    budgets = {name: ENTRY_POINTS[name][1] * BUDGET_FACTOR}
+
+    result, = check_entry_points([name], budgets, repeat=3)
+
+    assert result['problems'] == []
+    assert result['deferred'] == []
+    assert result['locale_changed'] is False
+    assert result['output'] == []
@@ -0,0 +1,112 @@
+import os
+import socket
+import time
+
+import pytest
+
+from scripts.video import uploader
+from scripts.video.upload_server import start_upload_server
+from scripts.video.uploader import TransientError, TusClient, UploadQueue, file_sha256, process_queue, upload_entry
+
+CHUNK = 64 * 1024
+
+
+@pytest.fixture
+def video(tmp_path):
+    path = tmp_path / 'timelapse.mp4'
+    path.write_bytes(os.urandom(10 * CHUNK + 123))
+    return str(path)
+
+
+@pytest.fixture
+def upload_server(tmp_path):
+    httpd = start_upload_server(str(tmp_path / 'received'), token='secret')
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture(autouse=True)
+def no_rate_limit(monkeypatch):
+    monkeypatch.setattr(uploader, '_upload_limiter', None)
+
+
+def endpoint(httpd):
+    return f"http://127.0.0.1:{httpd.server_address[1]}/files/"
+
+
+def closed_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def test_upload_survives_dropped_chunks(upload_server, video, tmp_path):
+    upload_server.fail_every = 2
+    queue = UploadQueue(str(tmp_path / 'queue.json'))
+    entry = queue.add(video, '2024-06-01')
+    slept = []
+
+    upload_entry(TusClient(endpoint(upload_server), 'secret', timeout=5), queue, entry, CHUNK, retries=3, backoff=1, sleep=slept.append)
+
+    received = tmp_path / 'received' / 'timelapse.mp4'
+    assert file_sha256(str(received)) == entry['sha256']
+    assert queue.entries()[0]['offset'] == entry['size']
+    # Every dropped chunk is followed by one that goes through, so the count never runs out
+    assert slept == [1] * 10
+
+
+def test_upload_resumes_from_the_saved_offset(upload_server, video, tmp_path):
+    upload_server.fail_every = 4
+    queue = UploadQueue(str(tmp_path / 'queue.json'))
+    entry = queue.add(video)
+    client = TusClient(endpoint(upload_server), 'secret', timeout=5)
+
+    with pytest.raises(TransientError):
+        upload_entry(client, queue, entry, CHUNK, retries=1, sleep=lambda seconds: None)
+    saved = queue.entries()[0]
+    assert saved['offset'] == 3 * CHUNK
+
+    upload_server.fail_every = 0
+    patches = upload_server.patches
+    upload_entry(client, queue, saved, CHUNK, retries=1, sleep=lambda seconds: None)
+
+    assert upload_server.patches - patches == 8
+    assert file_sha256(str(tmp_path / 'received' / 'timelapse.mp4')) == saved['sha256']
+
+
+def test_refused_upload_is_marked_failed(upload_server, video, tmp_path):
+    config = {'video_upload': {'endpoint': endpoint(upload_server), 'token': 'wrong', 'rate_limit': 0,
+                               'queue_file': str(tmp_path / 'queue.json')}}
+    UploadQueue(config['video_upload']['queue_file']).add(video)
+    slept = []
+
+    assert process_queue(config, sleep=slept.append) == {'failed': 1}
+
+    entry, = UploadQueue(config['video_upload']['queue_file']).entries()
+    assert entry['status'] == 'failed'
+    assert '401' in entry['error']
+    assert slept == []
+
+
+def test_unreachable_server_backs_off_until_a_later_run(video, tmp_path):
+    config = {'video_upload': {'endpoint': f"http://127.0.0.1:{closed_port()}/files/", 'rate_limit': 0, 'retries': 3,
+                               'backoff': 2, 'max_backoff': 3600, 'max_attempts': 2, 'queue_file': str(tmp_path / 'queue.json')}}
+    queue = UploadQueue(config['video_upload']['queue_file'])
+    queue.add(video)
+    slept = []
+
+    before = time.time()
+    assert process_queue(config, sleep=slept.append) == {'retry': 1}
+
+    entry, = queue.entries()
+    assert slept == [2, 4]
+    assert entry['status'] == 'pending'
+    assert entry['attempts'] == 1
+    assert before + 2 * 2 ** 4 <= entry['next_attempt'] <= time.time() + 2 * 2 ** 4
+    # Not due yet
+    assert process_queue(config, sleep=slept.append) == {}
+
+    queue.update({**entry, "next_attempt": 0})
+    assert process_queue(config, sleep=slept.append) == {'failed': 1}
+    assert queue.entries()[0]['status'] == 'failed'